@@ -0,0 +1,93 @@
+from typing import Any, Callable
+
+import numpy as np
+from scipy import optimize
+
+from sokoban.map import Map
+
+__all__ = ["Assignment", "incremental_assignment"]
+
+
+class Assignment:
+    """
+    Minimum cost assignment of rows (boxes) to columns (targets), kept so that
+    it can be updated cheaply when the costs of a single row change.
+    Attributes:
+        - costs: The (rows x columns) cost matrix.
+        - rows: The assigned rows.
+        - cols: The column assigned to each of the rows.
+        - value: The total cost of the assignment.
+    """
+
+    def __init__(self, costs: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> None:
+        self.costs = costs
+        self.rows = rows
+        self.cols = cols
+        self.value = costs[rows, cols].sum()
+
+    @classmethod
+    def solve(cls, costs: np.ndarray) -> "Assignment":
+        """Solve the assignment problem from scratch."""
+        rows, cols = optimize.linear_sum_assignment(costs)
+        return cls(costs, rows, cols)
+
+    def update_row(self, row: int, row_costs: np.ndarray) -> "Assignment":
+        """
+        Get the optimal assignment after the costs of a row changed.
+
+        Every assignment changes its cost by the change of the column it gives
+        to the row, so if the current column of the row got the smallest change,
+        the current assignment is still optimal. Otherwise the assignment is
+        solved again.
+        """
+        costs = self.costs.copy()
+        costs[row] = row_costs
+
+        n_rows, n_cols = costs.shape
+        if n_rows > n_cols:
+            return Assignment.solve(costs)
+
+        delta = row_costs - self.costs[row]
+        if delta[self.cols[row]] == delta.min():
+            return Assignment(costs, self.rows, self.cols)
+
+        return Assignment.solve(costs)
+
+
+def incremental_assignment(
+    state: Map,
+    key: str,
+    cells: list[int],
+    row_costs: Callable[[int], np.ndarray],
+    all_costs: Callable[[], np.ndarray],
+    context: Any = None,
+) -> Assignment:
+    """
+    Get the optimal box to target assignment of a state, reusing the one its
+    parent saved in the heuristic cache under the given key: unchanged when no
+    box moved, updated on a single row when one box moved, and solved from
+    scratch otherwise.
+    Args:
+        state: The state.
+        key: The key of the assignment in the heuristic cache.
+        cells: The cells of the boxes (one row for each).
+        row_costs: Computes the costs of a row.
+        all_costs: Computes the whole cost matrix.
+        context: Extra data saved along with the assignment.
+    """
+    cached = state.heuristic_cache.get(key)
+    if cached is None:
+        assignment = Assignment.solve(all_costs())
+    else:
+        _, cached_cells, assignment = cached
+        changed = [i for i, (a, b) in enumerate(zip(cached_cells, cells)) if a != b]
+
+        if len(changed) == 0:
+            return assignment
+        elif len(changed) == 1:
+            assignment = assignment.update_row(changed[0], row_costs(changed[0]))
+        else:
+            assignment = Assignment.solve(all_costs())
+
+    state.heuristic_cache[key] = (context, cells, assignment)
+    return assignment
@@ -0,0 +1,258 @@
+from heapq import heappop, heappush
+from itertools import count
+from math import inf
+from time import time
+
+from search_methods.pushes import replay_moves
+from search_methods.solver import Solver
+from search_methods.solution import Solution, path_moves
+from search_methods.transposition_table import TranspositionTable
+from sokoban import State
+from sokoban.map import Map
+
+__all__ = ["AStar"]
+
+
+def _compact(state: Map) -> tuple[State, int | None]:
+    """Get the compact state of a map, with the player region its key uses."""
+    return State.from_map(state), state.player_region
+
+
+def _expand_compact(
+    state: State, player_region: int | None, initial_state: Map
+) -> Map:
+    """Get back the map of a compact state."""
+    new_map = state.to_map(initial_state.test_name)
+    new_map.player_region = player_region
+    return new_map
+
+
+class AStar(Solver):
+    """
+    Solver for Sokoban puzzle using the A* algorithm, or IDA* (which only keeps
+    the current path in memory). Both are complete and, with an admissible
+    heuristic, find a solution with the minimum number of steps of the state
+    generator (moves, or pushes for a push-level generator).
+    Attributes:
+        - heuristic: A function for estimating the cost to reach the goal.
+        - state_generator: A function that generates possible next states.
+        - max_iters: Maximum number of states to expand (default: 100000).
+        - iterative_deepening: Use IDA* instead of A* (default: False).
+        - table: The transposition table with the lowest cost each state was
+        reached with, bounding the memory used for detecting duplicates.
+    The frontier (and the IDA* stack) holds compact states, turned back into
+    maps when expanded. It isn't bounded by the table: its memory grows with
+    the search, and is only bounded by the max_memory of the budget.
+    """
+
+    def __init__(
+        self,
+        base: Solver,
+        max_iters: int = 100000,
+        iterative_deepening: bool = False,
+        table_size: int = 1 << 20,
+        replacement: str = "shallower",
+    ) -> None:
+        super().__init__(
+            base.heuristic, base.state_generator, max_iters, base.profile, base.budget
+        )
+        self.iterative_deepening = iterative_deepening
+        self.table = TranspositionTable(table_size, replacement)
+
+    def solve(self, initial_state: Map) -> Solution:
+        """
+        Solve the puzzle.
+        Args:
+            initial_state: The initial state of the puzzle.
+        """
+        self._start_time = time()
+        self._start_profile()
+        self._start_budget()
+        self.table.clear()
+
+        state = initial_state.copy()
+        if self.iterative_deepening:
+            return self._solve_ida(state)
+        return self._solve_astar(state)
+
+    def _solve_astar(self, initial_state: Map) -> Solution:
+        tie_breaker = count()
+        initial_cost = self.heuristic(initial_state)
+
+        # (f, -g, tie breaker, key, compact state, player region, path),
+        # deeper states first on equal f
+        frontier = [
+            (initial_cost, 0, next(tie_breaker), initial_state.key)
+            + _compact(initial_state)
+            + (None,)
+        ]
+        self.table.put(initial_state.key, 0)
+        best = (initial_cost, None, 0)
+        expanded_states = 0
+
+        while len(frontier) > 0 and expanded_states < self.max_iters:
+            if self._out_of_budget(expanded_states):
+                break
+
+            _, cost, _, key, compact_state, player_region, path = heappop(frontier)
+            cost = -cost
+
+            # A cheaper path to the state was found after this one was added
+            stored_cost = self.table.get(key)
+            if stored_cost is not None and stored_cost < cost:
+                continue
+
+            if compact_state.is_solved():
+                return self._make_solution(
+                    initial_state, path, expanded_states, cost, True
+                )
+
+            state = _expand_compact(compact_state, player_region, initial_state)
+
+            expanded_states += 1
+            for child in self.state_generator(state):
+                child_cost = cost + 1
+
+                stored_cost = self.table.get(child.key)
+                if stored_cost is not None and stored_cost <= child_cost:
+                    continue
+                self.table.put(child.key, child_cost)
+
+                estimation = self.heuristic(child)
+                child_path = (path, child.last_moves)
+                if estimation < best[0]:
+                    best = (estimation, child_path, child_cost)
+
+                heappush(
+                    frontier,
+                    (child_cost + estimation, -child_cost, next(tie_breaker), child.key)
+                    + _compact(child)
+                    + (child_path,),
+                )
+
+        # No solution found in the given iterations, return the closest state
+        _, path, cost = best
+        return self._make_solution(initial_state, path, expanded_states, cost, False)
+
+    def _solve_ida(self, initial_state: Map) -> Solution:
+        bound = self.heuristic(initial_state)
+        best = (bound, None, 0)
+        expanded_states = 0
+
+        while expanded_states < self.max_iters:
+            # Entries are only valid for the bound they were found with
+            self.table.clear_entries()
+            self.table.put(initial_state.key, 0)
+
+            next_bound = inf
+            # [(compact state, player region, g, path)]
+            stack = [_compact(initial_state) + (0, None)]
+
+            while len(stack) > 0:
+                compact_state, player_region, cost, path = stack.pop()
+                state = _expand_compact(compact_state, player_region, initial_state)
+
+                estimation = self.heuristic(state)
+                if cost + estimation > bound:
+                    next_bound = min(next_bound, cost + estimation)
+                    continue
+
+                if state.is_solved():
+                    return self._make_solution(
+                        initial_state, path, expanded_states, cost, True
+                    )
+
+                if estimation < best[0]:
+                    best = (estimation, path, cost)
+
+                if expanded_states >= self.max_iters or self._out_of_budget(
+                    expanded_states
+                ):
+                    break
+                expanded_states += 1
+
+                # Reversed, so the first child is expanded first
+                for child in reversed(self.state_generator(state)):
+                    child_cost = cost + 1
+
+                    stored_cost = self.table.get(child.key)
+                    if stored_cost is not None and stored_cost <= child_cost:
+                        continue
+                    self.table.put(child.key, child_cost)
+
+                    stack.append(
+                        _compact(child) + (child_cost, (path, child.last_moves))
+                    )
+
+            # The whole search space was explored
+            if next_bound == inf or self.budget is not None and self.budget.exhausted:
+                break
+
+            bound = next_bound
+
+        # No solution found in the given iterations (or budget), return the
+        # closest state
+        _, path, cost = best
+        return self._make_solution(initial_state, path, expanded_states, cost, False)
+
+    def _make_solution(
+        self,
+        initial_state: Map,
+        path: tuple | None,
+        expanded_states: int,
+        cost: int,
+        optimal: bool,
+    ) -> Solution:
+        duration = time() - self._start_time
+
+        steps_moves = path_moves(path)
+
+        # Replay the moves to count the pulls made
+        state = initial_state
+        for last_moves in steps_moves:
+            state = replay_moves(state, last_moves)[-1]
+
+        if self.profiler is not None:
+            self.profiler.count_cache(
+                "transposition_table", self.table.hits, self.table.misses
+            )
+
+        return self._finish_solution(
+            self.AStarSolution(
+                initial_state,
+                steps_moves,
+                expanded_states,
+                duration,
+                state.undo_moves,
+                cost,
+                optimal,
+            )
+        )
+
+    class AStarSolution(Solution):
+        """
+        Stats about a solution found by A* / IDA*.
+        Additional attributes:
+            - cost: The number of steps of the solution.
+            - optimal: If the solution was found by exhausting all the cheaper
+            ones (it is the shortest one when the heuristic is admissible).
+        """
+
+        def __init__(
+            self,
+            initial_state: Map,
+            steps_moves: list[tuple[int, ...]],
+            explored_states: int,
+            time: float,
+            undo_moves: int,
+            cost: int,
+            optimal: bool,
+        ):
+            super().__init__(
+                initial_state, steps_moves, explored_states, time, undo_moves
+            )
+            self.cost = cost
+            self.optimal = optimal
+
+        def __str__(self) -> str:
+            return super().__str__() + f", cost: {self.cost}, optimal: {self.optimal}"
@@ -0,0 +1,296 @@
+"""
+Run grids of (level, solver configuration, seed) jobs on a process pool.
+
+Usage: python -m search_methods.batch tests/*.yaml --seeds 3 --timeout 60
+"""
+
+import argparse
+import os
+import random
+import signal
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from time import time
+from typing import Any, Callable, Iterable, Iterator
+
+import numpy as np
+
+import search_methods.heuristics as heuristics
+from search_methods.beam_search import BeamSearch
+from search_methods.budget import Budget
+from search_methods.lrtastar import LRTAstar
+from search_methods.memoization import memoized
+from search_methods.solution import Solution
+from search_methods.solver import Solver
+from search_methods.utils import get_neighbours_no_pulls
+from sokoban.map import Map
+
+__all__ = [
+    "SolverConfig",
+    "BatchJob",
+    "BatchResult",
+    "NOTEBOOK_CONFIGS",
+    "NOTEBOOK_HEURISTIC_CONFIGS",
+    "memoized_configs",
+    "make_jobs",
+    "run_job",
+    "run_batch",
+]
+
+
+class SolverConfig:
+    """
+    Picklable description of a solver, built again in the worker processes.
+    Attributes:
+        - name: The name of the configuration.
+        - solver_class: The Solver subclass (e.g. BeamSearch).
+        - heuristic: A function for estimating the cost to reach the goal.
+        - state_generator: A function that generates possible next states.
+        - budget: The budget of the solver (None for only its iterations).
+        - options: Keyword arguments of the solver class.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        solver_class: type,
+        heuristic: Callable[[Map], int],
+        state_generator: Callable[[Map], list[Map]],
+        budget: Budget | None = None,
+        **options: Any,
+    ) -> None:
+        self.name = name
+        self.solver_class = solver_class
+        self.heuristic = heuristic
+        self.state_generator = state_generator
+        self.budget = budget
+        self.options = options
+
+    def build(self) -> Solver:
+        """Create the solver."""
+        base = Solver(self.heuristic, self.state_generator, budget=self.budget)
+        return self.solver_class(base, **self.options)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class BatchJob:
+    """
+    A solver configuration to run on a level.
+    Attributes:
+        - level_path: The path of the level file.
+        - config: The solver configuration.
+        - seed: The seed of the random generators for this job.
+        - timeout: Maximum number of seconds for the solve (None for no limit).
+    """
+
+    def __init__(
+        self,
+        level_path: str,
+        config: SolverConfig,
+        seed: int,
+        timeout: float | None = None,
+    ) -> None:
+        self.level_path = level_path
+        self.config = config
+        self.seed = seed
+        self.timeout = timeout
+
+    @property
+    def level_name(self) -> str:
+        return os.path.splitext(os.path.basename(self.level_path))[0]
+
+    def __str__(self) -> str:
+        return f"{self.level_name} / {self.config} / seed {self.seed}"
+
+
+class BatchResult:
+    """
+    The outcome of a job.
+    Attributes:
+        - job: The job.
+        - status: "solved", "unsolved", "timeout" or "error".
+        - solution: The solution returned by the solver (None on timeout or
+        error).
+        - time: The wall time of the job, in seconds.
+        - error: The error message, if the job failed.
+    """
+
+    def __init__(
+        self,
+        job: BatchJob,
+        status: str,
+        solution: Solution | None,
+        time: float,
+        error: str | None = None,
+    ) -> None:
+        self.job = job
+        self.status = status
+        self.solution = solution
+        self.time = time
+        self.error = error
+
+    def __str__(self) -> str:
+        details = self.solution if self.solution is not None else self.error
+        return f"{self.job}: {self.status} in {self.time:.2f}s" + (
+            f" ({details})" if details else ""
+        )
+
+
+def notebook_configs(
+    heuristic: Callable[[Map], int], suffix: str = ""
+) -> list[SolverConfig]:
+    """The Beam Search and LRTA* configurations run in main.ipynb."""
+    return [
+        SolverConfig(
+            "Beam Search" + suffix,
+            BeamSearch,
+            heuristic,
+            get_neighbours_no_pulls,
+            max_iters=200,
+            k=80,
+        ),
+        SolverConfig(
+            "LRTA*" + suffix,
+            LRTAstar,
+            heuristic,
+            get_neighbours_no_pulls,
+            max_iters=20000,
+            backoff_step_increment=10,
+            backoff_probability_factor=0.98,
+            cost_plateau_treshold=20,
+        ),
+    ]
+
+
+NOTEBOOK_CONFIGS = notebook_configs(heuristics.boxes_minimum_moves_combination)
+
+# The heuristic comparison of main.ipynb
+NOTEBOOK_HEURISTIC_CONFIGS = [
+    config
+    for heuristic in [
+        heuristics.manhattan_min_distances,
+        heuristics.boxes_minimum_moves_combination,
+        heuristics.player_and_boxes_minimum_moves_combination,
+    ]
+    for config in notebook_configs(heuristic, f" ({heuristic.__name__})")
+]
+
+
+def memoized_configs(configs: Iterable[SolverConfig]) -> list[SolverConfig]:
+    """
+    The configurations with their heuristics memoized: the jobs run in the
+    same process reuse the values computed for the same level.
+    """
+    return [
+        SolverConfig(
+            config.name,
+            config.solver_class,
+            memoized(config.heuristic),
+            config.state_generator,
+            config.budget,
+            **config.options,
+        )
+        for config in configs
+    ]
+
+
+def job_seed(base_seed: int, level_path: str, config: SolverConfig, run: int) -> int:
+    """
+    Derive the seed of a job from its description, so it doesn't depend on
+    the order or the process the jobs are run in.
+    """
+    description = f"{base_seed}:{os.path.basename(level_path)}:{config.name}:{run}"
+    return zlib.crc32(description.encode())
+
+
+def make_jobs(
+    level_paths: Iterable[str],
+    configs: Iterable[SolverConfig],
+    seeds: int = 1,
+    base_seed: int = 42,
+    timeout: float | None = None,
+) -> list[BatchJob]:
+    """Create a job for each level, configuration and run."""
+    return [
+        BatchJob(path, config, job_seed(base_seed, path, config, run), timeout)
+        for path, config, run in product(level_paths, configs, range(seeds))
+    ]
+
+
+class JobTimeout(Exception):
+    """Raised in a worker when its job runs out of time."""
+
+
+def _raise_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def run_job(job: BatchJob) -> BatchResult:
+    """Run a job in the current process."""
+    start_time = time()
+    random.seed(job.seed)
+    np.random.seed(job.seed % (1 << 32))
+
+    # The timeout interrupts the solver, where the platform allows it
+    use_alarm = job.timeout is not None and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, job.timeout)
+
+    try:
+        state = Map.from_yaml(job.level_path)
+        with job.config.build() as solver:
+            solution = solver.solve(state)
+        status = "solved" if solution.is_solved() else "unsolved"
+        return BatchResult(job, status, solution, time() - start_time)
+    except JobTimeout:
+        return BatchResult(job, "timeout", None, time() - start_time)
+    except Exception as e:
+        return BatchResult(job, "error", None, time() - start_time, repr(e))
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+
+def run_batch(
+    jobs: Iterable[BatchJob], max_workers: int | None = None
+) -> Iterator[BatchResult]:
+    """
+    Run the jobs on a process pool (one worker per core by default), yielding
+    the results as they finish.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("levels", nargs="+", help="level files")
+    parser.add_argument("--seeds", type=int, default=1, help="runs of each job")
+    parser.add_argument("--base-seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per job")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--heuristics", action="store_true", help="run the heuristic comparison"
+    )
+    parser.add_argument(
+        "--memoize", action="store_true", help="share the heuristic values between jobs"
+    )
+    args = parser.parse_args()
+
+    configs = NOTEBOOK_HEURISTIC_CONFIGS if args.heuristics else NOTEBOOK_CONFIGS
+    if args.memoize:
+        configs = memoized_configs(configs)
+    jobs = make_jobs(args.levels, configs, args.seeds, args.base_seed, args.timeout)
+    for result in run_batch(jobs, args.workers):
+        print(result, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,24 @@
+from concurrent.futures import ProcessPoolExecutor
+from math import inf
 from time import time
+from typing import Callable, Iterable
 
 import numpy as np
+from search_methods.profiling import unwrap
 from search_methods.solver import Solver
-from search_methods.solution import Solution
+from search_methods.solution import Solution, path_moves
+from search_methods.transposition_table import REPLACE_ALWAYS, TranspositionTable
 from sokoban.map import Map
 
 __all__ = ["BeamSearch"]
 
+# How the beam is chosen among the candidates
+SELECTION_SOFTMAX = "softmax"
+SELECTION_TOP_K = "top_k"
+
+# How candidates with equal costs are ordered by the top-k selection
+TIE_BREAKING = ("first", "random", "key")
+
 
 class BeamSearch(Solver):
     """
@@ -17,57 +29,335 @@ class BeamSearch(Solver):
         - max_iters: Maximum number of iterations to run the algorithm
         (default: 100).
         - k: The number of states to keep in the beam (default: 20).
+        - selection: "softmax" samples the beam with probabilities decreasing
+        exponentially with the costs, "top_k" keeps the k candidates with the
+        lowest costs (default: "softmax").
+        - tie_breaking: Which of the candidates with equal costs "top_k" keeps
+        first: the "first" ones generated, "random" ones, or the ones with the
+        lowest state "key" (default: "first").
+        - closed_set_size: Number of slots of the set of the keys of the states
+        already expanded, whose children are dropped before being scored when
+        they come up again (the search stops if they all do). Colliding keys
+        replace each other, bounding the memory used (default: 0 - no closed
+        set).
+        - workers: Number of worker processes the beam is expanded on (default:
+        0 - expanded in this process). They are started by the first solve and
+        kept for the next ones, until close() (or the end of a with block).
+        The results are the same as the serial ones for the same seed (the
+        states are rebuilt with their box names, level name and heuristic
+        cache), but counters kept by the state generator are updated in the
+        workers, and the calls made there are profiled only as part of the
+        expand phase.
     """
 
-    def __init__(self, base: Solver, max_iters: int = 100, k: int = 20) -> None:
-        super().__init__(base.heuristic, base.state_generator, max_iters)
+    def __init__(
+        self,
+        base: Solver,
+        max_iters: int = 100,
+        k: int = 20,
+        workers: int = 0,
+        selection: str = SELECTION_SOFTMAX,
+        tie_breaking: str = "first",
+        closed_set_size: int = 0,
+    ) -> None:
+        super().__init__(
+            base.heuristic, base.state_generator, max_iters, base.profile, base.budget
+        )
+        if selection not in (SELECTION_SOFTMAX, SELECTION_TOP_K):
+            raise ValueError(f"Unknown selection: {selection}")
+        if tie_breaking not in TIE_BREAKING:
+            raise ValueError(f"Unknown tie breaking: {tie_breaking}")
+
         self.k = k
+        self.workers = workers
+        self.selection = selection
+        self.tie_breaking = tie_breaking
+        self.closed_set = None
+        if closed_set_size > 0:
+            self.closed_set = TranspositionTable(closed_set_size, REPLACE_ALWAYS)
+        self._pool = None
 
     def solve(self, initial_state: Map) -> Solution:
         """
-        Solve the Puzzle.
+        Solve the Puzzle. With an anytime budget, the search is run again after
+        a solution is found, for shorter ones (sampling other beams), until
+        the budget runs out.
         Args:
             initial_state: The initial state of the puzzle.
+        Returns:
+            The shortest solution found, or the path to the state with the
+            lowest cost reached if none was.
         """
-        state = initial_state.copy()
-        beam = [([], state)]  # [(steps made, state)]
-
         self._start_time = time()
-        explored_states = 0
+        self._start_profile()
+        self._start_budget()
+        self._explored_states = 0
+        # The state with the lowest cost reached: (cost, path, state)
+        self._closest = (inf, None, initial_state)
+
+        found = self._search(initial_state, self.max_iters)
+        while found is not None and found[0] > 0 and self._anytime(self._explored_states):
+            # Only solutions with fewer steps are looked for
+            shorter = self._search(initial_state, found[0])
+            if shorter is not None:
+                found = shorter
 
-        for _ in range(self.max_iters):
-            beam_children = {}
+        _, path, state = found if found is not None else self._closest
+        return self._make_solution(
+            initial_state, path, self._explored_states, state.undo_moves
+        )
 
-            for idx, child in enumerate(beam):
-                steps, state = child
-                steps.append(str(state))
+    def _search(self, initial_state: Map, max_steps: int) -> tuple | None:
+        """
+        Run the beam search for solutions of less than max_steps steps.
+        Returns:
+            The (steps, path, state) of the solution found, None if none was.
+        """
+        state = initial_state.copy()
+        # [(path, state)], the paths are linked (parent path, last moves)
+        beam = [(None, state)]
 
+        closed_set = self.closed_set
+        if closed_set is not None:
+            closed_set.clear()
+
+        for iteration in range(max_steps):
+            for idx, (path, state) in enumerate(beam):
                 # Solution found
                 if state.is_solved():
-                    explored_states += idx
-                    return self._make_solution(
-                        steps, explored_states, state.undo_moves
+                    self._explored_states += idx
+                    return (iteration, path, state)
+
+            if self._out_of_budget(self._explored_states):
+                break
+
+            with self._phase("expand"):
+                expanded = self._expand(beam)
+
+            if closed_set is not None:
+                for _, state in beam:
+                    closed_set.put(state.key, iteration)
+
+                # Drop the children expanded in earlier iterations
+                generated = sum(map(len, expanded))
+                expanded = [
+                    [child for child in children if closed_set.get(child[0]) is None]
+                    for children in expanded
+                ]
+                if self.profiler is not None:
+                    seen = generated - sum(map(len, expanded))
+                    self.profiler.count_cache("closed_set", seen, generated - seen)
+
+            with self._phase("dedup"):
+                # {key: (parent path, child, cost)}, the cost is None until computed
+                beam_children = {}
+                for (path, _), children in zip(beam, expanded):
+                    for key, child, cost in children:
+                        beam_children[key] = (path, child, cost)
+
+                candidates = list(beam_children.values())
+
+            if self.profiler is not None:
+                duplicates = sum(map(len, expanded)) - len(candidates)
+                self.profiler.count_cache(
+                    "duplicate_children", duplicates, len(candidates)
+                )
+
+            if len(candidates) == 0:
+                # Every state of the beam is a dead end
+                break
+
+            with self._phase("selection"):
+                costs = np.fromiter(
+                    (self.heuristic(c) if cost is None else cost for _, c, cost in candidates),
+                    int,
+                )
+
+                closest = int(costs.argmin())
+                if costs[closest] < self._closest[0]:
+                    parent_path, child, _ = candidates[closest]
+                    child = _decode(child)
+                    self._closest = (
+                        costs[closest],
+                        (parent_path, child.last_moves),
+                        child,
+                    )
+
+                if self.selection == SELECTION_TOP_K:
+                    xs = self._top_k(costs, beam_children.keys())
+                else:
+                    costs = np.exp(costs.max() - costs)
+                    costs /= costs.sum()
+
+                    xs = np.random.choice(
+                        range(len(costs)), min(self.k, len(costs)), replace=False, p=costs
                     )
 
-                children = self.state_generator(state)
-                for child in children:
-                    beam_children[str(child)] = (steps.copy(), child)
+            self._explored_states += len(beam)
+            beam = []
+            for i in xs:
+                parent_path, child, _ = candidates[i]
+                child = _decode(child)
+                beam.append(((parent_path, child.last_moves), child))
+
+        # No solution found in the given iterations
+        return None
+
+    def _top_k(self, costs: np.ndarray, keys: Iterable[int]) -> np.ndarray:
+        """
+        Get the indices of the k candidates with the lowest costs, the best
+        first, ties broken by tie_breaking.
+        """
+        count = len(costs)
+        if self.tie_breaking == "random":
+            ranks = np.random.permutation(count)
+        elif self.tie_breaking == "key":
+            keys = np.fromiter(keys, np.uint64, count)
+            ranks = np.empty(count, dtype=np.int64)
+            ranks[np.argsort(keys)] = np.arange(count)
+        else:
+            ranks = np.arange(count)
+
+        # Unique orders of the candidates, so the selection is deterministic
+        orders = costs.astype(np.int64) * count + ranks
+        if count > self.k:
+            selected = np.argpartition(orders, self.k - 1)[: self.k]
+        else:
+            selected = np.arange(count)
+        return selected[np.argsort(orders[selected])]
 
-            candidates = list(beam_children.values())
-            costs = np.fromiter(map(lambda x: self.heuristic(x[1]), candidates), int)
-            costs = np.exp(costs.max() - costs)
-            costs /= costs.sum()
+    def _expand(self, beam: list[tuple[tuple | None, Map]]) -> list[list[tuple]]:
+        """
+        Generate the children of each state of the beam, as (key, child, cost)
+        tuples. Serially, the children are maps and their cost is computed
+        later, only for the ones left after deduplication. In parallel, they
+        come back encoded and already scored by the workers.
+        """
+        if self.workers <= 0:
+            return [
+                [(child.key, child, None) for child in self.state_generator(state)]
+                for _, state in beam
+            ]
 
-            xs = np.random.choice(
-                range(len(costs)), min(self.k, len(costs)), replace=False, p=costs
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.workers,
+                initializer=_init_worker,
+                initargs=(unwrap(self.heuristic), unwrap(self.state_generator)),
             )
 
-            explored_states += len(beam)
-            beam = [candidates[i] for i in xs]
+        encoded = [_encode(state) for _, state in beam]
+        shard_size = -(-len(encoded) // self.workers)
+        shards = [
+            encoded[i : i + shard_size] for i in range(0, len(encoded), shard_size)
+        ]
 
-        # No solution found in the given iterations
-        return self._make_solution(steps, explored_states, state.undo_moves)
+        return [
+            children
+            for shard in self._pool.map(_expand_shard, shards)
+            for children in shard
+        ]
+
+    def close(self) -> None:
+        """Stop the worker processes, if any were started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
-    def _make_solution(self, steps: list[str], explored_states: int, pull_moves: int):
+    def __getstate__(self) -> dict:
+        # The worker pool stays with the process that started it
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
+
+    def _make_solution(
+        self,
+        initial_state: Map,
+        path: tuple | None,
+        explored_states: int,
+        pull_moves: int,
+    ) -> Solution:
         duration = time() - self._start_time
-        return Solution(steps, explored_states, duration, pull_moves)
+        return self._finish_solution(
+            Solution(
+                initial_state, path_moves(path), explored_states, duration, pull_moves
+            )
+        )
+
+
+def _encode(state: Map) -> tuple:
+    """
+    Compact encoding of a map, to be sent to or from a worker. The box names
+    (in the order of the boxes) and the heuristic cache are kept, so the
+    heuristics are updated incrementally in the workers too.
+    """
+    level = state.level
+    return (
+        level,
+        state.player_cell,
+        tuple((name, level.index(box.x, box.y)) for name, box in state.boxes.items()),
+        state.test_name,
+        state.undo_moves,
+        state.explored_states,
+        state.player_region,
+        state.last_moves,
+        state.heuristic_cache,
+    )
+
+
+def _decode(encoded: tuple | Map) -> Map:
+    """Rebuild a map from its compact encoding (maps are returned as they are)."""
+    if isinstance(encoded, Map):
+        return encoded
+
+    (
+        level,
+        player,
+        boxes,
+        test_name,
+        undo_moves,
+        explored_states,
+        player_region,
+        last_moves,
+        heuristic_cache,
+    ) = encoded
+    player_x, player_y = level.position(player)
+    state = Map(
+        level.length,
+        level.width,
+        player_x,
+        player_y,
+        [(name, *level.position(cell)) for name, cell in boxes],
+        level.targets,
+        level.obstacles,
+        test_name,
+    )
+    state.undo_moves = undo_moves
+    state.explored_states = explored_states
+    state.player_region = player_region
+    state.last_moves = last_moves
+    state.heuristic_cache = heuristic_cache
+    return state
+
+
+_worker_heuristic = None
+_worker_state_generator = None
+
+
+def _init_worker(
+    heuristic: Callable[[Map], int], state_generator: Callable[[Map], list[Map]]
+) -> None:
+    global _worker_heuristic, _worker_state_generator
+    _worker_heuristic = heuristic
+    _worker_state_generator = state_generator
+
+
+def _expand_shard(shard: list[tuple]) -> list[list[tuple]]:
+    """Generate and score the children of the encoded states of a shard."""
+    return [
+        [
+            (child.key, _encode(child), _worker_heuristic(child))
+            for child in _worker_state_generator(_decode(encoded))
+        ]
+        for encoded in shard
+    ]
@@ -0,0 +1,385 @@
+"""
+Micro and macro benchmarks of the maps, heuristics and solvers, with JSON
+baselines to catch performance regressions.
+
+Usage: python -m search_methods.benchmark tests/*.yaml --output baseline.json
+       python -m search_methods.benchmark tests/*.yaml --compare baseline.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+from random import Random
+from statistics import median
+from time import perf_counter
+from typing import Any, Callable, Iterable
+
+import search_methods.heuristics as heuristics
+from search_methods.batch import (
+    NOTEBOOK_CONFIGS,
+    BatchJob,
+    SolverConfig,
+    job_seed,
+    run_job,
+)
+from search_methods.utils import (
+    box_cells,
+    compute_distance_fields,
+    compute_distance_matrix,
+    compute_distance_reachable_pushes,
+    compute_level_distance_fields,
+    compute_level_distances,
+    compute_reachable_positions,
+    compute_reachable_push_fields,
+    get_neighbours_no_pulls,
+)
+from sokoban.map import BOX_SYMBOL, OBSTACLE_SYMBOL, Map
+
+__all__ = [
+    "BenchmarkResult",
+    "MicroBenchmark",
+    "MICRO_BENCHMARKS",
+    "sample_states",
+    "run_micro_benchmarks",
+    "run_macro_benchmarks",
+    "save_baseline",
+    "load_baseline",
+    "find_regressions",
+]
+
+# The metrics compared against a baseline, and whether higher values are better
+COMPARED_METRICS = {
+    "ops_per_sec": True,
+    "states_per_sec": True,
+    "wall_time": False,
+    "peak_memory": False,
+}
+
+
+class BenchmarkResult:
+    """
+    The measurements of a benchmark.
+    Attributes:
+        - name: The name of the benchmark (e.g. "micro/Map.copy").
+        - metrics: The measured values, by metric name (ops_per_sec and
+        time_per_op for the micro benchmarks, wall_time and states_per_sec for
+        the solvers, peak_memory in bytes, ...).
+    """
+
+    def __init__(self, name: str, metrics: dict[str, Any]) -> None:
+        self.name = name
+        self.metrics = metrics
+
+    def __str__(self) -> str:
+        details = []
+        for metric, value in self.metrics.items():
+            if metric == "peak_memory":
+                details.append(f"peak memory: {value / 1024:.1f}KiB")
+            elif isinstance(value, float):
+                details.append(f"{metric.replace('_', ' ')}: {value:.4g}")
+            else:
+                details.append(f"{metric.replace('_', ' ')}: {value}")
+        return f"{self.name}: " + ", ".join(details)
+
+
+class MicroBenchmark:
+    """
+    An operation timed on sample states.
+    Attributes:
+        - name: The name of the benchmark.
+        - setup: Builds the arguments of the operation calls from the sample
+        states (not timed, called again before each round).
+        - operation: The timed function.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        setup: Callable[[list[Map]], list[tuple]],
+        operation: Callable[..., Any],
+    ) -> None:
+        self.name = name
+        self.setup = setup
+        self.operation = operation
+
+    def run(self, states: list[Map], min_time: float = 0.2) -> BenchmarkResult:
+        """Time the operation for at least min_time seconds."""
+        operation = self.operation
+        calls = 0
+        elapsed = 0.0
+        while elapsed < min_time:
+            arguments = self.setup(states)
+            if not arguments:
+                break
+
+            start_time = perf_counter()
+            for args in arguments:
+                operation(*args)
+            elapsed += perf_counter() - start_time
+            calls += len(arguments)
+
+        # A single round, with the allocations traced
+        arguments = self.setup(states)
+        peak_memory = _peak_memory(lambda: [operation(*args) for args in arguments])
+
+        return BenchmarkResult(
+            f"micro/{self.name}",
+            {
+                "ops_per_sec": calls / elapsed if elapsed else 0.0,
+                "time_per_op": elapsed / calls if calls else 0.0,
+                "peak_memory": peak_memory,
+            },
+        )
+
+
+def _peak_memory(function: Callable[[], Any]) -> int:
+    """Get the peak size of the memory allocated while running a function."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _each_state(states: list[Map]) -> list[tuple]:
+    return [(state,) for state in states]
+
+
+def _children(states: list[Map]) -> list[tuple]:
+    # Fresh states, that only inherit the caches of their parents (as the
+    # heuristics are called during a search)
+    return [(child,) for state in states for child in state.get_neighbours()]
+
+
+def _with_targets(states: list[Map]) -> list[tuple]:
+    return [(state, list(state.level.target_cells)) for state in states]
+
+
+def _level_with_targets(states: list[Map]) -> list[tuple]:
+    return [(state.level, list(state.level.target_cells)) for state in states]
+
+
+def _with_reach(states: list[Map]) -> list[tuple]:
+    return [(state, compute_reachable_positions(state)) for state in states]
+
+
+def _first_box_reach(state: Map, reach: bytearray) -> list[int]:
+    return compute_distance_reachable_pushes(state, box_cells(state)[0], reach)
+
+
+def _heuristic_benchmark(heuristic: Callable[[Map], int]) -> MicroBenchmark:
+    def setup(states: list[Map]) -> list[tuple]:
+        for state in states:
+            heuristic(state)
+        return _children(states)
+
+    return MicroBenchmark(f"heuristics.{heuristic.__name__}", setup, heuristic)
+
+
+BLOCKING_VALUES = [OBSTACLE_SYMBOL, BOX_SYMBOL]
+
+MICRO_BENCHMARKS = [
+    MicroBenchmark("Map.copy", _each_state, Map.copy),
+    MicroBenchmark("Map.get_neighbours", _each_state, Map.get_neighbours),
+    MicroBenchmark("Map.__str__", _each_state, Map.__str__),
+    *[_heuristic_benchmark(getattr(heuristics, name)) for name in heuristics.__all__],
+    MicroBenchmark(
+        "utils.compute_distance_matrix",
+        _with_targets,
+        lambda state, targets: compute_distance_matrix(state, targets, BLOCKING_VALUES),
+    ),
+    MicroBenchmark(
+        "utils.compute_distance_fields",
+        _with_targets,
+        lambda state, targets: compute_distance_fields(state, targets, BLOCKING_VALUES),
+    ),
+    MicroBenchmark(
+        "utils.compute_level_distances",
+        _level_with_targets,
+        compute_level_distances,
+    ),
+    MicroBenchmark(
+        "utils.compute_level_distance_fields",
+        _level_with_targets,
+        compute_level_distance_fields,
+    ),
+    MicroBenchmark(
+        "utils.compute_reachable_positions",
+        _each_state,
+        compute_reachable_positions,
+    ),
+    MicroBenchmark(
+        "utils.compute_distance_reachable_pushes", _with_reach, _first_box_reach
+    ),
+    MicroBenchmark(
+        "utils.compute_reachable_push_fields",
+        _with_reach,
+        lambda state, reach: compute_reachable_push_fields(
+            state, box_cells(state), reach
+        ),
+    ),
+]
+
+
+def sample_states(
+    initial_state: Map, count: int = 10, max_walk: int = 20, seed: int = 0
+) -> list[Map]:
+    """
+    Get states of a level by random walks (without pulls) from its initial
+    state, the same ones for the same seed.
+    """
+    rng = Random(seed)
+    states = []
+    for _ in range(count):
+        state = initial_state
+        for _ in range(rng.randint(0, max_walk)):
+            neighbours = get_neighbours_no_pulls(state)
+            if not neighbours:
+                break
+            state = rng.choice(neighbours)
+        states.append(state)
+
+    return states
+
+
+def run_micro_benchmarks(
+    level_paths: Iterable[str],
+    benchmarks: Iterable[MicroBenchmark] = MICRO_BENCHMARKS,
+    min_time: float = 0.2,
+    seed: int = 0,
+) -> list[BenchmarkResult]:
+    """Run the micro benchmarks on sample states of all the levels."""
+    states = [
+        state
+        for path in level_paths
+        for state in sample_states(Map.from_yaml(path), seed=seed)
+    ]
+    return [benchmark.run(states, min_time) for benchmark in benchmarks]
+
+
+def run_macro_benchmarks(
+    level_paths: Iterable[str],
+    configs: Iterable[SolverConfig] = NOTEBOOK_CONFIGS,
+    repeat: int = 3,
+    timeout: float | None = None,
+    base_seed: int = 42,
+) -> list[BenchmarkResult]:
+    """
+    Solve each level with each solver configuration, with the same seed every
+    time. The wall time is the median of the runs, and the peak memory is
+    measured in an extra run (tracing the allocations slows it down).
+    """
+    results = []
+    for path in level_paths:
+        for config in configs:
+            job = BatchJob(path, config, job_seed(base_seed, path, config, 0), timeout)
+            runs = [run_job(job) for _ in range(repeat)]
+            result = runs[-1]
+
+            metrics = {"status": result.status, "wall_time": median(r.time for r in runs)}
+            if result.solution is not None:
+                solution = result.solution
+                metrics["steps"] = solution.length
+                metrics["explored_states"] = solution.expanded_states
+                metrics["states_per_sec"] = (
+                    solution.expanded_states / solution.time if solution.time else 0.0
+                )
+            metrics["peak_memory"] = _peak_memory(lambda: run_job(job))
+
+            results.append(BenchmarkResult(f"macro/{job.level_name}/{config}", metrics))
+
+    return results
+
+
+def save_baseline(results: Iterable[BenchmarkResult], path: str) -> None:
+    """Save the results as a JSON baseline."""
+    baseline = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": {result.name: result.metrics for result in results},
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+
+
+def load_baseline(path: str) -> dict[str, dict[str, Any]]:
+    """Load the metrics of each benchmark of a JSON baseline."""
+    with open(path) as f:
+        return json.load(f)["benchmarks"]
+
+
+def find_regressions(
+    results: Iterable[BenchmarkResult],
+    baseline: dict[str, dict[str, Any]],
+    threshold: float = 0.2,
+) -> list[str]:
+    """
+    Compare the results against a baseline.
+    Returns:
+        A description of each metric worse than its baseline value by more
+        than the threshold (relative, e.g. 0.2 for 20%).
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result.name)
+        if expected is None:
+            continue
+
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if metric not in result.metrics or not expected.get(metric):
+                continue
+
+            value = result.metrics[metric]
+            change = (value - expected[metric]) / expected[metric]
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(
+                    f"{result.name}: {metric} {expected[metric]:.4g} -> {value:.4g}"
+                    + f" ({change:+.0%})"
+                )
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("levels", nargs="+", help="level files")
+    parser.add_argument("--output", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="relative change to flag"
+    )
+    parser.add_argument("--no-micro", action="store_true")
+    parser.add_argument("--no-macro", action="store_true")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per micro benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each macro benchmark")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per solve")
+    args = parser.parse_args()
+
+    results = []
+    if not args.no_micro:
+        for result in run_micro_benchmarks(args.levels, min_time=args.min_time):
+            print(result, flush=True)
+            results.append(result)
+    if not args.no_macro:
+        for result in run_macro_benchmarks(
+            args.levels, repeat=args.repeat, timeout=args.timeout
+        ):
+            print(result, flush=True)
+            results.append(result)
+
+    if args.output:
+        save_baseline(results, args.output)
+
+    if args.compare:
+        regressions = find_regressions(results, load_baseline(args.compare), args.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+from time import time
+
+from search_methods.precompute import level_tables
+from search_methods.pushes import BOX_MOVE_OFFSET, explore_player_region, walk_path
+from search_methods.solver import Solver
+from search_methods.solution import Solution
+from sokoban import Level, State
+from sokoban.map import Map
+
+__all__ = ["BidirectionalSearch"]
+
+
+class BidirectionalSearch(Solver):
+    """
+    Solver for Sokoban puzzle searching forward with pushes from the initial
+    state and backward with pulls from every goal state (all boxes on targets,
+    the player in any of the regions left free) at the same time, one breadth
+    first layer at a time from the smaller side, until the two sides meet.
+    States are compared by their boxes and player region, and the solution only
+    has push moves. The heuristic and state generator of the base solver are
+    not used.
+    Attributes:
+        - max_iters: Maximum number of states to expand (default: 100000).
+        - prune_dead_squares: Don't push boxes on dead squares (default: True).
+    """
+
+    def __init__(
+        self, base: Solver, max_iters: int = 100000, prune_dead_squares: bool = True
+    ) -> None:
+        super().__init__(
+            base.heuristic, base.state_generator, max_iters, base.profile, base.budget
+        )
+        self.prune_dead_squares = prune_dead_squares
+
+    def solve(self, initial_state: Map) -> Solution:
+        """
+        Solve the puzzle.
+        Args:
+            initial_state: The initial state of the puzzle.
+        """
+        self._start_time = time()
+        self._start_profile()
+        self._start_budget()
+        level = initial_state.level
+        start = State.from_map(initial_state)
+
+        if len(start.boxes) != len(level.targets):
+            raise ValueError("Bidirectional search needs as many boxes as targets")
+
+        # key -> (parent key, (box cell before, box cell after)) on each side
+        forward = {self._key(start): None}
+        backward = {}
+        forward_frontier = [start]
+        backward_frontier = []
+
+        for goal in self._goal_states(level):
+            key = self._key(goal)
+            if key in forward:
+                return self._make_solution(initial_state, forward, backward, key, 0)
+
+            backward[key] = None
+            backward_frontier.append(goal)
+
+        explored_states = 0
+        while len(forward_frontier) > 0 and len(backward_frontier) > 0:
+            if explored_states >= self.max_iters or self._out_of_budget(explored_states):
+                break
+
+            is_forward = len(forward_frontier) <= len(backward_frontier)
+            if is_forward:
+                parents, others = forward, backward
+                frontier, forward_frontier = forward_frontier, []
+                next_frontier = forward_frontier
+            else:
+                parents, others = backward, forward
+                frontier, backward_frontier = backward_frontier, []
+                next_frontier = backward_frontier
+
+            with self._phase("forward" if is_forward else "backward"):
+                for state in frontier:
+                    explored_states += 1
+                    key = self._key(state)
+
+                    for child, box_move in self._expand(state, is_forward):
+                        child_key = self._key(child)
+                        if child_key in parents:
+                            continue
+
+                        parents[child_key] = (key, box_move)
+                        if child_key in others:
+                            return self._make_solution(
+                                initial_state, forward, backward, child_key, explored_states
+                            )
+
+                        next_frontier.append(child)
+
+        # No solution found in the given iterations
+        return self._finish_solution(
+            Solution(initial_state, [], explored_states, time() - self._start_time, 0)
+        )
+
+    @staticmethod
+    def _region(level: Level, player: int, boxes: frozenset) -> list[int]:
+        """Get the cells the player can walk to."""
+        walls = level.walls
+        offsets = level.offsets.values()
+
+        seen = {player}
+        region = [player]
+        for cell in region:
+            for offset in offsets:
+                next_cell = cell + offset
+                if walls[next_cell] or next_cell in boxes or next_cell in seen:
+                    continue
+                seen.add(next_cell)
+                region.append(next_cell)
+
+        return region
+
+    def _key(self, state: State) -> int:
+        """Key of a state, with the player replaced by its region."""
+        region = self._region(state.level, state.player, frozenset(state.boxes))
+        return state.level.zobrist_hash(min(region), state.boxes)
+
+    def _goal_states(self, level: Level) -> list[State]:
+        """Get the solved states, one for each region the player can be in."""
+        boxes = frozenset(level.target_cells)
+
+        goals = []
+        seen = set()
+        for cell in range(level.cells_count):
+            if level.walls[cell] or cell in boxes or cell in seen:
+                continue
+
+            region = self._region(level, cell, boxes)
+            seen.update(region)
+            goals.append(State(level, cell, boxes))
+
+        return goals
+
+    def _expand(self, state: State, is_forward: bool) -> list[tuple[State, tuple[int, int]]]:
+        """
+        Get the states after a push (forward) or a pull (backward), with the
+        cells the box was moved from and to.
+        """
+        level = state.level
+        walls = level.walls
+        dead_squares = level_tables(level).dead_squares
+        boxes = frozenset(state.boxes)
+
+        children = []
+        for cell in self._region(level, state.player, boxes):
+            for offset in level.offsets.values():
+                if is_forward:
+                    # The player on cell pushes the box in front of it
+                    box, box_to, player_to = cell + offset, cell + 2 * offset, cell + offset
+                    free = box_to
+                else:
+                    # The player on cell pulls the box behind it
+                    box, box_to, player_to = cell - offset, cell, cell + offset
+                    free = player_to
+
+                if box not in boxes or walls[free] or free in boxes:
+                    continue
+
+                if is_forward and self.prune_dead_squares and dead_squares[box_to]:
+                    continue
+
+                child_boxes = (boxes - {box}) | {box_to}
+                children.append((State(level, player_to, child_boxes), (box, box_to)))
+
+        return children
+
+    def _make_solution(
+        self,
+        initial_state: Map,
+        forward: dict,
+        backward: dict,
+        meeting_key: int,
+        explored_states: int,
+    ) -> Solution:
+        # Pushes from the start to the meeting state
+        pushes = []
+        key = meeting_key
+        while forward[key] is not None:
+            key, box_move = forward[key]
+            pushes.append(box_move)
+        pushes.reverse()
+
+        # Pulls from the meeting state back to a goal, made as pushes
+        key = meeting_key
+        while backward[key] is not None:
+            key, (box_from, box_to) = backward[key]
+            pushes.append((box_to, box_from))
+
+        level = initial_state.level
+        moves_by_offset = {offset: move for move, offset in level.offsets.items()}
+
+        # Walk to each box and push it
+        state = initial_state.copy()
+        steps_moves = []
+        for box_from, box_to in pushes:
+            offset = box_to - box_from
+            parents, _ = explore_player_region(state)
+            walk = walk_path(parents, box_from - offset)
+            push = moves_by_offset[offset] + BOX_MOVE_OFFSET
+
+            for move in walk + [push]:
+                state.apply_move(move)
+            steps_moves.append(walk + [push])
+
+        duration = time() - self._start_time
+        return self._finish_solution(
+            Solution(
+                initial_state, steps_moves, explored_states, duration, state.undo_moves
+            )
+        )
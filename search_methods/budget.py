@@ -0,0 +1,107 @@
+import sys
+from time import perf_counter
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+__all__ = ["Budget"]
+
+# Number of checks of a budget between two measures of the memory used
+MEMORY_CHECK_INTERVAL = 256
+
+# What ran out, recorded in the solutions
+TIME_LIMIT = "time"
+STATES_LIMIT = "states"
+MEMORY_LIMIT = "memory"
+
+
+def memory_used() -> int:
+    """
+    Get the memory used by the process, in bytes. Without psutil, this is the
+    peak memory used so far.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # In bytes on macOS, KiB elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Budget:
+    """
+    Limits of a search, on top of the iterations of the solver. When one is
+    reached, the solver stops and returns the best partial solution found.
+    Attributes:
+        - time_limit: Maximum wall time of a solve, in seconds (None for no
+        limit).
+        - max_states: Maximum number of states explored (None for no limit).
+        - max_memory: Maximum memory used by the process, in bytes (None for
+        no limit).
+        - anytime: Keep searching for shorter solutions after the first one is
+        found, until a limit is reached (default: False).
+        - exhausted: Which limit was reached ("time", "states" or "memory"),
+        None if none was.
+    """
+
+    def __init__(
+        self,
+        time_limit: float | None = None,
+        max_states: int | None = None,
+        max_memory: int | None = None,
+        anytime: bool = False,
+    ) -> None:
+        if max_memory is not None and psutil is None and resource is None:
+            raise ValueError("The memory used can't be measured on this platform")
+        if anytime and time_limit is None and max_states is None:
+            raise ValueError("An anytime search needs a time or states limit")
+
+        self.time_limit = time_limit
+        self.max_states = max_states
+        self.max_memory = max_memory
+        self.anytime = anytime
+        self.start()
+
+    def start(self) -> None:
+        """Start counting, at the start of a solve."""
+        self.exhausted = None
+        self._deadline = None
+        if self.time_limit is not None:
+            self._deadline = perf_counter() + self.time_limit
+        self._checks = 0
+
+    def check(self, explored_states: int) -> bool:
+        """Check if a limit was reached (and record which one)."""
+        if self.exhausted is not None:
+            return True
+
+        if self.max_states is not None and explored_states >= self.max_states:
+            self.exhausted = STATES_LIMIT
+        elif self._deadline is not None and perf_counter() >= self._deadline:
+            self.exhausted = TIME_LIMIT
+        elif self.max_memory is not None:
+            if (
+                self._checks % MEMORY_CHECK_INTERVAL == 0
+                and memory_used() >= self.max_memory
+            ):
+                self.exhausted = MEMORY_LIMIT
+            self._checks += 1
+
+        return self.exhausted is not None
+
+    def __str__(self) -> str:
+        limits = []
+        if self.time_limit is not None:
+            limits.append(f"{self.time_limit}s")
+        if self.max_states is not None:
+            limits.append(f"{self.max_states} states")
+        if self.max_memory is not None:
+            limits.append(f"{self.max_memory / (1 << 20):.0f}MiB")
+        return ", ".join(limits) + (" (anytime)" if self.anytime else "")
@@ -0,0 +1,198 @@
+import heapq
+from collections import OrderedDict
+from math import inf
+
+__all__ = [
+    "BoundedCostTable",
+    "EvictionPolicy",
+    "LRUEviction",
+    "LowestUpdateEviction",
+    "EVICTION_POLICIES",
+]
+
+# Approximate memory used by an entry of the table (the key, the cost and the
+# dictionary slot), without the bookkeeping of the eviction policy
+ENTRY_BYTES = 100
+
+
+class EvictionPolicy:
+    """
+    Chooses the entries a BoundedCostTable removes when it is full.
+    Attributes:
+        - entry_bytes: Approximate memory used by the policy for each entry.
+    """
+
+    entry_bytes = 0
+
+    def accessed(self, key: int) -> None:
+        """Called when the cost of a stored state is read."""
+
+    def stored(self, key: int, cost: float) -> None:
+        """Called when the cost of a state is stored (or changed)."""
+        raise NotImplementedError
+
+    def victim(self) -> int:
+        """Choose the state to evict, forgetting it."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LRUEviction(EvictionPolicy):
+    """Evict the state whose cost was used the longest time ago."""
+
+    entry_bytes = 110
+
+    def __init__(self) -> None:
+        self._order = OrderedDict()
+
+    def accessed(self, key: int) -> None:
+        self._order.move_to_end(key)
+
+    def stored(self, key: int, cost: float) -> None:
+        self._order[key] = None
+        self._order.move_to_end(key)
+
+    def victim(self) -> int:
+        return self._order.popitem(last=False)[0]
+
+    def clear(self) -> None:
+        self._order.clear()
+
+
+class LowestUpdateEviction(EvictionPolicy):
+    """
+    Evict the state whose cost was changed the least from the first one
+    stored (its heuristic), the oldest one first. The costs that were never
+    updated are the cheapest to compute again, while the learned ones (and the
+    dead ends, with an infinite cost) are kept.
+    """
+
+    entry_bytes = 220
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def stored(self, key: int, cost: float) -> None:
+        entry = self._entries.get(key)
+        base = cost if entry is None else entry[0]
+        update = inf if cost == inf else abs(cost - base)
+
+        self._sequence += 1
+        self._entries[key] = (base, self._sequence)
+        heapq.heappush(self._heap, (update, self._sequence, key))
+
+        # Drop the outdated heap items once they outnumber the entries
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [item for item in self._heap if self._is_current(item)]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, item: tuple[float, int, int]) -> bool:
+        # The items of evicted keys, or of costs stored again since, are stale
+        entry = self._entries.get(item[2])
+        return entry is not None and entry[1] == item[1]
+
+    def victim(self) -> int:
+        while True:
+            item = heapq.heappop(self._heap)
+            if self._is_current(item):
+                del self._entries[item[2]]
+                return item[2]
+
+    def clear(self) -> None:
+        # The first cost and the sequence number of the last store of each key
+        self._entries = {}
+        self._heap = []
+        self._sequence = 0
+
+
+EVICTION_POLICIES = {
+    "lru": LRUEviction,
+    "lowest_update": LowestUpdateEviction,
+}
+
+
+class BoundedCostTable:
+    """
+    Table of the costs of states, keyed by the state keys, holding at most a
+    given number of entries (or an approximate number of bytes). When full,
+    storing a new state evicts the one chosen by the eviction policy.
+    Attributes:
+        - max_entries: The maximum number of entries.
+        - policy: The eviction policy.
+        - hits: Number of lookups that found their key.
+        - misses: Number of lookups that didn't find their key.
+        - evictions: Number of entries evicted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        eviction: str | EvictionPolicy = "lru",
+    ) -> None:
+        """
+        Args:
+            max_entries: The maximum number of entries.
+            max_bytes: The approximate memory the table may use, if the number
+            of entries isn't given.
+            eviction: The eviction policy, or its name in EVICTION_POLICIES.
+        """
+        if isinstance(eviction, str):
+            if eviction not in EVICTION_POLICIES:
+                raise ValueError(f"Unknown eviction policy: {eviction}")
+            eviction = EVICTION_POLICIES[eviction]()
+
+        if max_entries is None:
+            if max_bytes is None:
+                raise ValueError("Either max_entries or max_bytes must be given")
+            max_entries = max_bytes // (ENTRY_BYTES + eviction.entry_bytes)
+        if max_entries < 1:
+            raise ValueError("The table must hold at least one entry")
+
+        self.max_entries = max_entries
+        self.policy = eviction
+        self.clear()
+
+    def clear(self) -> None:
+        """Remove all the entries and reset the counters."""
+        self._costs = {}
+        self.policy.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: int, default: float | None = None) -> float | None:
+        """Get the cost of a state, default if it isn't stored."""
+        cost = self._costs.get(key)
+        if cost is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.policy.accessed(key)
+        return cost
+
+    def __setitem__(self, key: int, cost: float) -> None:
+        if key not in self._costs and len(self._costs) >= self.max_entries:
+            del self._costs[self.policy.victim()]
+            self.evictions += 1
+
+        self._costs[key] = cost
+        self.policy.stored(key, cost)
+
+    def __getitem__(self, key: int) -> float:
+        return self._costs[key]
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._costs
+
+    def __len__(self) -> int:
+        return len(self._costs)
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of lookups that found their key."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,241 @@
+from functools import lru_cache
+from typing import Callable
+
+from sokoban import Level
+from sokoban.map import Map
+from search_methods.precompute import level_tables
+from search_methods.utils import box_cells
+
+__all__ = [
+    "DeadlockPatternCache",
+    "DeadlockPruning",
+    "is_freeze_deadlock",
+]
+
+# Radius of the neighbourhood checked around a pushed box for freeze deadlocks
+FREEZE_RADIUS = 2
+
+# Contents of a cell in a neighbourhood pattern
+FREE = 0
+WALL = 1
+BOX = 2
+BOX_ON_TARGET = 3
+DEAD_SQUARE = 4
+PATTERN_CODES = 5
+
+
+class DeadlockPatternCache:
+    """
+    Memoizes the freeze deadlock check of the neighbourhood patterns around
+    pushed boxes. The patterns don't depend on the level, so the cache can be
+    shared by all of them.
+    Attributes:
+        - maxsize: Maximum number of patterns kept (None for no limit).
+        - hits: Number of patterns found in the cache.
+        - misses: Number of patterns checked and added to the cache.
+    """
+
+    def __init__(self, maxsize: int | None = 1 << 16) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._patterns = {}
+
+    def is_deadlock(self, pattern: int, codes: list[int]) -> bool:
+        """Check if a pattern (encoding the given cell codes) is a deadlock."""
+        deadlock = self._patterns.get(pattern)
+        if deadlock is not None:
+            self.hits += 1
+            return deadlock
+
+        self.misses += 1
+        deadlock = _frozen_off_target(codes, 2 * FREEZE_RADIUS + 1)
+
+        if self.maxsize is None or len(self._patterns) < self.maxsize:
+            self._patterns[pattern] = deadlock
+
+        return deadlock
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+
+default_pattern_cache = DeadlockPatternCache()
+
+
+def is_freeze_deadlock(
+    state: Map, cell: int, cache: DeadlockPatternCache = default_pattern_cache
+) -> bool:
+    """
+    Check if the box on a cell is part of a group of boxes that can't be
+    moved anymore (blocked by walls, dead squares and each other on both
+    axes), with at least one of them not on a target. Only the neighbourhood
+    of the box is looked at, whatever is outside it is considered free.
+    """
+    level = state.level
+    tables = level_tables(level)
+    boxes = set(box_cells(state))
+
+    codes = []
+    pattern = 0
+    for neighbour in _neighbourhood(level, cell):
+        if neighbour is None or level.walls[neighbour]:
+            code = WALL
+        elif neighbour in boxes:
+            code = BOX_ON_TARGET if neighbour in level.target_set else BOX
+        elif tables.dead_squares[neighbour]:
+            code = DEAD_SQUARE
+        else:
+            code = FREE
+
+        codes.append(code)
+        pattern = pattern * PATTERN_CODES + code
+
+    return cache.is_deadlock(pattern, codes)
+
+
+@lru_cache(maxsize=1 << 14)
+def _neighbourhood(level: Level, cell: int) -> tuple[int | None, ...]:
+    """
+    Get the cells around a cell, row by row, with None for the positions
+    outside the bordered map.
+    """
+    x, y = level.position(cell)
+    cells = []
+
+    for dx in range(-FREEZE_RADIUS, FREEZE_RADIUS + 1):
+        for dy in range(-FREEZE_RADIUS, FREEZE_RADIUS + 1):
+            nx, ny = x + dx, y + dy
+            if -1 <= nx <= level.length and -1 <= ny <= level.width:
+                cells.append(level.index(nx, ny))
+            else:
+                cells.append(None)
+
+    return tuple(cells)
+
+
+def _frozen_off_target(codes: list[int], size: int) -> bool:
+    """
+    Check if the box in the middle of a (size x size) pattern is frozen along
+    with other boxes, not all of them on targets.
+    """
+
+    def code(x: int, y: int) -> int:
+        if 0 <= x < size and 0 <= y < size:
+            return codes[x * size + y]
+        return FREE
+
+    def blocked(x: int, y: int, vertical: bool, fixed: frozenset) -> list | None:
+        """
+        Get the boxes found frozen when checking if the box can't move along
+        an axis (None if it can), the fixed boxes being considered walls.
+        """
+        dx, dy = (1, 0) if vertical else (0, 1)
+        sides = [(x - dx, y - dy), (x + dx, y + dy)]
+        side_codes = [code(*side) for side in sides]
+
+        if WALL in side_codes or any(side in fixed for side in sides):
+            return []
+
+        if side_codes == [DEAD_SQUARE, DEAD_SQUARE]:
+            return []
+
+        fixed = fixed | {(x, y)}
+        for side, side_code in zip(sides, side_codes):
+            if side_code in (BOX, BOX_ON_TARGET):
+                frozen = blocked(*side, not vertical, fixed)
+                if frozen is not None:
+                    return frozen + [side_code]
+
+        return None
+
+    middle = size // 2
+    horizontal = blocked(middle, middle, False, frozenset())
+    if horizontal is None:
+        return False
+
+    vertical = blocked(middle, middle, True, frozenset())
+    if vertical is None:
+        return False
+
+    frozen = horizontal + vertical + [codes[middle * size + middle]]
+    return BOX in frozen
+
+
+class DeadlockPruning:
+    """
+    Wrapper of a state generator that drops the states which can't be solved
+    anymore: the ones with a box on a dead square (a cell from which no target
+    can be reached by pushing) and, optionally, the ones where a moved box got
+    frozen off a target. Only meant for generators without pull moves, since
+    a pull can bring a box back from a deadlock.
+    Attributes:
+        - state_generator: The wrapped state generator.
+        - freeze: If the freeze deadlocks are also pruned.
+        - pattern_cache: The cache of checked freeze patterns.
+        - generated: Number of states generated by the wrapped generator.
+        - pruned_dead_squares: Number of states dropped because of a box on a
+        dead square.
+        - pruned_freeze: Number of states dropped because of frozen boxes.
+    """
+
+    def __init__(
+        self,
+        state_generator: Callable[[Map], list[Map]],
+        freeze: bool = False,
+        pattern_cache: DeadlockPatternCache = default_pattern_cache,
+    ) -> None:
+        self.state_generator = state_generator
+        self.freeze = freeze
+        self.pattern_cache = pattern_cache
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        """Reset the counters of generated and pruned states."""
+        self.generated = 0
+        self.pruned_dead_squares = 0
+        self.pruned_freeze = 0
+
+    @property
+    def pruned(self) -> int:
+        """Total number of pruned states."""
+        return self.pruned_dead_squares + self.pruned_freeze
+
+    def __call__(self, state: Map) -> list[Map]:
+        dead_squares = level_tables(state.level).dead_squares
+        cells = set(box_cells(state))
+
+        neighbours = self.state_generator(state)
+        self.generated += len(neighbours)
+
+        kept = []
+        for neighbour in neighbours:
+            moved = [cell for cell in box_cells(neighbour) if cell not in cells]
+
+            if any(dead_squares[cell] for cell in moved):
+                self.pruned_dead_squares += 1
+                continue
+
+            if self.freeze and any(
+                is_freeze_deadlock(neighbour, cell, self.pattern_cache)
+                for cell in moved
+            ):
+                self.pruned_freeze += 1
+                continue
+
+            kept.append(neighbour)
+
+        return kept
+
+    def __str__(self) -> str:
+        return (
+            f"generated: {self.generated}"
+            + f", pruned dead squares: {self.pruned_dead_squares}"
+            + f", pruned freeze: {self.pruned_freeze}"
+        )
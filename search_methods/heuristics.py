@@ -1,10 +1,12 @@
-from scipy import optimize
-
-from sokoban.map import OBSTACLE_SYMBOL, Map
+from sokoban.map import Map
+from search_methods.assignment import incremental_assignment
+from search_methods.precompute import level_tables
+from search_methods.profiling import CacheStats
 from search_methods.utils import (
-    compute_distance_matrix,
+    box_cells,
     compute_distance_reachable_pushes,
     compute_reachable_positions,
+    compute_reachable_push_fields,
     manhattan_distance,
 )
 
@@ -17,6 +19,14 @@ __all__ = [
     "distance_to_target_reachable",
 ]
 
+# Number of cells from which computing the distances of all the boxes at once
+# (vectorized) is faster than a BFS for each of them
+VECTORIZED_MIN_CELLS = 1024
+
+# Calls of distance_to_target_reachable that reused the assignment of the
+# parent state (hits) and that computed all of its rows again (misses)
+reachable_assignments = CacheStats()
+
 
 def manhattan_min_distances(state: Map) -> int:
     """
@@ -39,22 +49,17 @@ def boxes_minimum_moves_combination(state: Map) -> int:
     Calculates the minimum number of pushes needed to move all boxes to a
     corresponding target.
     """
-    box_target_distances = np.zeros((len(state.boxes), len(state.targets)))
-
-    for i, target in enumerate(state.targets):
-        distances = compute_distance_matrix(state, [target], [OBSTACLE_SYMBOL])
+    push_distances = level_tables(state.level).push_distances
+    cells = box_cells(state)
 
-        for j, box in enumerate(state.boxes.values()):
-            try:
-                box_target_distances[i, j] = distances[box.x][box.y]
-            except IndexError:
-                state.plot_map()
-                print(len(state.boxes), len(state.targets))
-                raise
-
-    rows, cols = optimize.linear_sum_assignment(box_target_distances)
-    match = box_target_distances[rows, cols]
-    return match.sum()
+    assignment = incremental_assignment(
+        state,
+        "boxes_minimum_moves_combination",
+        cells,
+        lambda row: push_distances[:, cells[row]],
+        lambda: push_distances[:, cells].T,
+    )
+    return assignment.value
 
 
 def player_and_boxes_minimum_moves_combination(state: Map) -> int:
@@ -62,15 +67,11 @@ def player_and_boxes_minimum_moves_combination(state: Map) -> int:
     Calculates the steps to the closest box and the minimum number of pushes
     needed to move all boxes to a corresponding target (ignoring walls).
     """
-    player_distances = compute_distance_matrix(
-        state,
-        [(state.player.x, state.player.y)],
-        [OBSTACLE_SYMBOL],
-        restrict_pushes=False,
-    )
+    player = state.level.index(state.player.x, state.player.y)
+    player_distances = level_tables(state.level).player_distances(player)
 
-    box_distances = map(lambda b: player_distances[b.x][b.y], state.boxes.values())
-    return min(box_distances) + boxes_minimum_moves_combination(state)
+    box_distances = player_distances[box_cells(state)]
+    return box_distances.min() + boxes_minimum_moves_combination(state)
 
 
 def distance_to_target_reachable(state: Map) -> int:
@@ -80,16 +81,40 @@ def distance_to_target_reachable(state: Map) -> int:
     opposite to the target.
     """
     reach = compute_reachable_positions(state)
-    box_target_dist = np.zeros((len(state.boxes), len(state.targets)))
-
-    for i, box in enumerate(state.boxes.values()):
-        reach[box.x][box.y] = True
-        distances = compute_distance_reachable_pushes(state, (box.x, box.y), reach)
-        reach[box.x][box.y] = False
-
-        for j, target in enumerate(state.targets):
-            box_target_dist[i, j] = distances[target[0]][target[1]]
-
-    rows, cols = optimize.linear_sum_assignment(box_target_dist)
-    match = box_target_dist[rows, cols]
-    return match.sum()
+    cells = box_cells(state)
+    targets = [state.level.index(x, y) for x, y in state.targets]
+
+    def box_distances(row: int) -> np.ndarray:
+        cell = cells[row]
+        reach[cell] = 1
+        distances = compute_distance_reachable_pushes(state, cell, reach)
+        reach[cell] = 0
+
+        return np.array([distances[target] for target in targets])
+
+    def all_distances() -> np.ndarray:
+        if state.level.cells_count >= VECTORIZED_MIN_CELLS:
+            return compute_reachable_push_fields(state, cells, reach)[:, targets]
+        return np.array([box_distances(i) for i in range(len(cells))])
+
+    # The rows only depend on the other boxes through the reachable positions,
+    # so the assignment of the parent is only reused when they are the same
+    # (after the player moved without pushing). A push almost always changes
+    # them, and the rows are all computed again: keeping the rows of the boxes
+    # whose pushes don't look at the changed positions costs more than the
+    # searches it saves, the ones of boxes that can hardly be pushed.
+    key = "distance_to_target_reachable"
+    cached = state.heuristic_cache.get(key)
+    if cached is not None and cached[0] != reach:
+        del state.heuristic_cache[key]
+        cached = None
+
+    if cached is None:
+        reachable_assignments.misses += 1
+    else:
+        reachable_assignments.hits += 1
+
+    assignment = incremental_assignment(
+        state, key, cells, box_distances, all_distances, reach
+    )
+    return assignment.value
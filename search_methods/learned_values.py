@@ -0,0 +1,175 @@
+import functools
+import hashlib
+import os
+from typing import Callable
+
+import numpy as np
+
+from search_methods.deadlocks import FREEZE_RADIUS, DeadlockPruning
+from search_methods.memoization import MemoizedHeuristic
+from search_methods.profiling import unwrap
+
+__all__ = ["LearnedValues", "level_fingerprint", "search_fingerprint"]
+
+# Bumped when the keys of the states change (e.g. the zobrist tables)
+LEARNED_VALUES_VERSION = 1
+
+# Entries of the saved tables: the state key and its learned cost
+ENTRY_DTYPE = np.dtype([("key", "<u8"), ("cost", "<f8")])
+
+
+def level_fingerprint(level) -> str:
+    """Get a hash identifying the layout of a level (walls and targets)."""
+    layout = repr((level.length, level.width, level.obstacles, level.targets))
+    return hashlib.sha256(layout.encode()).hexdigest()[:20]
+
+
+def _function_name(function: Callable) -> str:
+    """
+    Get a name identifying what a function computes, the same in every run
+    (the repr of an object holds its address, so it is never used).
+    """
+    function = unwrap(function)
+    if isinstance(function, MemoizedHeuristic):
+        function = function.heuristic
+
+    if isinstance(function, DeadlockPruning):
+        # The pruned states are never learned, they depend on the options
+        return (
+            f"{_function_name(function.state_generator)}"
+            + f"[deadlocks freeze={function.freeze}"
+            + (f" radius={FREEZE_RADIUS}]" if function.freeze else "]")
+        )
+
+    if isinstance(function, functools.partial):
+        arguments = [repr(argument) for argument in function.args]
+        arguments += [f"{key}={value!r}" for key, value in function.keywords.items()]
+        return f"{_function_name(function.func)}({', '.join(arguments)})"
+
+    name = getattr(function, "__qualname__", None)
+    if name is not None:
+        return f"{function.__module__}.{name}"
+
+    # A callable instance, named after its class
+    return f"{type(function).__module__}.{type(function).__qualname__}"
+
+
+def search_fingerprint(heuristic: Callable, state_generator: Callable) -> str:
+    """
+    Get a hash identifying the heuristic and the state generator the costs
+    were learned with (the costs and the state keys depend on both).
+    """
+    search = f"{_function_name(heuristic)}:{_function_name(state_generator)}"
+    return hashlib.sha256(search.encode()).hexdigest()[:12]
+
+
+class LearnedValues:
+    """
+    Persistent table of the costs learned by LRTA* for the states of a
+    level, keyed by the state keys (zobrist hashes, the same in every
+    process). The costs saved by previous runs are read from a sorted array,
+    memory-mapped by default, and the ones learned since are kept in a
+    dictionary until saved.
+    Attributes:
+        - path: The file the table is loaded from and saved to (None to only
+        keep it in memory).
+    """
+
+    def __init__(self, path: str | None = None, mmap: bool = True) -> None:
+        self.path = path
+        self._values = {}
+        # Number of keys of the dictionary missing from the saved table
+        self._new = 0
+
+        entries = np.zeros(0, dtype=ENTRY_DTYPE)
+        if path is not None and os.path.exists(path):
+            entries = np.load(path, mmap_mode="r" if mmap else None)
+        self._keys = entries["key"]
+        self._costs = entries["cost"]
+
+    @classmethod
+    def for_level(
+        cls,
+        directory: str,
+        level,
+        heuristic: Callable,
+        state_generator: Callable,
+        mmap: bool = True,
+    ) -> "LearnedValues":
+        """
+        Get the table of a level, saved in a directory of learned values, for
+        the costs learned with a heuristic and a state generator.
+        """
+        name = (
+            f"{level_fingerprint(level)}"
+            + f"-{search_fingerprint(heuristic, state_generator)}"
+            + f".v{LEARNED_VALUES_VERSION}.npy"
+        )
+        return cls(os.path.join(directory, name), mmap)
+
+    def _saved_cost(self, key: int) -> float | None:
+        keys = self._keys
+        if not len(keys):
+            return None
+
+        i = int(np.searchsorted(keys, key))
+        if i < len(keys) and int(keys[i]) == key:
+            return float(self._costs[i])
+        return None
+
+    def get(self, key: int, default: float | None = None) -> float | None:
+        """Get the learned cost of a state, default if it has none."""
+        cost = self._values.get(key)
+        if cost is None:
+            cost = self._saved_cost(key)
+        return default if cost is None else cost
+
+    def __getitem__(self, key: int) -> float:
+        cost = self.get(key)
+        if cost is None:
+            raise KeyError(key)
+        return cost
+
+    def __setitem__(self, key: int, cost: float) -> None:
+        if key not in self._values and self._saved_cost(key) is None:
+            self._new += 1
+        self._values[key] = cost
+
+    def __contains__(self, key: int) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._keys) + self._new
+
+    def save(self, path: str | None = None) -> None:
+        """
+        Merge the learned costs into the saved table, written as a sorted
+        array of entries (replaced at once, so readers never see a partially
+        written table).
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to save the learned values to")
+
+        new_keys = np.fromiter(self._values.keys(), dtype=np.uint64, count=len(self._values))
+        new_costs = np.fromiter(self._values.values(), dtype=np.float64, count=len(self._values))
+        kept = ~np.isin(self._keys, new_keys)
+
+        entries = np.empty(int(kept.sum()) + len(new_keys), dtype=ENTRY_DTYPE)
+        entries["key"] = np.concatenate((self._keys[kept], new_keys))
+        entries["cost"] = np.concatenate((self._costs[kept], new_costs))
+        entries.sort(order="key")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = path + ".tmp.npy"
+        np.save(temporary_path, entries)
+        os.replace(temporary_path, path)
+
+        # The saved table now holds everything
+        self.path = path
+        self._keys = entries["key"]
+        self._costs = entries["cost"]
+        self._values = {}
+        self._new = 0
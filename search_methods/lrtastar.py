@@ -1,6 +1,9 @@
+from math import inf
 from time import time
 from random import choice, random
 
+from search_methods.cost_table import BoundedCostTable, EvictionPolicy
+from search_methods.learned_values import LearnedValues
 from search_methods.solver import Solver
 from search_methods.solution import Solution
 from sokoban.map import Map
@@ -25,8 +28,22 @@ class LRTAstar(Solver):
         chance halves (default: 1.0 - no backoff).
         - cost_plateau_treshold: Number of steps without improvement before 
         trying to backoff (default: 20).
-        - cost_estimations: A dictionary to store the cost estimations for
-        states.
+        - learned_values: Directory where the costs learned for each level
+        are kept between runs: they are loaded (memory-mapped) before solving
+        and saved after (default: None - learn from scratch every time).
+        - max_trials: Maximum number of times the level is solved again,
+        keeping the learned costs, until they converge: a trial solves the
+        level without evaluating any state it had no cost for (default: 1).
+        - max_cost_entries: Maximum number of cost estimations kept in
+        memory (default: None - no limit).
+        - max_cost_bytes: Approximate memory the cost estimations may use, if
+        max_cost_entries isn't given (default: None - no limit).
+        - cost_eviction: The policy choosing the cost estimations forgotten
+        when the limit is reached, "lru" or "lowest_update" (keeping the
+        costs learned over the heuristic) (default: "lru").
+        - cost_estimations: The cost estimations for states, keyed by the
+        state keys (a dictionary, a BoundedCostTable when limited, or
+        LearnedValues when they are kept between runs).
     """
 
     def __init__(
@@ -37,27 +54,104 @@ class LRTAstar(Solver):
         backoff_step_increment: int = 10,
         backoff_probability_factor: float = 1.0,
         cost_plateau_treshold: int = 20,
+        learned_values: str | None = None,
+        max_trials: int = 1,
+        max_cost_entries: int | None = None,
+        max_cost_bytes: int | None = None,
+        cost_eviction: str | EvictionPolicy = "lru",
     ) -> None:
-        super().__init__(base.heuristic, base.state_generator, max_iters)
+        super().__init__(
+            base.heuristic, base.state_generator, max_iters, base.profile, base.budget
+        )
         self.backoff_steps = backoff_steps
         self.backoff_step_increment = backoff_step_increment
         self.backoff_probability_factor = backoff_probability_factor
         self.cost_plateau_treshold = cost_plateau_treshold
+        self.learned_values = learned_values
+        self.max_trials = max_trials
+        self.max_cost_entries = max_cost_entries
+        self.max_cost_bytes = max_cost_bytes
+        self.cost_eviction = cost_eviction
+
+        self._bounded = max_cost_entries is not None or max_cost_bytes is not None
+        if self._bounded and learned_values is not None:
+            raise ValueError("The costs learned between runs can't be limited")
 
     def state_cost(self, state: Map):
-        encoding = str(state)
-        if encoding not in self.cost_estimations:
-            self.cost_estimations[encoding] = self.heuristic(state)
-        return self.cost_estimations[encoding]
+        key = state.key
+        cost = self.cost_estimations.get(key)
+        if cost is None:
+            cost = self.cost_estimations[key] = self.heuristic(state)
+            self._estimated_states += 1
+        return cost
+
+    def _make_cost_estimations(self, initial_state: Map):
+        if self.learned_values is not None:
+            return LearnedValues.for_level(
+                self.learned_values,
+                initial_state.level,
+                self.heuristic,
+                self.state_generator,
+            )
+        if self._bounded:
+            return BoundedCostTable(
+                self.max_cost_entries, self.max_cost_bytes, self.cost_eviction
+            )
+        return {}
 
     def solve(self, initial_state: Map) -> Solution:
         """
-        Solve the puzzle.
+        Solve the puzzle, in up to max_trials trials sharing the learned costs
+        (or as many as the budget allows for an anytime budget).
         Args:
             initial_state: The initial state of the puzzle.
+        Returns:
+            The shortest solution of the trials (if none solved the puzzle, the
+            path of the last one to the state with the lowest heuristic), with
+            the time and profile of all the trials.
         """
-        self.cost_estimations = {}
         self._start_time = time()
+        self._start_profile()
+        self.cost_estimations = self._make_cost_estimations(initial_state)
+        self._estimated_states = 0
+        self._start_budget()
+        self._steps = 0
+
+        best = None
+        best_trial = 0
+        trial = 0
+        while trial < self.max_trials or self._anytime(self._steps):
+            trial += 1
+            estimated = self._estimated_states
+            solution = self._trial(initial_state)
+
+            solved = solution.is_solved()
+            if solved and (best is None or solution.length < best.length):
+                best = solution
+                best_trial = trial
+
+            # Converged: the trial only went through states it had learned
+            if solved and self._estimated_states == estimated:
+                break
+            if self.budget is not None and self.budget.exhausted:
+                break
+
+        if best is not None:
+            solution = best
+            solution.trial = best_trial
+        else:
+            solution.trial = trial
+        solution.trials = trial
+        solution.time = time() - self._start_time
+        solution = self._finish_solution(solution)
+
+        if self.learned_values is not None:
+            self.cost_estimations.save()
+
+        return solution
+
+    def _trial(self, initial_state: Map) -> Solution:
+        """Search a path to the solution, using the costs learned so far."""
         self._extra_states_explored = 0
         self._backoffs = 0
 
@@ -69,48 +163,80 @@ class LRTAstar(Solver):
         chance_of_remaining = 1.0
         steps_no_improvement = 0
 
+        # The path to the state with the lowest heuristic reached
+        closest_heuristic = min_cost_found
+        closest_steps = [state]
+
         for _ in range(self.max_iters):
             solution_steps.append(state)
 
             # Solution found
             if state.is_solved():
                 return self._make_solution(
-                    solution_steps, state.explored_states, state.undo_moves
+                    initial_state, solution_steps, state.explored_states, state.undo_moves
                 )
 
+            if self._out_of_budget(self._steps):
+                break
+            self._steps += 1
+
             neighbours = self.state_generator(state)
-            costs = [1 + self.state_cost(n) for n in neighbours]
-            min_cost = min(costs)
+            dead_end = len(neighbours) == 0
+
+            if dead_end:
+                # No way forward (e.g. all the moves were pruned), never come
+                # back here and backoff
+                min_cost = inf
+                self.cost_estimations[state.key] = inf
+            else:
+                with self._phase("evaluation"):
+                    estimated = self._estimated_states
+                    costs = [1 + self.state_cost(n) for n in neighbours]
+                    min_cost = min(costs)
+
+                if self.profiler is not None:
+                    misses = self._estimated_states - estimated
+                    self.profiler.count_cache(
+                        "cost_estimations", len(neighbours) - misses, misses
+                    )
 
-            minimal_states = [
-                state for (cost, state) in zip(costs, neighbours) if cost == min_cost
-            ]
+                minimal_states = [
+                    state for (cost, state) in zip(costs, neighbours) if cost == min_cost
+                ]
 
-            next_state = choice(minimal_states)
-            self.cost_estimations[str(next_state)] = min_cost
+                next_state = choice(minimal_states)
+                self.cost_estimations[next_state.key] = min_cost
+
+                # The learned costs are inflated, the closest state is the
+                # one the heuristic estimates the closest to the goal
+                heuristic = self.heuristic(next_state)
+                if heuristic < closest_heuristic:
+                    closest_heuristic = heuristic
+                    closest_steps = solution_steps + [next_state]
 
             if min_cost >= min_cost_found:
                 steps_no_improvement += 1
 
-                if steps_no_improvement > self.cost_plateau_treshold:
+                if dead_end or steps_no_improvement > self.cost_plateau_treshold:
                     # Backoff
-                    if random() > chance_of_remaining:
-                        steps_back = min(backoff, len(solution_steps))
-                        self._extra_states_explored += steps_back
-                        solution_steps = solution_steps[:-steps_back]
+                    if dead_end or random() > chance_of_remaining:
+                        with self._phase("backoff"):
+                            steps_back = min(backoff, len(solution_steps))
+                            self._extra_states_explored += steps_back
+                            solution_steps = solution_steps[:-steps_back]
                         
-                        backoff += self.backoff_step_increment
-                        self._backoffs += 1
-
-                        if len(solution_steps) == 0:
-                            backoff = self.backoff_steps
-                            state = initial_state.copy()
-                        else:
-                            state = solution_steps.pop()
-
-                        min_cost_found = self.heuristic(state)
-                        chance_of_remaining = 1.0
-                        steps_no_improvement = 0
+                            backoff += self.backoff_step_increment
+                            self._backoffs += 1
+
+                            if len(solution_steps) == 0:
+                                backoff = self.backoff_steps
+                                state = initial_state.copy()
+                            else:
+                                state = solution_steps.pop()
+
+                            min_cost_found = self.heuristic(state)
+                            chance_of_remaining = 1.0
+                            steps_no_improvement = 0
                         continue
 
                     else:
@@ -122,19 +248,30 @@ class LRTAstar(Solver):
 
             state = next_state
 
-        # No solution found in the given iterations
+        # No solution found in the given iterations (or budget), return the
+        # path to the closest state
         return self._make_solution(
-            solution_steps, state.explored_states, state.undo_moves
+            initial_state,
+            closest_steps,
+            state.explored_states,
+            closest_steps[-1].undo_moves,
         )
 
     def _make_solution(
-        self, steps: list[Map], current_explored_states: int, pull_moves: int
+        self,
+        initial_state: Map,
+        steps: list[Map],
+        current_explored_states: int,
+        pull_moves: int,
     ) -> Solution:
         duration = time() - self._start_time
         explored_states = self._extra_states_explored + current_explored_states
 
+        # Finished by solve(), once all the trials are done
         return self.LRTAstarSolution(
-            [str(state) for state in steps],
+            initial_state,
+            # The first step is the initial state
+            [state.last_moves for state in steps[1:]],
             explored_states,
             duration,
             pull_moves,
@@ -146,18 +283,28 @@ class LRTAstar(Solver):
         Stats about a solution found by LRTA*.
         Additional attributes:
             - backoffs: The number of backoffs performed during the search.
+            - trials: The number of times the level was solved.
+            - trial: The trial the solution was found in (from 1).
         """
 
         def __init__(
             self,
-            steps: list[str],
+            initial_state: Map,
+            steps_moves: list[tuple[int, ...]],
             explored_states: int,
             time: float,
             undo_moves: int,
             backoffs: int,
         ):
-            super().__init__(steps, explored_states, time, undo_moves)
+            super().__init__(
+                initial_state, steps_moves, explored_states, time, undo_moves
+            )
             self.backoffs = backoffs
+            self.trials = 1
+            self.trial = 1
 
         def __str__(self) -> str:
-            return super().__str__() + f", backoffs: {self.backoffs}"
+            trials = ""
+            if self.trials > 1:
+                trials = f", trials: {self.trials} (best: {self.trial})"
+            return super().__str__() + f", backoffs: {self.backoffs}" + trials
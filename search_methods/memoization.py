@@ -0,0 +1,108 @@
+from typing import Any, Callable
+
+from search_methods.cost_table import BoundedCostTable
+from search_methods.profiling import unwrap
+from sokoban.map import Map
+
+__all__ = ["MemoizedHeuristic", "memoized"]
+
+# Number of values kept for each level by default
+DEFAULT_MAX_ENTRIES = 1 << 16
+
+# The shared memoized heuristics, by (heuristic, max_entries)
+_shared = {}
+
+
+class MemoizedHeuristic:
+    """
+    A heuristic whose values are cached in a LRU table for each level, keyed
+    by the state hashes (the exact positions of the player and the boxes, so
+    any heuristic can be cached). The other attributes are the ones of the
+    wrapped heuristic.
+    Attributes:
+        - heuristic: The wrapped heuristic.
+        - max_entries: The maximum number of values kept for each level.
+        - shared: If the object is the one returned by memoized() to every
+        solver (in each process).
+        - tables: The table of the values of each level.
+    """
+
+    def __init__(
+        self,
+        heuristic: Callable[[Map], int],
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        shared: bool = False,
+    ) -> None:
+        self.heuristic = unwrap(heuristic)
+        self.max_entries = max_entries
+        self.shared = shared
+        self.tables = {}
+
+    def __call__(self, state: Map) -> int:
+        table = self.tables.get(state.level)
+        if table is None:
+            table = self.tables[state.level] = BoundedCostTable(self.max_entries)
+
+        value = table.get(state.hash)
+        if value is None:
+            value = table[state.hash] = self.heuristic(state)
+        return value
+
+    @property
+    def hits(self) -> int:
+        return sum(table.hits for table in self.tables.values())
+
+    @property
+    def misses(self) -> int:
+        return sum(table.misses for table in self.tables.values())
+
+    @property
+    def evictions(self) -> int:
+        return sum(table.evictions for table in self.tables.values())
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of the calls answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self) -> None:
+        """Forget the cached values and reset the counters."""
+        self.tables = {}
+
+    def __reduce__(self):
+        # The shared heuristic is the one of the process it is unpickled in,
+        # the values aren't sent along
+        if self.shared:
+            return (memoized, (self.heuristic, self.max_entries))
+        return (MemoizedHeuristic, (self.heuristic, self.max_entries))
+
+    def __getattr__(self, name: str) -> Any:
+        # Not set yet while unpickling
+        if "heuristic" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.heuristic, name)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.heuristic.__name__}: {self.hit_rate:.1%} hits"
+            + f" ({self.hits}/{self.hits + self.misses}), {self.evictions} evictions"
+        )
+
+
+def memoized(
+    heuristic: Callable[[Map], int], max_entries: int = DEFAULT_MAX_ENTRIES
+) -> MemoizedHeuristic:
+    """
+    Get the shared memoized version of a heuristic: the same object is
+    returned for the same heuristic in a process, so every solver using it
+    reuses the values computed by the others for the same level.
+    """
+    heuristic = unwrap(heuristic)
+    if isinstance(heuristic, MemoizedHeuristic):
+        heuristic = heuristic.heuristic
+
+    key = (heuristic, max_entries)
+    if key not in _shared:
+        _shared[key] = MemoizedHeuristic(heuristic, max_entries, shared=True)
+    return _shared[key]
@@ -0,0 +1,234 @@
+"""
+Race several solver configurations on a level, each in its own process.
+"""
+
+import multiprocessing
+import random
+from multiprocessing.connection import Connection, wait
+from time import time
+
+import numpy as np
+
+from search_methods.batch import SolverConfig, job_seed
+from search_methods.solution import Solution
+from search_methods.solver import Solver
+from sokoban.map import Map
+
+__all__ = ["PortfolioSolver", "PortfolioResult", "MemberResult"]
+
+# Seconds between two checks of the budget while waiting for the members
+POLL_INTERVAL = 0.05
+
+
+class MemberResult:
+    """
+    How a member of a portfolio did.
+    Attributes:
+        - name: The name of its configuration.
+        - status: "solved", "unsolved", "error" (the error message is kept),
+        "crashed" (its process died) or "cancelled" (stopped once another
+        member won, or when the budget ran out).
+        - time: The wall time it ran for, in seconds.
+        - solution: The solution it returned (None if it didn't finish).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        status: str,
+        time: float,
+        solution: Solution | None = None,
+        error: str | None = None,
+    ) -> None:
+        self.name = name
+        self.status = status
+        self.time = time
+        self.solution = solution
+        self.error = error
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.status} in {self.time:.2f}s" + (
+            f" ({self.error})" if self.error else ""
+        )
+
+
+class PortfolioResult:
+    """
+    The outcome of a race, attached to the solution returned by a portfolio.
+    Attributes:
+        - winner: The name of the configuration whose solution was returned
+        (None if no member solved the puzzle).
+        - members: The result of each member, in the order of the
+        configurations.
+    """
+
+    def __init__(self, winner: str | None, members: list[MemberResult]) -> None:
+        self.winner = winner
+        self.members = members
+
+    def __str__(self) -> str:
+        lines = [f"winner: {self.winner}"]
+        lines += [str(member) for member in self.members]
+        return "\n".join(lines)
+
+
+def _run_member(
+    config: SolverConfig, initial_state: Map, seed: int, connection: Connection
+) -> None:
+    """Solve the level with a configuration, sending back how it went."""
+    random.seed(seed)
+    np.random.seed(seed % (1 << 32))
+
+    start_time = time()
+    try:
+        with config.build() as solver:
+            solution = solver.solve(initial_state)
+        status = "solved" if solution.is_solved() else "unsolved"
+        connection.send((status, solution, time() - start_time, None))
+    except Exception as e:
+        connection.send(("error", None, time() - start_time, repr(e)))
+    finally:
+        connection.close()
+
+
+class PortfolioSolver(Solver):
+    """
+    Solver running several solver configurations on the same level at the
+    same time, each in its own process. The first solution that solves the
+    puzzle is returned, and the other members are terminated at once. The
+    heuristic and state generator of the base solver are not used, its
+    budget's time limit bounds the race.
+    Attributes:
+        - configs: The configurations of the members (e.g. Beam Search with
+        different k, LRTA* with different backoffs, the same configuration
+        several times for different seeds).
+        - seed: The seed the seeds of the members are derived from.
+    """
+
+    def __init__(
+        self, base: Solver, configs: list[SolverConfig], seed: int = 42
+    ) -> None:
+        super().__init__(
+            base.heuristic, base.state_generator, base.max_iters, base.profile, base.budget
+        )
+        if len(configs) == 0:
+            raise ValueError("A portfolio needs at least one configuration")
+
+        self.configs = configs
+        self.seed = seed
+
+    def solve(self, initial_state: Map) -> Solution:
+        """
+        Race the members on the puzzle.
+        Args:
+            initial_state: The initial state of the puzzle.
+        Returns:
+            The first solution found, with a PortfolioResult as its portfolio
+            attribute. If no member solves the puzzle, the partial solution
+            ending with the lowest heuristic (the first one without a
+            heuristic).
+        """
+        self._start_time = time()
+        self._start_budget()
+
+        context = multiprocessing.get_context()
+        processes = []
+        connections = []
+        for index, config in enumerate(self.configs):
+            receiver, sender = context.Pipe(duplex=False)
+            seed = job_seed(self.seed, initial_state.test_name, config, index)
+            process = context.Process(
+                target=_run_member,
+                args=(config, initial_state, seed, sender),
+                daemon=True,
+            )
+            process.start()
+            # Only the member writes to its pipe
+            sender.close()
+
+            processes.append(process)
+            connections.append(receiver)
+
+        members = [None] * len(processes)
+        winner = None
+        try:
+            while winner is None and None in members:
+                if self._out_of_budget(0):
+                    break
+
+                pending = [i for i, member in enumerate(members) if member is None]
+                ready = wait(
+                    [connections[i] for i in pending]
+                    + [processes[i].sentinel for i in pending],
+                    POLL_INTERVAL,
+                )
+
+                for i in pending:
+                    member = self._member_result(i, connections[i], processes[i], ready)
+                    if member is None:
+                        continue
+
+                    members[i] = member
+                    if member.status == "solved" and winner is None:
+                        winner = i
+        finally:
+            for i, process in enumerate(processes):
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+                connections[i].close()
+
+                if members[i] is None:
+                    members[i] = MemberResult(
+                        self.configs[i].name, "cancelled", time() - self._start_time
+                    )
+
+        return self._make_solution(initial_state, members, winner)
+
+    def _member_result(
+        self, index: int, connection: Connection, process, ready: list
+    ) -> MemberResult | None:
+        """Get the result of a member if it finished, None if it still runs."""
+        name = self.configs[index].name
+
+        if connection in ready or (process.sentinel in ready and connection.poll()):
+            try:
+                status, solution, duration, error = connection.recv()
+                return MemberResult(name, status, duration, solution, error)
+            except EOFError:
+                pass
+        elif process.sentinel not in ready:
+            return None
+
+        # The process ended without sending anything back
+        process.join()
+        return MemberResult(
+            name,
+            "crashed",
+            time() - self._start_time,
+            error=f"exit code {process.exitcode}",
+        )
+
+    def _make_solution(
+        self, initial_state: Map, members: list[MemberResult], winner: int | None
+    ) -> Solution:
+        if winner is not None:
+            solution = members[winner].solution
+        else:
+            partial = [m.solution for m in members if m.solution is not None]
+            if not partial:
+                solution = Solution(initial_state, [], 0, time() - self._start_time, 0)
+            elif self.heuristic is not None:
+                # The one ending the closest to the goal
+                solution = min(partial, key=lambda s: self.heuristic(s.step(-1)))
+            else:
+                solution = partial[0]
+
+            if self.budget is not None:
+                solution.budget_exhausted = self.budget.exhausted
+
+        # The members' solutions keep their own profiles
+        solution.portfolio = PortfolioResult(
+            members[winner].name if winner is not None else None, members
+        )
+        return solution
@@ -0,0 +1,59 @@
+from functools import lru_cache
+
+import numpy as np
+
+from sokoban import Level
+from search_methods.utils import (
+    compute_level_distance_fields,
+    compute_level_distances,
+    compute_level_reachable,
+)
+
+__all__ = ["LevelTables", "level_tables"]
+
+
+class LevelTables:
+    """
+    Level-static data used by the heuristics, computed once per level and
+    shared by all of its states.
+    Attributes:
+        - level: The level the tables are computed for.
+        - push_distances: Array with the number of pushes needed to move a box
+        from each cell to each target, indexed by (target, cell).
+        - dead_squares: Marks with 1 the free cells from which a box can never
+        be pushed to any target.
+    """
+
+    def __init__(self, level: Level) -> None:
+        self.level = level
+        targets = [level.index(*t) for t in level.targets]
+        self.push_distances = compute_level_distance_fields(level, targets)
+        self._player_distances = {}
+
+        # The cells from which a box can't be pushed to any of the targets,
+        # however far (the distances stop at WALL_COST)
+        live = compute_level_reachable(level, targets)
+        self.dead_squares = bytearray(
+            not wall and not reachable
+            for wall, reachable in zip(level.walls, live.tolist())
+        )
+
+    def player_distances(self, cell: int) -> np.ndarray:
+        """
+        Get the number of player moves from a cell to all the others (ignoring
+        boxes). The table of each starting cell is computed on first use.
+        """
+        distances = self._player_distances.get(cell)
+        if distances is None:
+            distances = np.array(
+                compute_level_distances(self.level, [cell], restrict_pushes=False),
+                dtype=np.int32,
+            )
+            self._player_distances[cell] = distances
+        return distances
+
+
+@lru_cache(maxsize=64)
+def level_tables(level: Level) -> LevelTables:
+    """Get the (cached) precomputed tables of a level."""
+    return LevelTables(level)
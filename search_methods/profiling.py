@@ -0,0 +1,169 @@
+from time import perf_counter
+from typing import Any, Callable
+
+__all__ = ["Profile", "ProfileSection", "ProfiledFunction", "CacheStats", "unwrap"]
+
+
+class ProfileSection:
+    """
+    Timings of a profiled function or search phase.
+    Attributes:
+        - count: Number of calls (or times the phase was run).
+        - total_time: Cumulative time, in seconds.
+    """
+
+    __slots__ = ("count", "total_time", "_start")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_time = 0.0
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.count if self.count else 0.0
+
+    def __enter__(self) -> "ProfileSection":
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.total_time += perf_counter() - self._start
+        self.count += 1
+
+    def __str__(self) -> str:
+        return (
+            f"{self.count} calls, {self.total_time:.3f}s total"
+            + f", {self.mean_time * 1e6:.1f}us mean"
+        )
+
+
+class CacheStats:
+    """Hits and misses of a cache (or a deduplication) during a search."""
+
+    __slots__ = ("hits", "misses")
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.hit_rate:.1%} hits ({self.hits}/{self.hits + self.misses})"
+
+
+class ProfiledFunction:
+    """
+    A function whose calls are counted and timed into a profile section. The
+    other attributes are the ones of the wrapped function.
+    """
+
+    def __init__(self, function: Callable, section: ProfileSection) -> None:
+        self.function = function
+        self.section = section
+
+    def __call__(self, *args: Any) -> Any:
+        start_time = perf_counter()
+        try:
+            return self.function(*args)
+        finally:
+            self.section.total_time += perf_counter() - start_time
+            self.section.count += 1
+
+    def __getattr__(self, name: str) -> Any:
+        # Not set yet while unpickling
+        if "function" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.function, name)
+
+    def __str__(self) -> str:
+        return str(self.function)
+
+
+def unwrap(function: Callable) -> Callable:
+    """Get the function wrapped by a ProfiledFunction."""
+    while isinstance(function, ProfiledFunction):
+        function = function.function
+    return function
+
+
+class Profile:
+    """
+    Where the time of a search went.
+    Attributes:
+        - sections: The timings of the profiled functions and phases, by name.
+        The phases include the functions called in them.
+        - caches: The hit rates of the caches used, by name.
+    """
+
+    def __init__(self) -> None:
+        self.sections = {}
+        self.caches = {}
+
+    def section(self, name: str) -> ProfileSection:
+        """Get a section (created on first use), usable to time a phase."""
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = ProfileSection()
+        return section
+
+    def wrap(self, name: str, function: Callable) -> ProfiledFunction:
+        """Count and time the calls of a function into a section."""
+        return ProfiledFunction(unwrap(function), self.section(name))
+
+    def count_cache(self, name: str, hits: int, misses: int) -> None:
+        """Add lookups of a cache."""
+        cache = self.caches.get(name)
+        if cache is None:
+            cache = self.caches[name] = CacheStats()
+        cache.hits += hits
+        cache.misses += misses
+
+    def reset(self) -> None:
+        """Zero all the counters (the wrapped functions keep their sections)."""
+        for section in self.sections.values():
+            section.count = 0
+            section.total_time = 0.0
+        self.caches.clear()
+
+    def copy(self) -> "Profile":
+        """Copy of the profile, without the unused sections and caches."""
+        profile = Profile()
+        for name, section in self.sections.items():
+            if section.count > 0:
+                copied = profile.section(name)
+                copied.count = section.count
+                copied.total_time = section.total_time
+        for name, cache in self.caches.items():
+            if cache.hits + cache.misses > 0:
+                profile.count_cache(name, cache.hits, cache.misses)
+        return profile
+
+    def to_dict(self) -> dict:
+        """Plain (e.g. JSON serializable) representation of the profile."""
+        return {
+            "sections": {
+                name: {
+                    "count": section.count,
+                    "total_time": section.total_time,
+                    "mean_time": section.mean_time,
+                }
+                for name, section in self.sections.items()
+            },
+            "caches": {
+                name: {
+                    "hits": cache.hits,
+                    "misses": cache.misses,
+                    "hit_rate": cache.hit_rate,
+                }
+                for name, cache in self.caches.items()
+            },
+        }
+
+    def __str__(self) -> str:
+        lines = [f"{name}: {section}" for name, section in self.sections.items()]
+        lines += [f"{name}: {cache}" for name, cache in self.caches.items()]
+        return "\n".join(lines)
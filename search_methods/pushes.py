@@ -0,0 +1,94 @@
+from sokoban.map import BOX_SYMBOL, OBSTACLE_SYMBOL, Map
+from sokoban.moves import BOX_LEFT, LEFT
+
+
+__all__ = [
+    "explore_player_region",
+    "get_push_neighbours",
+    "replay_moves",
+    "walk_path",
+]
+
+# Offset between a move and the same move done with a box
+BOX_MOVE_OFFSET = BOX_LEFT - LEFT
+
+
+def explore_player_region(
+    state: Map,
+) -> tuple[dict[int, tuple[int, int] | None], list[tuple[int, int]]]:
+    """
+    Flood fill the cells the player can walk to without moving any box.
+    Returns:
+        - The walking parent (previous cell, move) of each reachable cell (None
+        for the player cell).
+        - The (cell, move) pairs from which a box can be pushed.
+    """
+    grid = state.grid
+    offsets = state.level.offsets.items()
+
+    player = state.player_cell
+    parents = {player: None}
+    pushes = []
+
+    frontier = [player]
+    for cell in frontier:
+        for move, offset in offsets:
+            next_cell = cell + offset
+            value = grid[next_cell]
+            if value == OBSTACLE_SYMBOL:
+                continue
+
+            if value == BOX_SYMBOL:
+                if state.cell_free_for_box(next_cell + offset):
+                    pushes.append((cell, move))
+                continue
+
+            if next_cell not in parents:
+                parents[next_cell] = (cell, move)
+                frontier.append(next_cell)
+
+    return parents, pushes
+
+
+def walk_path(parents: dict[int, tuple[int, int] | None], cell: int) -> list[int]:
+    """Rebuild the moves walking from the player cell to a reachable cell."""
+    path = []
+    while parents[cell] is not None:
+        cell, move = parents[cell]
+        path.append(move)
+
+    path.reverse()
+    return path
+
+
+def get_push_neighbours(state: Map) -> list[Map]:
+    """
+    Get the states reached by walking to a box and pushing it once. The
+    walking moves and the push are saved in the last_moves of each state, and
+    the states are keyed by their boxes and the region of the player.
+    """
+    level = state.level
+    parents, pushes = explore_player_region(state)
+
+    neighbours = []
+    for cell, move in pushes:
+        new_map = state.copy()
+        new_map.set_player_position(*level.position(cell))
+        new_map.apply_move(move + BOX_MOVE_OFFSET)
+
+        new_map.last_moves = tuple(walk_path(parents, cell)) + new_map.last_moves
+        new_map.player_region = min(explore_player_region(new_map)[0])
+        neighbours.append(new_map)
+
+    return neighbours
+
+
+def replay_moves(state: Map, moves: list[int]) -> list[Map]:
+    """Get the states visited while making the moves from the given state."""
+    states = []
+    for move in moves:
+        state = state.copy()
+        state.apply_move(move)
+        states.append(state)
+
+    return states
@@ -0,0 +1,679 @@
+"""
+Local solving service: levels are sent over TCP as JSON lines, queued and
+solved by worker processes, with their progress and results streamed back as
+JSON lines on the same connection.
+
+Usage: python -m search_methods.service serve --port 8765 --workers 2
+       python -m search_methods.service solve tests/*.yaml --port 8765
+
+Requests (one JSON object per line, only "level" is required):
+    {"id": "a", "level": "<yaml, xsb or grid text>", "solver": "lrtastar",
+     "heuristic": "boxes_minimum_moves_combination", "options": {"max_iters": 5000},
+     "budget": {"time_limit": 10, "max_states": 100000}}
+
+Events sent back, with the id of their request:
+    {"id": "a", "event": "queued", "position": 0}
+    {"id": "a", "event": "started"}
+    {"id": "a", "event": "progress", "explored_states": 1024, "elapsed": 0.5}
+    {"id": "a", "event": "result", "status": "solved", "moves": "uRRdL",
+     "move_count": 5, ...}
+    {"id": "a", "event": "error", "error": "..."}
+
+The connection is closed by the service once the client ended its side and
+all of its jobs are finished.
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import multiprocessing
+import os
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import count
+from time import perf_counter, time
+from typing import Any, AsyncIterator, Iterable
+
+import numpy as np
+
+import search_methods.heuristics as heuristics
+from search_methods.astar import AStar
+from search_methods.batch import NOTEBOOK_CONFIGS, SolverConfig, job_seed
+from search_methods.beam_search import BeamSearch
+from search_methods.bidirectional import BidirectionalSearch
+from search_methods.budget import Budget
+from search_methods.learned_values import level_fingerprint
+from search_methods.lrtastar import LRTAstar
+from search_methods.memoization import memoized
+from search_methods.precompute import level_tables
+from search_methods.solution import Solution
+from search_methods.utils import get_neighbours, get_neighbours_no_pulls
+from sokoban.map import Map
+from sokoban.moves import (
+    BOX_DOWN,
+    BOX_LEFT,
+    BOX_RIGHT,
+    BOX_UP,
+    DOWN,
+    LEFT,
+    RIGHT,
+    UP,
+)
+from sokoban.xsb import iter_xsb_levels
+
+__all__ = [
+    "SolverService",
+    "ProgressBudget",
+    "SOLVERS",
+    "STATE_GENERATORS",
+    "parse_level",
+    "make_config",
+    "solve_remote",
+]
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# The solvers that can be requested, with their default options
+SOLVERS = {
+    "beam_search": (BeamSearch, NOTEBOOK_CONFIGS[0].options),
+    "lrtastar": (LRTAstar, NOTEBOOK_CONFIGS[1].options),
+    "astar": (AStar, {}),
+    "ida_star": (AStar, {"iterative_deepening": True}),
+    "bidirectional": (BidirectionalSearch, {}),
+}
+
+STATE_GENERATORS = {
+    "no_pulls": get_neighbours_no_pulls,
+    "pulls": get_neighbours,
+}
+
+DEFAULT_SOLVER = "beam_search"
+DEFAULT_HEURISTIC = "boxes_minimum_moves_combination"
+DEFAULT_STATE_GENERATOR = "no_pulls"
+
+REQUEST_KEYS = {
+    "id",
+    "level",
+    "format",
+    "name",
+    "solver",
+    "heuristic",
+    "state_generator",
+    "options",
+    "budget",
+    "memoize",
+    "seed",
+}
+BUDGET_KEYS = {"time_limit", "max_states", "max_memory", "anytime"}
+
+# Maximum length of a request line (the level texts included)
+MAX_REQUEST_BYTES = 1 << 24
+
+# Seconds between two progress events of a job
+PROGRESS_INTERVAL = 0.5
+
+# Moves of the solutions sent back, in the LURD notation (pushes in uppercase)
+MOVE_LETTERS = {
+    LEFT: "l",
+    RIGHT: "r",
+    UP: "u",
+    DOWN: "d",
+    BOX_LEFT: "L",
+    BOX_RIGHT: "R",
+    BOX_UP: "U",
+    BOX_DOWN: "D",
+}
+
+
+def parse_level(text: str, format: str | None = None, name: str = "level") -> Map:
+    """
+    Get the map of a level sent as text.
+    Args:
+        text: The level, as the contents of a yaml level file, as XSB rows
+        (only the first level of a pack is read) or in the Map.from_str grid
+        format.
+        format: "yaml", "xsb" or "grid" (guessed from the text if None).
+        name: The name of the level, if the text doesn't give one.
+    """
+    if format is None:
+        if "height:" in text:
+            format = "yaml"
+        elif "#" in text:
+            format = "xsb"
+        else:
+            format = "grid"
+
+    if format == "yaml":
+        return Map.from_yaml_str(text, name)
+    if format == "xsb":
+        for state in iter_xsb_levels(text.splitlines(), name):
+            return state
+        raise ValueError("No level found in the XSB text")
+    if format == "grid":
+        state = Map.from_str(text)
+        state.test_name = name
+        return state
+    raise ValueError(f"Unknown level format: {format}")
+
+
+def make_config(
+    solver: str = DEFAULT_SOLVER,
+    heuristic: str = DEFAULT_HEURISTIC,
+    state_generator: str = DEFAULT_STATE_GENERATOR,
+    options: dict[str, Any] | None = None,
+    budget: Budget | None = None,
+    memoize: bool = False,
+) -> SolverConfig:
+    """
+    Describe a solver given by names, the options overriding the default ones
+    of the solver. With memoize, the heuristic values are kept by each worker
+    for the levels it solves (at most memoization.DEFAULT_MAX_ENTRIES each).
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver: {solver}")
+    if heuristic not in heuristics.__all__:
+        raise ValueError(f"Unknown heuristic: {heuristic}")
+    if state_generator not in STATE_GENERATORS:
+        raise ValueError(f"Unknown state generator: {state_generator}")
+
+    solver_class, default_options = SOLVERS[solver]
+    options = {**default_options, **(options or {})}
+    # Fail now rather than in a worker
+    inspect.signature(solver_class).bind(None, **options)
+
+    heuristic_function = getattr(heuristics, heuristic)
+    if memoize:
+        heuristic_function = memoized(heuristic_function)
+
+    return SolverConfig(
+        f"{solver} ({heuristic})",
+        solver_class,
+        heuristic_function,
+        STATE_GENERATORS[state_generator],
+        budget,
+        **options,
+    )
+
+
+# Where the workers send the progress of their jobs
+_progress_queue = None
+
+
+def _init_worker(progress_queue) -> None:
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+class ProgressBudget(Budget):
+    """
+    Budget reporting the number of states explored by its job to the service
+    as the solver checks it, at most once per interval.
+    Attributes:
+        - job: The number of the job.
+        - interval: The minimum number of seconds between two reports.
+    """
+
+    def __init__(
+        self, job: int, interval: float = PROGRESS_INTERVAL, **limits: Any
+    ) -> None:
+        self.job = job
+        self.interval = interval
+        super().__init__(**limits)
+
+    def start(self) -> None:
+        super().start()
+        self._started = perf_counter()
+        self._next_report = self._started + self.interval
+
+    def check(self, explored_states: int) -> bool:
+        now = perf_counter()
+        if now >= self._next_report and _progress_queue is not None:
+            self._next_report = now + self.interval
+            _progress_queue.put((self.job, int(explored_states), now - self._started))
+
+        return super().check(explored_states)
+
+
+def _solution_event(solution: Solution) -> dict[str, Any]:
+    return {
+        "status": "solved" if solution.is_solved() else "unsolved",
+        "move_count": len(solution.moves),
+        "moves": "".join(MOVE_LETTERS[move] for move in solution.moves),
+        "explored_states": int(solution.expanded_states),
+        "time": solution.time,
+        "pull_moves": int(solution.pull_moves),
+        "budget_exhausted": solution.budget_exhausted,
+    }
+
+
+def _solve_job(config: SolverConfig, state: Map, seed: int) -> dict[str, Any]:
+    """Solve a level in a worker, returning the fields of its result event."""
+    random.seed(seed)
+    np.random.seed(seed % (1 << 32))
+
+    # The tables of the levels a worker has seen stay cached
+    hits = level_tables.cache_info().hits
+    level_tables(state.level)
+    warm = level_tables.cache_info().hits > hits
+
+    start_time = time()
+    try:
+        with config.build() as solver:
+            event = _solution_event(solver.solve(state))
+    except Exception as e:
+        event = {"status": "error", "error": repr(e), "time": time() - start_time}
+
+    event["warm"] = warm
+    return event
+
+
+class _Connection:
+    """A client of the service, with its jobs that aren't finished yet."""
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.jobs = set()
+        self.closed = False
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def send(self, event: dict[str, Any]) -> None:
+        if self.closed or self.writer.is_closing():
+            return
+        self.writer.write((json.dumps(event) + "\n").encode())
+
+    def add(self, job: "_Job") -> None:
+        self.jobs.add(job)
+        self.idle.clear()
+
+    def finish(self, job: "_Job", event: dict[str, Any]) -> None:
+        self.send(event)
+        self.jobs.discard(job)
+        if not self.jobs:
+            self.idle.set()
+
+    def close(self) -> None:
+        """Stop sending events, cancelling the jobs still queued."""
+        self.closed = True
+        for job in self.jobs:
+            job.cancelled = True
+        self.jobs.clear()
+        self.idle.set()
+
+
+class _Job:
+    """A request waiting for a worker, or being solved."""
+
+    def __init__(
+        self,
+        number: int,
+        request_id: Any,
+        connection: _Connection,
+        config: SolverConfig,
+        state: Map,
+        seed: int,
+    ) -> None:
+        self.number = number
+        self.request_id = request_id
+        self.connection = connection
+        self.config = config
+        self.state = state
+        self.seed = seed
+        self.cancelled = False
+
+
+class SolverService:
+    """
+    Asyncio server solving the levels sent by its clients on worker processes.
+    The workers live as long as the service, and each level is always solved
+    by the same worker (chosen by the fingerprint of its layout), so the
+    precomputed tables of the levels already seen stay cached. A worker gets
+    the jobs of its levels only, even when the others are idle.
+    Attributes:
+        - host: The address the service listens on.
+        - port: The port the service listens on (0 for any free port, set to
+        the one chosen once started).
+        - workers: The number of worker processes (one per core by default).
+        - max_queued: The maximum number of jobs waiting for the workers,
+        further requests being refused.
+        - max_time_limit: The time limit of every job, in seconds, which the
+        requests can only lower.
+        - progress_interval: Seconds between two progress events of a job.
+        - seed: The seed the seeds of the jobs are derived from.
+    """
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        workers: int | None = None,
+        max_queued: int = 64,
+        max_time_limit: float = 60.0,
+        progress_interval: float = PROGRESS_INTERVAL,
+        seed: int = 42,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self.max_time_limit = max_time_limit
+        self.progress_interval = progress_interval
+        self.seed = seed
+
+    async def start(self) -> None:
+        """Start the workers and listen for clients."""
+        loop = asyncio.get_running_loop()
+        # Forked workers would keep the sockets of the clients open
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload([__name__])
+        else:
+            self._context = multiprocessing.get_context("spawn")
+        self._progress_queue = self._context.Queue()
+        # A pool of a single process for each worker, replaced if it dies
+        self._pools = [self._make_pool() for _ in range(self.workers)]
+
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._queued = 0
+        self._running = {}
+        self._job_numbers = count()
+        self._connections = set()
+        self._dispatchers = [
+            asyncio.create_task(self._dispatch(worker))
+            for worker in range(self.workers)
+        ]
+
+        self._progress_thread = threading.Thread(
+            target=self._forward_progress, args=(loop,), daemon=True
+        )
+        self._progress_thread.start()
+
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=MAX_REQUEST_BYTES
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """
+        Stop listening and drop the queued jobs, waiting for the running ones
+        (bounded by max_time_limit).
+        """
+        self._server.close()
+        for connection in list(self._connections):
+            connection.close()
+            connection.writer.close()
+
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(None, pool.shutdown) for pool in self._pools)
+        )
+        self._progress_queue.put(None)
+        await loop.run_in_executor(None, self._progress_thread.join)
+        self._progress_queue.close()
+
+    async def __aenter__(self) -> "SolverService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _make_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            1,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._progress_queue,),
+        )
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        connection = _Connection(writer)
+        self._connections.add(connection)
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    self._submit(connection, line)
+                await writer.drain()
+
+            # The client sent all its requests, its results are still sent
+            # unless it disconnects (noticed once an event can't be sent)
+            waiters = [
+                asyncio.ensure_future(connection.idle.wait()),
+                asyncio.ensure_future(writer.wait_closed()),
+            ]
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+            await writer.drain()
+        except ValueError:
+            connection.send({"id": None, "event": "error", "error": "Request too long"})
+        except ConnectionError:
+            pass
+        finally:
+            connection.close()
+            self._connections.discard(connection)
+            writer.close()
+
+    def _submit(self, connection: _Connection, line: bytes) -> None:
+        """Queue the job of a request, telling the client why if it can't be."""
+        number = next(self._job_numbers)
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object")
+            request_id = request.get("id", number)
+            job = self._make_job(number, request_id, connection, request)
+            if self._queued >= self.max_queued:
+                raise asyncio.QueueFull
+        except asyncio.QueueFull:
+            connection.send(
+                {"id": request_id, "event": "error", "error": "The queue is full"}
+            )
+            return
+        except Exception as e:
+            connection.send({"id": request_id, "event": "error", "error": str(e)})
+            return
+
+        queue = self._queues[self._worker_of(job.state)]
+        queue.put_nowait(job)
+        self._queued += 1
+
+        connection.add(job)
+        connection.send(
+            {"id": request_id, "event": "queued", "position": queue.qsize() - 1}
+        )
+
+    def _worker_of(self, state: Map) -> int:
+        """Get the worker solving the levels with the layout of a state."""
+        return int(level_fingerprint(state.level), 16) % self.workers
+
+    def _make_job(
+        self,
+        number: int,
+        request_id: Any,
+        connection: _Connection,
+        request: dict[str, Any],
+    ) -> _Job:
+        unknown = set(request) - REQUEST_KEYS
+        if unknown:
+            raise ValueError(f"Unknown request fields: {', '.join(sorted(unknown))}")
+        if not isinstance(request.get("level"), str):
+            raise ValueError("The level must be given as text")
+
+        limits = request.get("budget") or {}
+        unknown = set(limits) - BUDGET_KEYS
+        if unknown:
+            raise ValueError(f"Unknown budget fields: {', '.join(sorted(unknown))}")
+        limits = dict(limits)
+        limits["time_limit"] = min(
+            limits.get("time_limit") or self.max_time_limit, self.max_time_limit
+        )
+        budget = ProgressBudget(number, self.progress_interval, **limits)
+
+        config = make_config(
+            request.get("solver", DEFAULT_SOLVER),
+            request.get("heuristic", DEFAULT_HEURISTIC),
+            request.get("state_generator", DEFAULT_STATE_GENERATOR),
+            request.get("options"),
+            budget,
+            request.get("memoize", False),
+        )
+
+        try:
+            state = parse_level(
+                request["level"],
+                request.get("format"),
+                request.get("name", f"level_{number}"),
+            )
+        except Exception as e:
+            raise ValueError(f"Invalid level: {e!r}")
+
+        seed = request.get("seed")
+        if seed is None:
+            seed = job_seed(self.seed, state.test_name, config, 0)
+
+        return _Job(number, request_id, connection, config, state, seed)
+
+    async def _dispatch(self, worker: int) -> None:
+        """Hand the jobs queued for a worker to it, one at a time."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queues[worker].get()
+            self._queued -= 1
+            if job.cancelled:
+                continue
+
+            self._running[job.number] = job
+            job.connection.send({"id": job.request_id, "event": "started"})
+
+            pool = self._pools[worker]
+            try:
+                result = await loop.run_in_executor(
+                    pool, _solve_job, job.config, job.state, job.seed
+                )
+                event = {"id": job.request_id, "event": "result", **result}
+            except BrokenProcessPool:
+                # The worker died, it is replaced (with none of its tables)
+                if self._pools[worker] is pool:
+                    self._pools[worker] = self._make_pool()
+                event = {
+                    "id": job.request_id,
+                    "event": "error",
+                    "error": "The worker process died",
+                }
+            finally:
+                del self._running[job.number]
+
+            job.connection.finish(job, event)
+
+    def _forward_progress(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Pass the reports of the workers to the event loop, in a thread."""
+        while True:
+            report = self._progress_queue.get()
+            if report is None:
+                return
+            loop.call_soon_threadsafe(self._send_progress, *report)
+
+    def _send_progress(self, number: int, explored_states: int, elapsed: float) -> None:
+        # The reports arriving after the result are dropped
+        job = self._running.get(number)
+        if job is not None:
+            job.connection.send(
+                {
+                    "id": job.request_id,
+                    "event": "progress",
+                    "explored_states": explored_states,
+                    "elapsed": elapsed,
+                }
+            )
+
+
+async def solve_remote(
+    requests: Iterable[dict[str, Any]],
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Send requests to a service, yielding the events sent back until all the
+    jobs are finished.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_REQUEST_BYTES)
+    try:
+        for request in requests:
+            writer.write((json.dumps(request) + "\n").encode())
+        writer.write_eof()
+        await writer.drain()
+
+        while line := await reader.readline():
+            yield json.loads(line)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    service = SolverService(
+        args.host, args.port, args.workers, args.max_queued, args.max_time_limit
+    )
+    async with service:
+        print(f"Listening on {service.host}:{service.port}", flush=True)
+        await service.serve_forever()
+
+
+async def _solve(args: argparse.Namespace) -> None:
+    requests = []
+    for path in args.levels:
+        with open(path, "r") as file:
+            text = file.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        format = "yaml" if path.endswith((".yaml", ".yml")) else "xsb"
+        request = {"id": path, "level": text, "format": format, "name": name}
+        request["solver"] = args.solver
+        if args.time_limit is not None:
+            request["budget"] = {"time_limit": args.time_limit}
+        requests.append(request)
+
+    async for event in solve_remote(requests, args.host, args.port):
+        print(json.dumps(event), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the service")
+    serve.add_argument("--workers", type=int, default=None)
+    serve.add_argument("--max-queued", type=int, default=64)
+    serve.add_argument("--max-time-limit", type=float, default=60.0)
+
+    solve = commands.add_parser("solve", help="send level files to a service")
+    solve.add_argument("levels", nargs="+", help="level files")
+    solve.add_argument("--solver", choices=SOLVERS, default=DEFAULT_SOLVER)
+    solve.add_argument("--time-limit", type=float, default=None)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args) if args.command == "serve" else _solve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
-from shutil import rmtree
-from tempfile import mkdtemp
-from sokoban.gif import create_gif, save_images
+from array import array
+from collections.abc import Sequence
+from os.path import join
+from typing import Iterable, Iterator
 from sokoban.map import Map
+from sokoban.render import save_gif
 
-__all__ = ["Solution"]
+__all__ = ["Solution", "SolutionSteps", "path_moves"]
+
+# Number of steps between the states kept for random access to the steps
+CHECKPOINT_INTERVAL = 64
+
+
+def path_moves(path: tuple | None) -> list[tuple[int, ...]]:
+    """
+    Get the moves of each step of a linked path, built as (parent path,
+    moves of the last step) tuples from None.
+    """
+    steps_moves = []
+    while path is not None:
+        path, last_moves = path
+        steps_moves.append(last_moves)
+
+    steps_moves.reverse()
+    return steps_moves
 
 
 class Solution:
@@ -11,26 +30,55 @@ class Solution:
     Class to store the solution (and different info about how it was obtained)
     for a Sokoban puzzle.
     Attributes:
-        - steps: The succession of states (as strings) of the game towards the
-        solution.
+        - initial_state: The state the solution starts from (None if there are
+        no steps).
+        - moves: The moves (sokoban.moves codes) made from the initial state.
+        - steps: The succession of states of the game towards the solution,
+        the initial one included. They are rebuilt from the moves when used.
         - length: The number of steps in the solution.
         - expanded_states: The number of states explored during the search.
         - time: The time taken to find the solution.
         - pull_moves: The number of box pulls made.
+        - profile: Where the time of the search went (a Profile), if the
+        solver was profiling (None otherwise).
+        - budget_exhausted: The limit of the solver's budget that stopped the
+        search ("time", "states" or "memory"), None if none did.
     """
 
     def __init__(
         self,
-        steps: list[str],
+        initial_state: Map | None,
+        steps_moves: Iterable[Iterable[int]],
         expanded_states: int,
         time: float,
         pull_moves: int,
     ):
-        self.steps = steps
-        self.length = len(steps)
+        """
+        Args:
+            initial_state: The state the solution starts from.
+            steps_moves: The moves made in each step after the initial state
+            (a step being a state generated by the solver, e.g. a push along
+            with the walk to the box).
+        """
+        self.moves = array("b")
+        # Number of moves made up to each step
+        self._step_ends = array("I", [0])
+        for moves in steps_moves:
+            self.moves.extend(moves)
+            self._step_ends.append(len(self.moves))
+
+        self.initial_state = None
+        if initial_state is not None:
+            self.initial_state = initial_state.copy()
+            self.initial_state.heuristic_cache = {}
+
+        self.length = len(self._step_ends) if initial_state is not None else 0
         self.expanded_states = expanded_states
         self.time = time
         self.pull_moves = pull_moves
+        self.profile = None
+        self.budget_exhausted = None
+        self._checkpoints = None
 
     def __str__(self) -> str:
         return (
@@ -39,21 +87,89 @@ class Solution:
             + f", explored states: {self.expanded_states}"
             + f", time: {self.time:.2f}s"
             + f", pull moves: {self.pull_moves}"
+            + (
+                f", budget exhausted: {self.budget_exhausted}"
+                if self.budget_exhausted
+                else ""
+            )
         )
 
+    @property
+    def steps(self) -> "SolutionSteps":
+        return SolutionSteps(self)
+
+    def iter_steps(self) -> Iterator[Map]:
+        """Replay the moves, yielding the state of each step."""
+        if self.initial_state is None:
+            return
+
+        state = self.initial_state.copy()
+        yield state.copy()
+
+        for step in range(1, self.length):
+            self._replay_step(state, step)
+            yield state.copy()
+
+    def step(self, index: int) -> Map:
+        """
+        Get the state of a step, replayed from the closest checkpoint. The
+        checkpoints are saved by replaying all the moves once, on first use.
+        """
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("Solution step out of range")
+
+        if self._checkpoints is None:
+            self._checkpoints = [
+                state
+                for step, state in enumerate(self.iter_steps())
+                if step % CHECKPOINT_INTERVAL == 0
+            ]
+
+        checkpoint = index // CHECKPOINT_INTERVAL
+        state = self._checkpoints[checkpoint].copy()
+        for step in range(checkpoint * CHECKPOINT_INTERVAL + 1, index + 1):
+            self._replay_step(state, step)
+
+        return state
+
+    def _replay_step(self, state: Map, step: int) -> None:
+        for move in self.moves[self._step_ends[step - 1] : self._step_ends[step]]:
+            state.apply_move(move)
+
     def is_solved(self) -> bool:
         """Check if the solution found actually solves the puzzle."""
-        if len(self.steps) == 0:
+        if self.initial_state is None:
             return False
 
-        return Map.from_str(self.steps[-1]).is_solved()
+        return self.step(-1).is_solved()
+
+    def save(self, name: str, path: str = ".", workers: int = 0) -> None:
+        """
+        Save the solution as a gif, drawing only the cells changed by each step.
+        Args:
+            workers: Processes encoding the frames in parallel (0 to encode
+            them in this process).
+        """
+        if self.initial_state is None:
+            return
+
+        if not name.endswith(".gif"):
+            name += ".gif"
 
-    def save(self, name: str, path: str = ".") -> None:
-        """Save the solution as a gif."""
-        tmpdir = mkdtemp()
-        save_images(self.steps, tmpdir)
-        create_gif(tmpdir, name, path)
-        rmtree(tmpdir)
+        steps_moves = (
+            self.moves[self._step_ends[step - 1] : self._step_ends[step]]
+            for step in range(1, self.length)
+        )
+        save_gif(self.initial_state, steps_moves, join(path, name), workers=workers)
+        print(f"GIF saved at: {join(path, name)}")
+
+    def __getstate__(self) -> dict:
+        # The checkpoints are rebuilt when needed
+        state = self.__dict__.copy()
+        state["_checkpoints"] = None
+        return state
 
     @staticmethod
     def average(solutions: list["Solution"]) -> "Solution":
@@ -61,13 +177,31 @@ class Solution:
         Calculate the average statistics of solutions.
         """
         if len(solutions) == 0:
-            return Solution([], 0, 0, 0)
+            return Solution(None, [], 0, 0, 0)
 
         expanded_states = sum(s.expanded_states for s in solutions) / len(solutions)
         time = sum(s.time for s in solutions) / len(solutions)
         pull_moves = sum(s.pull_moves for s in solutions) / len(solutions)
 
-        avg_sol = Solution([], expanded_states, time, pull_moves)
+        avg_sol = Solution(None, [], expanded_states, time, pull_moves)
         avg_sol.length = sum(s.length for s in solutions) / len(solutions)
 
         return avg_sol
+
+
+class SolutionSteps(Sequence):
+    """Lazy sequence of the states of the steps of a solution."""
+
+    def __init__(self, solution: Solution) -> None:
+        self.solution = solution
+
+    def __len__(self) -> int:
+        return self.solution.length
+
+    def __getitem__(self, index: int | slice) -> Map | list[Map]:
+        if isinstance(index, slice):
+            return [self.solution.step(i) for i in range(*index.indices(len(self)))]
+        return self.solution.step(index)
+
+    def __iter__(self) -> Iterator[Map]:
+        return self.solution.iter_steps()
@@ -1,25 +1,126 @@
-from typing import Callable
-
-from sokoban.map import Map
-
-__all__ = ["Solver"]
-
-
-class Solver:
-    """
-    Base class for Sokoban puzzle solvers. For instantiating multiple algorithms
-    or multiple runs of the same algorithms more easily.
-    """
-
-    def __init__(
-        self,
-        heuristic: Callable[[Map], int],
-        state_generator: Callable[[Map], list[Map]],
-        max_iters: int = 100,
-    ) -> None:
-        self.heuristic = heuristic
-        self.state_generator = state_generator
-        self.max_iters = max_iters
-
-    def solve(self):
-        raise NotImplementedError
+from typing import Callable
+
+from search_methods.budget import Budget
+from search_methods.profiling import Profile, ProfileSection, unwrap
+from search_methods.solution import Solution
+from sokoban.map import Map
+
+__all__ = ["Solver"]
+
+
+class _NoPhase:
+    """Context manager doing nothing, used when profiling is disabled."""
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+class Solver:
+    """
+    Base class for Sokoban puzzle solvers. For instantiating multiple algorithms
+    or multiple runs of the same algorithms more easily.
+    Attributes:
+        - profile: If True, the calls of the heuristic and state generator and
+        the phases of the search are timed, and the solutions come with a
+        Profile (default: False). When False, nothing is wrapped.
+        - budget: Limits on the time, explored states and memory of a solve,
+        after which the best partial solution is returned (default: None -
+        only max_iters). It also enables anytime searches.
+    """
+
+    def __init__(
+        self,
+        heuristic: Callable[[Map], int],
+        state_generator: Callable[[Map], list[Map]],
+        max_iters: int = 100,
+        profile: bool = False,
+        budget: Budget | None = None,
+    ) -> None:
+        self.heuristic = unwrap(heuristic)
+        self.state_generator = unwrap(state_generator)
+        self.max_iters = max_iters
+        self.profile = profile
+        self.budget = budget
+
+        self.profiler = None
+        if profile:
+            self.profiler = Profile()
+            self.heuristic = self.profiler.wrap("heuristic", self.heuristic)
+            self.state_generator = self.profiler.wrap(
+                "state_generator", self.state_generator
+            )
+
+    def solve(self):
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release what the solver keeps between solves (nothing by default)."""
+
+    def __enter__(self) -> "Solver":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _phase(self, name: str) -> ProfileSection | _NoPhase:
+        """Context manager timing a phase of the search into the profile."""
+        if self.profiler is None:
+            return _NO_PHASE
+        return self.profiler.section(name)
+
+    def _start_budget(self) -> None:
+        """Start counting the budget, at the start of a solve."""
+        if self.budget is not None:
+            self.budget.start()
+
+    def _out_of_budget(self, explored_states: int) -> bool:
+        """Check if the search must stop, as a limit of the budget was reached."""
+        return self.budget is not None and self.budget.check(explored_states)
+
+    def _anytime(self, explored_states: int) -> bool:
+        """Check if an anytime search should keep looking for a better solution."""
+        return (
+            self.budget is not None
+            and self.budget.anytime
+            and not self.budget.check(explored_states)
+        )
+
+    def _start_profile(self) -> None:
+        """Reset the profile, at the start of a search."""
+        if self.profiler is None:
+            return
+
+        self.profiler.reset()
+        pattern_cache = getattr(unwrap(self.state_generator), "pattern_cache", None)
+        if pattern_cache is not None:
+            self._pattern_lookups = (pattern_cache.hits, pattern_cache.misses)
+
+    def _finish_solution(self, solution: Solution) -> Solution:
+        """
+        Record the limit of the budget that stopped the search, and attach a
+        copy of the profile to the solution of a search.
+        """
+        if self.budget is not None:
+            solution.budget_exhausted = self.budget.exhausted
+
+        if self.profiler is None:
+            return solution
+
+        # The deadlock pattern cache may be shared, count only this search
+        pattern_cache = getattr(unwrap(self.state_generator), "pattern_cache", None)
+        if pattern_cache is not None:
+            hits, misses = self._pattern_lookups
+            self.profiler.count_cache(
+                "deadlock_patterns",
+                pattern_cache.hits - hits,
+                pattern_cache.misses - misses,
+            )
+
+        solution.profile = self.profiler.copy()
+        return solution
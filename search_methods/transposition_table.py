@@ -0,0 +1,81 @@
+__all__ = ["TranspositionTable"]
+
+# Replacement policies of the table slots
+REPLACE_ALWAYS = "always"
+REPLACE_SHALLOWER = "shallower"
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of the lowest cost (g) each state was reached with,
+    indexed by state keys. Each key maps to a single slot, so the memory used
+    never grows past the given size; when two keys collide on a slot, the
+    replacement policy decides which one is kept.
+    Attributes:
+        - size: The number of slots.
+        - replacement: "shallower" keeps the entry with the lowest cost
+        (closest to the root, so it prunes larger subtrees), "always" keeps
+        the most recent one.
+        - hits: Number of lookups that found their key.
+        - misses: Number of lookups that didn't find their key.
+        - stores: Number of entries written.
+        - replacements: Number of entries overwritten by another key.
+    """
+
+    def __init__(self, size: int = 1 << 20, replacement: str = REPLACE_SHALLOWER):
+        if replacement not in (REPLACE_ALWAYS, REPLACE_SHALLOWER):
+            raise ValueError(f"Unknown replacement policy: {replacement}")
+
+        self.size = size
+        self.replacement = replacement
+        self.clear()
+
+    def clear(self) -> None:
+        """Remove all the entries and reset the counters."""
+        self.clear_entries()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def clear_entries(self) -> None:
+        """Remove all the entries, keeping the counters."""
+        self._keys = [None] * self.size
+        self._costs = [0] * self.size
+
+    def get(self, key: int) -> int | None:
+        """Get the cost a state was stored with, None if it isn't stored."""
+        slot = key % self.size
+        if self._keys[slot] == key:
+            self.hits += 1
+            return self._costs[slot]
+
+        self.misses += 1
+        return None
+
+    def put(self, key: int, cost: int) -> bool:
+        """Store the cost of a state. Returns if it was stored."""
+        slot = key % self.size
+        stored_key = self._keys[slot]
+
+        if stored_key is not None and stored_key != key:
+            if (
+                self.replacement == REPLACE_SHALLOWER
+                and self._costs[slot] < cost
+            ):
+                return False
+            self.replacements += 1
+
+        self._keys[slot] = key
+        self._costs[slot] = cost
+        self.stores += 1
+        return True
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of lookups that found their key."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return self.size - self._keys.count(None)
@@ -1,5 +1,7 @@
-from sokoban import Map
-from queue import Queue
+from sokoban import Map, Level
+from collections import deque
+
+import numpy as np
 
 from sokoban.map import BOX_SYMBOL, OBSTACLE_SYMBOL
 
@@ -8,9 +10,16 @@ __all__ = [
     "get_neighbours_no_pulls",
     "in_bounds",
     "manhattan_distance",
+    "box_cells",
     "compute_distance_matrix",
     "compute_reachable_positions",
     "compute_distance_reachable_pushes",
+    "compute_level_distances",
+    "compute_distance_fields",
+    "compute_level_distance_fields",
+    "compute_level_reachable",
+    "compute_reachable_push_fields",
+    "grid_view",
 ]
 
 # Cost of an unreachable position
@@ -37,102 +46,311 @@ def manhattan_distance(a: tuple[int, int], b: tuple[int, int]) -> int:
     return abs(a[0] - b[0]) + abs(a[1] - b[1])
 
 
+def box_cells(state: Map) -> list[int]:
+    """Get the cell indices of the boxes of a state."""
+    return [state.level.index(box.x, box.y) for box in state.boxes.values()]
+
+
 def compute_distance_matrix(
     state: Map,
-    starts: list[tuple[int, int]],
+    starts: list[int],
     invalid_values: list[int],
     restrict_pushes: bool = True,
-) -> list[list[int]]:
+) -> list[int]:
     """
     Compute the distance matrix from a list of starting points to all others.
     Args:
         state: The map.
-        starts: The starting points.
+        starts: The starting cell indices.
         invalid_values: The values that are considered invalid (e.g. walls,
         other boxes).
         restrict_pushes: If True, calculate the distance in pushes, not moves.
+    Returns:
+        The distance to each cell index, WALL_COST for the unreachable ones.
     """
-    distances = [[WALL_COST for _ in range(state.width)] for _ in range(state.length)]
-    q = Queue()
-    for x, y in starts:
-        distances[x][y] = 0
-        q.put((x, y))
-
-    while not q.empty():
-        x, y = q.get()
-
-        offsets = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-        for dx, dy in offsets:
-            x2, y2 = x + dx, y + dy
-            if not in_bounds(state, x2, y2) or state.map[x2][y2] in invalid_values:
+    level = state.level
+    grid = state.grid
+    neighbours = level.neighbours
+    invalid = bytearray(256)
+    for value in invalid_values:
+        invalid[value] = 1
+
+    # The border is never valid
+    blocked = bytearray(b or invalid[value] for b, value in zip(level.border, grid))
+
+    distances = [WALL_COST] * level.cells_count
+    q = deque()
+    for cell in starts:
+        distances[cell] = 0
+        q.append(cell)
+
+    while q:
+        cell = q.popleft()
+        cost = distances[cell] + 1
+
+        for direction, next_cell in enumerate(neighbours[cell]):
+            if blocked[next_cell]:
                 continue
 
-            if restrict_pushes:
-                x3, y3 = x2 + dx, y2 + dy
-                if not in_bounds(state, x3, y3) or state.map[x3][y3] in invalid_values:
-                    continue
+            if restrict_pushes and blocked[neighbours[next_cell][direction]]:
+                continue
 
-            if distances[x2][y2] > distances[x][y] + 1:
-                distances[x2][y2] = distances[x][y] + 1
-                q.put((x2, y2))
+            if distances[next_cell] > cost:
+                distances[next_cell] = cost
+                q.append(next_cell)
 
     return distances
 
 
-def compute_reachable_positions(state: Map) -> list[list[bool]]:
-    """Compute the reachable positions from the player position."""
-    reach = [[False for _ in range(state.width)] for _ in range(state.length)]
-    q = Queue()
-
-    reach[state.player.x][state.player.y] = True
-    q.put((state.player.x, state.player.y))
-
-    while not q.empty():
-        x, y = q.get()
-
-        offsets = [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
-        for nx, ny in offsets:
-            if not in_bounds(state, nx, ny) or state.map[nx][ny] in [
-                OBSTACLE_SYMBOL,
-                BOX_SYMBOL,
-            ]:
+def compute_reachable_positions(state: Map) -> bytearray:
+    """
+    Compute the reachable positions from the player position, marked with 1
+    for each cell index.
+    """
+    grid = state.grid
+    neighbours = state.level.neighbours
+
+    player = state.player_cell
+    reach = bytearray(state.level.cells_count)
+    reach[player] = 1
+
+    q = [player]
+    for cell in q:
+        for next_cell in neighbours[cell]:
+            value = grid[next_cell]
+            if value == OBSTACLE_SYMBOL or value == BOX_SYMBOL or reach[next_cell]:
                 continue
 
-            if not reach[nx][ny]:
-                reach[nx][ny] = True
-                q.put((nx, ny))
+            reach[next_cell] = 1
+            q.append(next_cell)
 
     return reach
 
 
 def compute_distance_reachable_pushes(
-    state: Map, box: tuple[int, int], reach: list[list[bool]]
-) -> int:
+    state: Map, box: int, reach: bytearray
+) -> list[int]:
     """
-    Compute the distance from a box to all other cells, with pushes made only
-    from player-reachable positions.
+    Compute the distance from a box (cell index) to all other cells, with
+    pushes made only from player-reachable positions.
     """
-    distances = [[WALL_COST for _ in range(state.width)] for _ in range(state.length)]
-    q = Queue()
-    distances[box[0]][box[1]] = 0
-    q.put((box[0], box[1]))
+    grid = state.grid
+    offsets = state.level.offsets.values()
+
+    distances = [WALL_COST] * state.level.cells_count
+    distances[box] = 0
+    q = deque([box])
+
+    while q:
+        cell = q.popleft()
+        cost = distances[cell] + 1
+
+        for offset in offsets:
+            next_cell = cell + offset
+            if grid[next_cell] == OBSTACLE_SYMBOL or not reach[cell - offset]:
+                continue
+
+            if distances[next_cell] > cost:
+                distances[next_cell] = cost
+                q.append(next_cell)
 
-    while not q.empty():
-        x, y = q.get()
+    return distances
 
-        offsets = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-        for dx, dy in offsets:
-            px, py = x - dx, y - dy
-            tx, ty = x + dx, y + dy
 
-            if not in_bounds(state, px, py) or not in_bounds(state, tx, ty):
+def compute_level_distances(
+    level: Level, starts: list[int], restrict_pushes: bool = True
+) -> list[int]:
+    """
+    Compute the distances from a list of starting cells to all the cells of a
+    level, taking only its walls into account (same as compute_distance_matrix
+    with OBSTACLE_SYMBOL as the only invalid value).
+    Args:
+        level: The level.
+        starts: The starting cell indices.
+        restrict_pushes: If True, calculate the distance in pushes, not moves.
+    Returns:
+        The distance to each cell index, WALL_COST for the unreachable ones.
+    """
+    walls = level.walls
+    offsets = level.offsets.values()
+
+    distances = [WALL_COST] * level.cells_count
+    q = deque()
+    for cell in starts:
+        distances[cell] = 0
+        q.append(cell)
+
+    while q:
+        cell = q.popleft()
+        cost = distances[cell] + 1
+
+        for offset in offsets:
+            next_cell = cell + offset
+            if walls[next_cell]:
                 continue
-            if state.map[tx][ty] == OBSTACLE_SYMBOL or not reach[px][py]:
+
+            if restrict_pushes and walls[next_cell + offset]:
                 continue
 
-            cost = distances[x][y] + 1
-            if distances[tx][ty] > cost:
-                distances[tx][ty] = cost
-                q.put((tx, ty))
+            if distances[next_cell] > cost:
+                distances[next_cell] = cost
+                q.append(next_cell)
 
     return distances
+
+
+def grid_view(level: Level, fields: np.ndarray) -> np.ndarray:
+    """
+    View distance fields indexed by cell as 2D grids of the bordered map, e.g.
+    an array indexed by (source, cell) becomes indexed by (source, row,
+    column).
+    """
+    return fields.reshape(*fields.shape[:-1], level.length + 2, level.stride)
+
+
+def _shift(mask: np.ndarray, offset: int) -> np.ndarray:
+    """Move a mask over the cells by an offset (out[c] = mask[c - offset])."""
+    shifted = np.zeros_like(mask)
+    if offset > 0:
+        shifted[..., offset:] = mask[..., :-offset]
+    else:
+        shifted[..., :offset] = mask[..., -offset:]
+    return shifted
+
+
+def _spread(reached: np.ndarray, leaving: np.ndarray, enter: np.ndarray, offset: int):
+    """Mark in reached the cells entered by moving the leaving ones by offset."""
+    if offset > 0:
+        reached[..., offset:] |= leaving[..., :-offset] & enter[..., offset:]
+    else:
+        reached[..., :offset] |= leaving[..., -offset:] & enter[..., :offset]
+
+
+def _start_frontier(cells_count: int, starts: list[int]) -> np.ndarray:
+    """Mark each starting cell in its own row, for separate wavefronts."""
+    frontier = np.zeros((len(starts), cells_count), dtype=bool)
+    frontier[np.arange(len(starts)), starts] = True
+    return frontier
+
+
+def _wavefront(
+    frontier: np.ndarray,
+    offsets: list[int],
+    leave_masks: list[np.ndarray | None],
+    enter_masks: list[np.ndarray],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Expand the frontiers of all the rows at once (each starting from the cells
+    marked in it), one layer per iteration. For each offset, a cell of the
+    frontier is left only if it is marked in the leave mask (None allows all),
+    and the cell it moves to is entered only if it is marked in the enter
+    mask.
+    Returns:
+        The distances from the starting cells of each row to each cell,
+        indexed by (row, cell), and the cells reached by each row. As in the
+        scalar searches, the distances are capped at WALL_COST, which the
+        unreachable cells get too.
+    """
+    fields = np.full(frontier.shape, WALL_COST, dtype=np.int32)
+    visited = frontier.copy()
+    fields[frontier] = 0
+
+    distance = 0
+    reached = np.empty_like(frontier)
+    while frontier.any():
+        distance += 1
+        reached.fill(False)
+        for offset, leave, enter in zip(offsets, leave_masks, enter_masks):
+            leaving = frontier if leave is None else frontier & leave
+            _spread(reached, leaving, enter, offset)
+
+        reached &= ~visited
+        visited |= reached
+        np.copyto(fields, min(distance, WALL_COST), where=reached)
+        frontier, reached = reached, frontier
+
+    return fields, visited
+
+
+def _free_distance_fields(
+    level: Level, free: np.ndarray, frontier: np.ndarray, restrict_pushes: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    offsets = list(level.offsets.values())
+    if restrict_pushes:
+        # The cell behind the entered one must be free too
+        enter_masks = [free & _shift(free, -offset) for offset in offsets]
+    else:
+        enter_masks = [free] * len(offsets)
+
+    return _wavefront(frontier, offsets, [None] * len(offsets), enter_masks)
+
+
+def compute_distance_fields(
+    state: Map,
+    starts: list[int],
+    invalid_values: list[int],
+    restrict_pushes: bool = True,
+) -> np.ndarray:
+    """
+    Vectorized compute_distance_matrix, done separately for each starting
+    cell (the distances from all of them together are the minimum over the
+    first axis).
+    Returns:
+        The distances from each start to each cell, indexed by (start, cell).
+    """
+    grid = np.frombuffer(state.grid, dtype=np.uint8)
+    free = ~np.frombuffer(state.level.border, dtype=bool) & ~np.isin(
+        grid, invalid_values
+    )
+    frontier = _start_frontier(state.level.cells_count, starts)
+    return _free_distance_fields(state.level, free, frontier, restrict_pushes)[0]
+
+
+def compute_level_distance_fields(
+    level: Level, starts: list[int], restrict_pushes: bool = True
+) -> np.ndarray:
+    """
+    Vectorized compute_level_distances, done separately for each starting
+    cell, e.g. for all the targets of a level in one call.
+    Returns:
+        The distances from each start to each cell, indexed by (start, cell).
+    """
+    free = ~np.frombuffer(level.walls, dtype=bool)
+    frontier = _start_frontier(level.cells_count, starts)
+    return _free_distance_fields(level, free, frontier, restrict_pushes)[0]
+
+
+def compute_level_reachable(
+    level: Level, starts: list[int], restrict_pushes: bool = True
+) -> np.ndarray:
+    """
+    Mark the cells of a level reachable from any of the starting cells, at
+    any distance (the distances stop at WALL_COST, so they can't tell the
+    far cells from the unreachable ones).
+    """
+    free = ~np.frombuffer(level.walls, dtype=bool)
+    frontier = np.zeros((1, level.cells_count), dtype=bool)
+    frontier[0, starts] = True
+    return _free_distance_fields(level, free, frontier, restrict_pushes)[1][0]
+
+
+def compute_reachable_push_fields(
+    state: Map, boxes: list[int], reach: bytearray
+) -> np.ndarray:
+    """
+    Vectorized compute_distance_reachable_pushes, for several boxes at once.
+    The cell of each box is considered reachable for its own pushes.
+    Returns:
+        The distances from each box to each cell, indexed by (box, cell).
+    """
+    level = state.level
+    offsets = list(level.offsets.values())
+    free = np.frombuffer(state.grid, dtype=np.uint8) != OBSTACLE_SYMBOL
+
+    box_reach = np.tile(np.frombuffer(reach, dtype=bool), (len(boxes), 1))
+    box_reach[np.arange(len(boxes)), boxes] = True
+
+    # A box is pushed from a cell if the player can reach the one behind it
+    leave_masks = [_shift(box_reach, offset) for offset in offsets]
+    frontier = _start_frontier(level.cells_count, boxes)
+    return _wavefront(frontier, offsets, leave_masks, [free] * len(offsets))[0]
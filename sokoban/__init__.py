@@ -2,6 +2,8 @@ from .dummy import Dummy
 from .box import Box
 from .player import Player
 from .map import Map
+from .level import Level
+from .state import State
 from .moves import (
     LEFT, 
     RIGHT, 
@@ -14,4 +16,6 @@ from .moves import (
     moves_meaning
 )
 
-from .gif import save_images, create_gif
\ No newline at end of file
+from .gif import save_images, create_gif
+from .render import render_state, save_gif
+from .xsb import read_xsb, write_xsb, load_levels
\ No newline at end of file
@@ -0,0 +1,120 @@
+from .moves import *
+
+from functools import lru_cache
+from random import Random
+
+__all__ = ['Level']
+
+# Fixed seed, so the keys of the states of a level are the same in every process
+ZOBRIST_SEED = 0x50B0BA
+
+
+class Level:
+    '''
+    Level Class records the static part of a board: its dimensions, the walls
+    and the targets. A single Level object is shared by every state explored
+    while solving the same map.
+
+    Cells are addressed by a flat index into the map surrounded by a border of
+    walls, so moving from a cell never needs a bounds check.
+
+    Attributes:
+    length: length of the map
+    width: width of the map
+    stride: length of a row of the bordered map (width + 2)
+    obstacles: tuple of obstacle positions, as given to the map
+    targets: tuple of target positions, as given to the map
+    walls: bytearray marking the wall cells of the bordered map with 1
+    border: bytearray marking the cells of the border with 1
+    target_cells: sorted tuple of the cell indices of the targets
+    target_set: frozenset of the cell indices of the targets
+    offsets: dictionary with the cell offset of each move
+    move_offsets: cell offset of each move code, box moves included
+    neighbours: the 4 neighbour cells of each cell, in the order of offsets
+    zobrist_player: random 64-bit codes of the player, for each cell
+    zobrist_boxes: random 64-bit codes of a box, for each cell
+    '''
+    def __init__(self, length, width, obstacles, targets):
+        self.length = length
+        self.width = width
+        self.stride = width + 2
+        self.obstacles = tuple(obstacles)
+        self.targets = tuple(targets)
+
+        self.walls = bytearray(b'\x01' * (self.stride * (length + 2)))
+        for x in range(length):
+            for y in range(width):
+                self.walls[self.index(x, y)] = 0
+        self.border = bytearray(self.walls)
+
+        for obstacle_x, obstacle_y in self.obstacles:
+            self.walls[self.index(obstacle_x, obstacle_y)] = 1
+
+        self.target_cells = tuple(sorted(self.index(x, y) for x, y in self.targets))
+        self.target_set = frozenset(self.target_cells)
+
+        self.offsets = {
+            LEFT: -1,
+            RIGHT: 1,
+            UP: self.stride,
+            DOWN: -self.stride,
+        }
+
+        self.move_offsets = [0] * (BOX_DOWN + 1)
+        for move, offset in self.offsets.items():
+            self.move_offsets[move] = offset
+            self.move_offsets[move + BOX_LEFT - LEFT] = offset
+
+        # The cells of the border are never left, they have no neighbours
+        self.neighbours = [
+            () if self.border[cell] else tuple(cell + offset for offset in self.offsets.values())
+            for cell in range(len(self.walls))
+        ]
+
+        rng = Random(ZOBRIST_SEED)
+        self.zobrist_player = [rng.getrandbits(64) for _ in range(self.cells_count)]
+        self.zobrist_boxes = [rng.getrandbits(64) for _ in range(self.cells_count)]
+
+    @classmethod
+    def get(cls, length, width, obstacles, targets):
+        ''' Returns the shared level object for the given layout'''
+        return _cached_level(
+            length,
+            width,
+            tuple(tuple(obstacle) for obstacle in obstacles),
+            tuple(tuple(target) for target in targets),
+        )
+
+    def __reduce__(self):
+        # Unpickled levels are shared too (e.g. in worker processes)
+        return (Level.get, (self.length, self.width, self.obstacles, self.targets))
+
+    @property
+    def cells_count(self):
+        ''' Returns the number of cells of the bordered map'''
+        return len(self.walls)
+
+    def index(self, x, y):
+        ''' Returns the cell index of a position'''
+        return (x + 1) * self.stride + y + 1
+
+    def position(self, cell):
+        ''' Returns the position of a cell index'''
+        x, y = divmod(cell, self.stride)
+        return (x - 1, y - 1)
+
+    def zobrist_hash(self, player, boxes):
+        ''' Returns the zobrist hash of a player cell and some box cells'''
+        key = self.zobrist_player[player]
+        for cell in boxes:
+            key ^= self.zobrist_boxes[cell]
+        return key
+
+    def __str__(self):
+        ''' Overriding toString method for Level class'''
+        return f'Level {self.length}x{self.width}, {len(self.targets)} targets'
+
+
+@lru_cache(maxsize=64)
+def _cached_level(length, width, obstacles, targets):
+    return Level(length, width, obstacles, targets)
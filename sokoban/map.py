@@ -1,5 +1,7 @@
 from .player import Player
 from .box import Box
+from .level import Level
+from .state import State
 from .moves import *
 
 from matplotlib import pyplot as plt
@@ -12,6 +14,16 @@ BOX_SYMBOL = 2
 TARGET_SYMBOL = 3
 
 
+class _LevelLoader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+    ''' Safe yaml loader, that only allows the tuples of the level files'''
+
+
+_LevelLoader.add_constructor(
+    'tag:yaml.org,2002:python/tuple',
+    lambda loader, node: tuple(loader.construct_sequence(node)),
+)
+
+
 class Map:
     '''
     Map Class records the state of the board
@@ -24,22 +36,33 @@ class Map:
     boxes: list of box objects, positioned on the map
     obstacles: list of obstacles given as tuples for positions on the map
     targets: list of target objects, positioned on the map
-    map: 2D matrix representing the map
+    grid: flat map, with the cell indices of the level and a border of walls
+    map: 2D matrix representing the map (read-only view of the grid)
+    level: static part of the map, shared between all the copies of the map
+    hash: zobrist hash of the player and boxes positions, updated on each move
+    player_region: smallest cell index the player can walk to, when known, in
+    which case states with the same boxes and region share their key
+    last_moves: moves made from the state this one was generated from
+    heuristic_cache: values saved by the heuristics for the state, inherited
+    by its copies so they can be updated incrementally
     explored_states: number of explored states
     undo_moves: number of undo moves made // e.g. _ P B => P B _
     '''
     def __init__(self, length, width, player_x, player_y, boxes, targets, obstacles, test_name='test'):
         self.length = length
         self.width = width
-        self.map = [[0 for _ in range(width)] for _ in range(length)]
         self.obstacles = obstacles
         self.test_name = test_name
+        self.level = Level.get(length, width, obstacles, targets)
+
+        # Flat map, with the same cell indices (and wall border) as the level
+        self.grid = bytearray(OBSTACLE_SYMBOL * wall for wall in self.level.walls)
 
         self.explored_states = 0
         self.undo_moves = 0
-
-        for obstacle_x, obstacle_y in self.obstacles:
-            self.map[obstacle_x][obstacle_y] = OBSTACLE_SYMBOL
+        self.player_region = None
+        self.last_moves = ()
+        self.heuristic_cache = {}
 
         self.player = Player('player', 'P', player_x, player_y)
 
@@ -53,12 +76,20 @@ class Map:
 
             self.positions_of_boxes[(box_x, box_y)] = box_name
 
-            self.map[box_x][box_y] = BOX_SYMBOL
+            self.grid[self.level.index(box_x, box_y)] = BOX_SYMBOL
 
         self.targets = []
         for target_x, target_y in targets:
             self.targets.append((target_x, target_y))
-            self.map[target_x][target_y] = TARGET_SYMBOL
+
+            # Boxes placed on targets stay on the map
+            if (target_x, target_y) not in self.positions_of_boxes:
+                self.grid[self.level.index(target_x, target_y)] = TARGET_SYMBOL
+
+        self.hash = self.level.zobrist_hash(
+            self.level.index(player_x, player_y),
+            [self.level.index(box.x, box.y) for box in self.boxes.values()],
+        )
 
     @classmethod
     def from_str(cls, state_str):
@@ -93,7 +124,12 @@ class Map:
     @classmethod
     def from_yaml(cls, path):
         with open(path, 'r') as file:
-            data = yaml.load(file, Loader=yaml.FullLoader)
+            return cls.from_yaml_str(file.read(), path.split('/')[-1].split('.')[0])
+
+    @classmethod
+    def from_yaml_str(cls, yaml_str, test_name='test'):
+        ''' Loads a map from the contents of a yaml level file'''
+        data = yaml.load(yaml_str, Loader=_LevelLoader)
 
         return cls(
             length=data['height'], 
@@ -103,67 +139,44 @@ class Map:
             boxes=data['boxes'], 
             targets=data['targets'], 
             obstacles=data['walls'], 
-            test_name=path.split('/')[-1].split('.')[0]
+            test_name=test_name
         )
 
-    def object_in_bounds_move(self, checking_object, move):
-        ''' Checks if the object moves inside the map'''
-        if move == LEFT:
-            if checking_object.y == 0:
-                return False
-        elif move == RIGHT:
-            if checking_object.y == self.width - 1:
-                return False
-        elif move == DOWN:
-            if checking_object.x == 0:
-                return False
-        elif move == UP:
-            if checking_object.x == self.length - 1:
-                return False
-        else:
-            raise ValueError('object_in_bounds_move outside range error')
+    @property
+    def map(self):
+        ''' 2D matrix representing the map (built from the flat map)'''
+        return [
+            list(self.grid[self.level.index(i, 0):self.level.index(i, self.width)])
+            for i in range(self.length)
+        ]
 
-        return True
+    @property
+    def player_cell(self):
+        ''' Returns the cell index of the player'''
+        return self.level.index(self.player.x, self.player.y)
+
+    def cell_free_for_box(self, cell):
+        ''' Checks if a box can be moved on a cell (no obstacle or another box)'''
+        value = self.grid[cell]
+        return value != OBSTACLE_SYMBOL and value != BOX_SYMBOL
 
     def object_valid_move(self, checking_object, move):
         ''' Checks if the object moves outside the map / hits an obstacle or a box'''
-
-        if not self.object_in_bounds_move(checking_object, move):
-            return False
-
-        future_position = checking_object.get_future_position(move)
-
-        if not future_position:
-            raise ValueError('object_valid_move future position doesn\'t exist')
-
-        x, y = future_position
-
-        # Future position is outside the map
-        # if x < 0 or x >= self.length or y < 0 or y >= self.width:
-        #     return False
-
-        if self.map[x][y] == OBSTACLE_SYMBOL:
-            return False
-
-        if self.map[x][y] == BOX_SYMBOL:
-            return False
-
-        return True
+        cell = self.level.index(checking_object.x, checking_object.y)
+        return self.cell_free_for_box(cell + self.level.move_offsets[move])
 
     def player_valid_move(self, move):
         ''' Checks if the player moves outside the map / hits an obstacle'''
+        offset = self.level.move_offsets[move]
+        future_cell = self.player_cell + offset
+        value = self.grid[future_cell]
 
-        if not self.object_in_bounds_move(self.player, move):
-            return False
-
-        future_position = self.player.get_future_position(move)
-
-        if self.map[future_position[0]][future_position[1]] == OBSTACLE_SYMBOL:
+        if value == OBSTACLE_SYMBOL:
             return False
 
-        if future_position in self.positions_of_boxes:
-            box = self.boxes[self.positions_of_boxes[future_position]]
-            return self.object_valid_move(box, move)
+        # The player pushes the box in front of him
+        if value == BOX_SYMBOL:
+            return self.cell_free_for_box(future_cell + offset)
 
         return True
 
@@ -181,27 +194,18 @@ class Map:
 
         # Moves higher than 4 highlight the player carrying the box
         # The real, implicit move is the move - 4
-        implicit_move = move - 4
-
-        if self.player_valid_move(implicit_move):
-            # Player gets in the position of the box
-            future_position = self.player.get_future_position(implicit_move)
-
-            # Or player gets to an empty space and drags the box behind him
-            # Case in which the box is in the opposite position of the player for the move
-
-            straight_move_flag = False
-            if self.map[future_position[0]][future_position[1]] == BOX_SYMBOL:
-                straight_move_flag = self.object_valid_move(self.boxes[self.positions_of_boxes[future_position]], implicit_move)
+        if not self.player_valid_move(move - 4):
+            return False
 
-            opposite_position = self.player.get_opposite_position(implicit_move)
-            if 0 <= opposite_position[0] < self.length and 0 <= opposite_position[1] < self.width:
-                if self.map[opposite_position[0]][opposite_position[1]] == BOX_SYMBOL:
-                    straight_move_flag = (straight_move_flag or self.object_valid_move(self.boxes[self.positions_of_boxes[opposite_position]], implicit_move))
+        offset = self.level.move_offsets[move]
+        player_cell = self.player_cell
 
-            return straight_move_flag
+        # Player gets in the position of the box
+        if self.grid[player_cell + offset] == BOX_SYMBOL:
+            return True
 
-        return False
+        # Or player gets to an empty space and drags the box behind him
+        return self.grid[player_cell - offset] == BOX_SYMBOL
 
     def is_valid_move(self, move):
         ''' Checks if the move is valid'''
@@ -218,61 +222,70 @@ class Map:
     def apply_move(self, move):
         ''' Applies the move to the map'''
 
-        if move < BOX_LEFT:
-            if self.player_valid_move(move):
-                future_position = self.player.get_future_position(move)
-                if self.map[future_position[0]][future_position[1]] == BOX_SYMBOL:
-                    box = self.boxes[self.positions_of_boxes[future_position]]
-
-                    # Update the position of the box in the dictionary
-                    del self.positions_of_boxes[(box.x, box.y)]
-                    self.map[box.x][box.y] = 0
-
-                    box.make_move(move)
-                    self.map[box.x][box.y] = BOX_SYMBOL
-                    self.positions_of_boxes[(box.x, box.y)] = box.name
-
-                self.player.make_move(move)
-            else:
-                raise ValueError('Apply Error: Got to make an invalid move')
-        elif move <= BOX_DOWN:
-            # Moves higher than 4 highlight the player carrying the box
-            # The real, implicit move is the move - 4
-            implicit_move = move - 4
-
-            if self.box_valid_move(move):
-                future_position = self.player.get_future_position(implicit_move)
-                if future_position in self.positions_of_boxes:
-                    box = self.boxes[self.positions_of_boxes[future_position]]
-                else:
-                    opposite_position = self.player.get_opposite_position(implicit_move)
-
-                    if not opposite_position in self.positions_of_boxes:
-                        raise ValueError('Player has to be next to the box to push it')
-
-                    box = self.boxes[self.positions_of_boxes[opposite_position]]
-                    self.undo_moves += 1
-
-                # Update the position of the box in the dictionary
-                del self.positions_of_boxes[(box.x, box.y)]
-                self.map[box.x][box.y] = 0
-
-                box.make_move(implicit_move)
-                self.map[box.x][box.y] = BOX_SYMBOL
-                self.positions_of_boxes[(box.x, box.y)] = box.name
-
-                self.player.make_move(implicit_move)
-            else:
-                raise ValueError('Apply Error: Got to make an invalid move')
-        else:
+        if move < LEFT or move > BOX_DOWN or not self.is_valid_move(move):
             raise ValueError('Apply Error: Got to make an invalid move')
 
+        offset = self.level.move_offsets[move]
+        player_cell = self.player_cell
+        future_cell = player_cell + offset
+
+        if self.grid[future_cell] == BOX_SYMBOL:
+            self._move_box(future_cell, offset)
+        elif move >= BOX_LEFT:
+            # Box moves without a box in front of the player are pulls
+            self._move_box(player_cell - offset, offset)
+            self.undo_moves += 1
+
+        zobrist = self.level.zobrist_player
+        self.hash ^= zobrist[player_cell] ^ zobrist[future_cell]
+        self.player.x, self.player.y = self.level.position(future_cell)
+
         self.explored_states += 1
+        self.player_region = None
+        self.last_moves = (move,)
+
+    def _move_box(self, cell, offset):
+        ''' Moves the box on a cell with the offset'''
+        level = self.level
+        future_cell = cell + offset
+
+        # Update the position of the box in the dictionary
+        position = level.position(cell)
+        box = self.boxes[self.positions_of_boxes.pop(position)]
+        box.x, box.y = level.position(future_cell)
+        self.positions_of_boxes[(box.x, box.y)] = box.name
+
+        # Regenerate the target on the map, if the box moved off it
+        self.grid[cell] = TARGET_SYMBOL if cell in level.target_set else 0
+        self.grid[future_cell] = BOX_SYMBOL
+
+        zobrist = level.zobrist_boxes
+        self.hash ^= zobrist[cell] ^ zobrist[future_cell]
+
+    def set_player_position(self, x, y):
+        ''' Moves the player on a free position, without walking there'''
+        cell = self.level.index(x, y)
+        if not self.cell_free_for_box(cell):
+            raise ValueError('Player has to be placed on a free position')
+
+        zobrist = self.level.zobrist_player
+        self.hash ^= zobrist[self.player_cell] ^ zobrist[cell]
+        self.player.x = x
+        self.player.y = y
+        self.player_region = None
+
+    @property
+    def key(self):
+        '''
+        Returns a hashable key of the state, used for deduplicating and
+        ordering states. Equal states have equal keys. When the player region
+        is known, the player is replaced by the region in the key.
+        '''
+        if self.player_region is None:
+            return self.hash
 
-        # Regenerate the targets on the map, if the box moved off them
-        for target_x, target_y in self.targets:
-            if (target_x, target_y) not in self.positions_of_boxes:
-                self.map[target_x][target_y] = TARGET_SYMBOL
+        zobrist = self.level.zobrist_player
+        return self.hash ^ zobrist[self.player_cell] ^ zobrist[self.player_region]
 
     def is_solved(self):
         ''' Checks if all the boxes are on the targets'''
@@ -292,13 +305,69 @@ class Map:
 
     def copy(self):
         ''' Returns a copy of the current state'''
-        new_map = Map(self.length, self.width, self.player.x, self.player.y, [(box.name, box.x, box.y) for box in self.boxes.values()], self.targets, self.obstacles)
-        new_map.map = [row.copy() for row in self.map]
+        # Bypass __init__, the static part of the map is shared with the copy
+        new_map = Map.__new__(Map)
+        new_map.length = self.length
+        new_map.width = self.width
+        new_map.obstacles = self.obstacles
+        new_map.targets = self.targets
+        new_map.test_name = self.test_name
+        new_map.level = self.level
+
+        new_map.grid = self.grid.copy()
+        new_map.player = Player(self.player.name, self.player.symbol, self.player.x, self.player.y)
+        new_map.boxes = {name: Box(name, box.symbol, box.x, box.y) for name, box in self.boxes.items()}
         new_map.positions_of_boxes = self.positions_of_boxes.copy()
         new_map.explored_states = self.explored_states
         new_map.undo_moves = self.undo_moves
+        new_map.hash = self.hash
+        new_map.player_region = self.player_region
+        new_map.last_moves = self.last_moves
+        new_map.heuristic_cache = self.heuristic_cache.copy()
+        return new_map
+
+    @classmethod
+    def from_state(cls, state, test_name='test'):
+        ''' Returns the map of a compact state, sharing the level of the state'''
+        level = state.level
+
+        # Bypass __init__, like copy
+        new_map = cls.__new__(cls)
+        new_map.length = level.length
+        new_map.width = level.width
+        new_map.obstacles = level.obstacles
+        new_map.targets = [tuple(target) for target in level.targets]
+        new_map.test_name = test_name
+        new_map.level = level
+
+        new_map.grid = bytearray(level.walls)
+        for cell in level.target_cells:
+            new_map.grid[cell] = TARGET_SYMBOL
+
+        player_x, player_y = level.position(state.player)
+        new_map.player = Player('player', 'P', player_x, player_y)
+
+        new_map.boxes = {}
+        new_map.positions_of_boxes = {}
+        for cell in state.boxes:
+            box_x, box_y = level.position(cell)
+            box_name = f"box{box_x}_{box_y}"
+            new_map.boxes[box_name] = Box(box_name, 'B', box_x, box_y)
+            new_map.positions_of_boxes[(box_x, box_y)] = box_name
+            new_map.grid[cell] = BOX_SYMBOL
+
+        new_map.explored_states = 0
+        new_map.undo_moves = 0
+        new_map.hash = state.key
+        new_map.player_region = None
+        new_map.last_moves = ()
+        new_map.heuristic_cache = {}
         return new_map
 
+    def to_state(self):
+        ''' Returns the compact, immutable state of the map'''
+        return State.from_map(self)
+
     def get_neighbours(self):
         ''' Returns the neighbours of the current state'''
         neighbours = []
@@ -388,26 +457,20 @@ class Map:
         self._create_figure(show=False, save_path=save_path, save_name=save_name)
 
     def __lt__(self, other):
-        return str(self) < str(other)
+        return self.key < other.key
 
     def __str__(self):
         ''' Overriding toString method for Map class'''
-        name = ''
+        symbols = ['_ ', '/ ', 'B ', 'X ']
+
+        rows = []
         for i in range(self.length):
-            for j in range(self.width):
-                if self.player.x == i and self.player.y == j:
-                    name += f"{self.player.get_symbol()} "
-                elif self.map[i][j] == 1:
-                    name += f"/ "
-                elif self.map[i][j] == 2:
-                    name += f"B "
-                elif self.map[i][j] == 3:
-                    name += f"X "
-                else:
-                    name += f"_ "
-
-            name += '\n'
-
-        pieces = name.split('\n')
-        aligned_corner  = reversed(pieces)
-        return '\n'.join(aligned_corner)
+            start = self.level.index(i, 0)
+            row = [symbols[value] for value in self.grid[start:start + self.width]]
+            if self.player.x == i:
+                row[self.player.y] = f"{self.player.get_symbol()} "
+            rows.append(''.join(row))
+
+        # The first row is at the bottom of the map
+        rows.append('')
+        return '\n'.join(reversed(rows))
@@ -0,0 +1,265 @@
+from .map import Map, BOX_SYMBOL
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+import os
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+__all__ = ['Renderer', 'render_state', 'save_gif']
+
+# Side of the square drawn for each cell, in pixels
+TILE_SIZE = 24
+
+# Palette of the frames: the colours of the map values (as in the plots of the
+# maps), then the markers of the player, the boxes and the targets
+FLOOR_COLOUR = 0
+WALL_COLOUR = 1
+BOX_COLOUR = 2
+TARGET_COLOUR = 3
+PLAYER_MARKER = 4
+BOX_MARKER = 5
+TARGET_MARKER = 6
+GRID_COLOUR = 7
+PALETTE = [
+    (68, 1, 84),
+    (49, 104, 142),
+    (53, 183, 121),
+    (253, 231, 37),
+    (255, 0, 0),
+    (0, 0, 255),
+    (0, 128, 0),
+    (0, 0, 0),
+]
+
+# Tiles drawn for the cells, after their map value (floor, wall, box, target)
+BOX_ON_TARGET_TILE = 4
+PLAYER_TILE = 5
+PLAYER_ON_TARGET_TILE = 6
+TILES_COUNT = 7
+
+# Steps of a solution encoded by each task of the worker pool
+CHUNK_STEPS = 256
+
+
+def _make_tiles(tile_size: int) -> np.ndarray:
+    ''' Returns the palette indices of each tile, drawn as the map plots'''
+    centre = (tile_size - 1) / 2
+    rows, cols = np.mgrid[0:tile_size, 0:tile_size] - centre
+
+    player = rows ** 2 + cols ** 2 <= (tile_size * 0.35) ** 2
+    box = np.maximum(abs(rows), abs(cols)) <= tile_size * 0.25
+    cross = (
+        (np.maximum(abs(rows), abs(cols)) <= tile_size * 0.25)
+        & (np.minimum(abs(rows - cols), abs(rows + cols)) <= max(tile_size / 12, 1))
+    )
+
+    tiles = np.empty((TILES_COUNT, tile_size, tile_size), dtype=np.uint8)
+    tiles[:] = np.array(
+        [FLOOR_COLOUR, WALL_COLOUR, BOX_COLOUR, TARGET_COLOUR, BOX_COLOUR, FLOOR_COLOUR, TARGET_COLOUR],
+        dtype=np.uint8,
+    )[:, None, None]
+
+    # Same drawing order as the plots: the player, the boxes, then the targets
+    tiles[PLAYER_TILE][player] = PLAYER_MARKER
+    tiles[PLAYER_ON_TARGET_TILE][player] = PLAYER_MARKER
+    tiles[BOX_SYMBOL][box] = BOX_MARKER
+    tiles[BOX_ON_TARGET_TILE][box] = BOX_MARKER
+    for tile in (TARGET_COLOUR, BOX_ON_TARGET_TILE, PLAYER_ON_TARGET_TILE):
+        tiles[tile][cross] = TARGET_MARKER
+
+    # Grid lines between the cells
+    tiles[:, -1, :] = GRID_COLOUR
+    tiles[:, :, -1] = GRID_COLOUR
+    return tiles
+
+
+class Renderer:
+    '''
+    Renderer Class draws the states of a level into a frame of palette
+    indices, tile by tile. Only the cells that changed since the last state
+    drawn are drawn again.
+
+    Attributes:
+    level: the level of the states drawn
+    tile_size: side of the square of each cell, in pixels
+    frame: the last frame drawn (the first row of the map is at the bottom)
+    '''
+    def __init__(self, level, tile_size: int = TILE_SIZE):
+        self.level = level
+        self.tile_size = tile_size
+        self.tiles = _make_tiles(tile_size)
+
+        length, width = level.length, level.width
+        self.frame = np.zeros((length * tile_size, width * tile_size), dtype=np.uint8)
+
+        # Cell index of each tile of the frame, whose first row is the last
+        # one of the map
+        self._cells = np.array(
+            [[level.index(x, y) for y in range(width)] for x in reversed(range(length))],
+            dtype=np.intp,
+        ).reshape(length, width)
+        target_set = level.target_set
+        self._targets = np.array(
+            [[cell in target_set for cell in row] for row in self._cells.tolist()],
+            dtype=bool,
+        ).reshape(length, width)
+
+        # Tile drawn for each cell, none at first
+        self._codes = None
+
+    def draw(self, state: Map) -> Optional[Tuple[int, int, int, int]]:
+        '''
+        Draws a state over the last one. Returns the box of the pixels that
+        changed (left, upper, right, lower), None if none did.
+        '''
+        grid = np.frombuffer(state.grid, dtype=np.uint8)
+        codes = grid[self._cells]
+        codes[self._targets & (codes == BOX_SYMBOL)] = BOX_ON_TARGET_TILE
+
+        row = self.level.length - 1 - state.player.x
+        column = state.player.y
+        codes[row, column] = PLAYER_ON_TARGET_TILE if self._targets[row, column] else PLAYER_TILE
+
+        size = self.tile_size
+        if self._codes is None:
+            length, width = codes.shape
+            self.frame[:] = self.tiles[codes].transpose(0, 2, 1, 3).reshape(self.frame.shape)
+            self._codes = codes
+            return (0, 0, width * size, length * size)
+
+        rows, columns = np.nonzero(codes != self._codes)
+        if not len(rows):
+            return None
+
+        for r, c in zip(rows.tolist(), columns.tolist()):
+            self.frame[r * size:(r + 1) * size, c * size:(c + 1) * size] = self.tiles[codes[r, c]]
+        self._codes = codes
+
+        return (
+            int(columns.min()) * size,
+            int(rows.min()) * size,
+            (int(columns.max()) + 1) * size,
+            (int(rows.max()) + 1) * size,
+        )
+
+    def image(self) -> Image.Image:
+        ''' Returns the last frame drawn as a palette image'''
+        image = Image.fromarray(self.frame)
+        image.putpalette([value for colour in PALETTE for value in colour])
+        return image
+
+
+def render_state(state: Map, tile_size: int = TILE_SIZE) -> Image.Image:
+    ''' Returns the image of a state'''
+    renderer = Renderer(state.level, tile_size)
+    renderer.draw(state)
+    return renderer.image()
+
+
+def _encode_frame(renderer: Renderer, box: Optional[Tuple[int, int, int, int]], duration: int) -> bytes:
+    ''' Returns the GIF frame drawing the pixels of the box over the last frame'''
+    if box is None:
+        # Nothing changed, the frame still lasts its duration
+        box = (0, 0, 1, 1)
+
+    left, upper, right, lower = box
+    # The indices are written as they are, into the global palette
+    image = Image.fromarray(renderer.frame[upper:lower, left:right])
+    return b''.join(GifImagePlugin.getdata(image, (left, upper), duration=duration))
+
+
+def _encode_steps(
+    state: Map,
+    steps_moves: Sequence[Sequence[int]],
+    tile_size: int,
+    duration: int
+) -> bytes:
+    ''' Returns the GIF frames of the steps following a state'''
+    state = state.copy()
+    renderer = Renderer(state.level, tile_size)
+    renderer.draw(state)
+
+    frames = []
+    for moves in steps_moves:
+        for move in moves:
+            state.apply_move(move)
+        frames.append(_encode_frame(renderer, renderer.draw(state), duration))
+
+    return b''.join(frames)
+
+
+def _encode_chunk(args: tuple) -> bytes:
+    return _encode_steps(*args)
+
+
+def _chunks(
+    initial_state: Map,
+    steps_moves: Iterable[Sequence[int]],
+    chunk_steps: int
+) -> Iterator[Tuple[Map, List[Sequence[int]]]]:
+    ''' Yields the steps split in chunks, along with the state before each chunk'''
+    state = initial_state.copy()
+    start_state = state.copy()
+    chunk = []
+    for moves in steps_moves:
+        chunk.append(moves)
+        for move in moves:
+            state.apply_move(move)
+
+        if len(chunk) == chunk_steps:
+            yield start_state, chunk
+            start_state = state.copy()
+            chunk = []
+
+    if chunk:
+        yield start_state, chunk
+
+
+def save_gif(
+    initial_state: Map,
+    steps_moves: Iterable[Sequence[int]],
+    path: str,
+    duration: float = 0.5,
+    tile_size: int = TILE_SIZE,
+    workers: int = 0,
+    loop: int = 0,
+) -> None:
+    '''
+    Saves the steps of a game as a gif: the initial state, then the state
+    after each step's moves. The frames are drawn straight into a buffer and
+    written as they are encoded, each one holding only the cells that changed.
+
+    duration: seconds each frame is shown
+    workers: processes encoding chunks of steps in parallel (0 to encode
+    them in this process)
+    loop: number of times the gif is played (0 for forever)
+    '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    duration = int(duration * 1000)
+    renderer = Renderer(initial_state.level, tile_size)
+    renderer.draw(initial_state)
+
+    with open(path, 'wb') as file:
+        header, _ = GifImagePlugin.getheader(renderer.image(), info={'loop': loop, 'duration': duration})
+        file.write(b''.join(header))
+        file.write(_encode_frame(renderer, (0, 0) + renderer.image().size, duration))
+
+        if workers:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunks = _chunks(initial_state, steps_moves, CHUNK_STEPS)
+                for frames in pool.map(_encode_chunk, ((s, c, tile_size, duration) for s, c in chunks)):
+                    file.write(frames)
+        else:
+            state = initial_state.copy()
+            for moves in steps_moves:
+                for move in moves:
+                    state.apply_move(move)
+                file.write(_encode_frame(renderer, renderer.draw(state), duration))
+
+        # Trailer
+        file.write(b';')
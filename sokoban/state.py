@@ -0,0 +1,67 @@
+__all__ = ['State']
+
+
+class State:
+    '''
+    State Class is a compact, immutable snapshot of a board: the player and
+    box cells, the static part of the board living in the shared level
+    object. It keeps the nodes of the A* frontier and IDA* stack (turned back
+    into maps when expanded) and of the bidirectional search. The maps of the
+    other solvers still copy their player and box objects for every node.
+
+    Attributes:
+    level: the level the state belongs to
+    player: cell index of the player
+    boxes: sorted tuple of the cell indices of the boxes
+    key: zobrist hash of the state, equal to the key of the matching map
+    '''
+    __slots__ = ('level', 'player', 'boxes', 'key')
+
+    def __init__(self, level, player, boxes):
+        object.__setattr__(self, 'level', level)
+        object.__setattr__(self, 'player', player)
+        object.__setattr__(self, 'boxes', tuple(sorted(boxes)))
+        object.__setattr__(self, 'key', level.zobrist_hash(player, self.boxes))
+
+    @classmethod
+    def from_map(cls, state):
+        ''' Returns the compact state of a map'''
+        level = state.level
+        boxes = [level.index(box.x, box.y) for box in state.boxes.values()]
+        return cls(level, level.index(state.player.x, state.player.y), boxes)
+
+    def to_map(self, test_name='test'):
+        ''' Returns a map of the state'''
+        from .map import Map
+
+        return Map.from_state(self, test_name)
+
+    def is_solved(self):
+        ''' Checks if all the boxes are on the targets'''
+        return self.level.target_set.issubset(self.boxes)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('State objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('State objects are immutable')
+
+    def __reduce__(self):
+        return (State, (self.level, self.player, self.boxes))
+
+    def __eq__(self, other):
+        if not isinstance(other, State):
+            return NotImplemented
+
+        return (
+            self.player == other.player
+            and self.boxes == other.boxes
+            and self.level is other.level
+        )
+
+    def __hash__(self):
+        return self.key
+
+    def __str__(self):
+        ''' Overriding toString method for State class'''
+        return f'State with player at {self.player}, boxes at {self.boxes}'
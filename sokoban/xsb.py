@@ -0,0 +1,337 @@
+from .map import Map, OBSTACLE_SYMBOL, BOX_SYMBOL, TARGET_SYMBOL
+
+from typing import Iterable, Iterator, List, Optional
+import hashlib
+import os
+import re
+
+import numpy as np
+
+__all__ = ['parse_xsb', 'iter_xsb_levels', 'read_xsb', 'to_xsb', 'write_xsb', 'load_levels']
+
+# Characters of the XSB format
+XSB_WALL = '#'
+XSB_PLAYER = '@'
+XSB_PLAYER_ON_TARGET = '+'
+XSB_BOX = '$'
+XSB_BOX_ON_TARGET = '*'
+XSB_TARGET = '.'
+XSB_FLOORS = ' -_'
+
+BOARD_CHARACTERS = set('#@+$*.' + XSB_FLOORS)
+
+# Run-length encoded rows (e.g. "3#") and the row separator of the SOK format
+RLE_PATTERN = re.compile(r'(\d+)(\D)')
+ROW_SEPARATOR = '|'
+
+# Directory created next to the level packs, holding their compiled levels
+CACHE_DIR_NAME = '__levelcache__'
+CACHE_VERSION = 1
+
+YAML_EXTENSIONS = ('.yaml', '.yml')
+
+
+def _board_rows(line: str) -> Optional[List[str]]:
+    ''' Returns the board rows of a line of a level pack, None if it is not a board line'''
+    line = line.rstrip('\r\n')
+    if any(c.isdigit() for c in line):
+        line = RLE_PATTERN.sub(lambda m: m.group(2) * int(m.group(1)), line)
+
+    if not line.strip() or not set(line) <= BOARD_CHARACTERS | {ROW_SEPARATOR}:
+        return None
+
+    rows = line.split(ROW_SEPARATOR)
+    if not any(XSB_WALL in row for row in rows):
+        return None
+
+    return rows
+
+
+def parse_xsb(rows: List[str], name: str = 'test') -> Map:
+    '''
+    Returns the map of a level given by its XSB rows (the first row is the top
+    one). The floor outside the walls of the level is turned into obstacles,
+    and the map is cropped to the floor, as its edges already act as walls.
+    '''
+    length = len(rows)
+    width = max((len(row) for row in rows), default=0)
+
+    player = None
+    boxes = []
+    targets = []
+    walls = set()
+    for i, row in enumerate(rows):
+        # The first row of the map is at the bottom
+        x = length - 1 - i
+        for y, cell in enumerate(row.ljust(width)):
+            if cell == XSB_WALL:
+                walls.add((x, y))
+                continue
+
+            if cell in (XSB_PLAYER, XSB_PLAYER_ON_TARGET):
+                player = (x, y)
+            if cell in (XSB_BOX, XSB_BOX_ON_TARGET):
+                boxes.append((x, y))
+            if cell in (XSB_TARGET, XSB_PLAYER_ON_TARGET, XSB_BOX_ON_TARGET):
+                targets.append((x, y))
+
+    if player is None:
+        raise ValueError(f'Level {name} has no player')
+
+    # Flood the floor from the edges of the map, what is reached lies outside
+    # the walls (unless the walls are open)
+    outside = {
+        (x, y)
+        for x in range(length)
+        for y in range(width)
+        if (x in (0, length - 1) or y in (0, width - 1)) and (x, y) not in walls
+    }
+    frontier = list(outside)
+    for x, y in frontier:
+        for neighbour in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if (
+                0 <= neighbour[0] < length
+                and 0 <= neighbour[1] < width
+                and neighbour not in walls
+                and neighbour not in outside
+            ):
+                outside.add(neighbour)
+                frontier.append(neighbour)
+
+    if player not in outside:
+        walls |= outside
+
+    floor = [(x, y) for x in range(length) for y in range(width) if (x, y) not in walls]
+    min_x = min(x for x, _ in floor)
+    min_y = min(y for _, y in floor)
+    length = max(x for x, _ in floor) - min_x + 1
+    width = max(y for _, y in floor) - min_y + 1
+
+    obstacles = sorted(
+        (x - min_x, y - min_y)
+        for x, y in walls
+        if 0 <= x - min_x < length and 0 <= y - min_y < width
+    )
+    boxes = [(f"box{x - min_x}_{y - min_y}", x - min_x, y - min_y) for x, y in boxes]
+    targets = [(x - min_x, y - min_y) for x, y in targets]
+
+    return Map(length, width, player[0] - min_x, player[1] - min_y, boxes, targets, obstacles, test_name=name)
+
+
+def iter_xsb_levels(lines: Iterable[str], pack_name: str = 'level') -> Iterator[Map]:
+    '''
+    Yields the maps of the levels of a pack, read one line at a time. A level
+    is named by the "Title:" line following its board, else by the last
+    comment or text line before it, else by its number in the pack.
+    '''
+    rows = []
+    name = None
+    # The last level read, whose title may still follow: (rows, name, number)
+    pending = None
+    count = 0
+
+    def make_level(level_rows, level_name, number):
+        return parse_xsb(level_rows, level_name or f'{pack_name}_{number}')
+
+    for line in lines:
+        board_rows = _board_rows(line)
+        if board_rows is not None:
+            if not rows:
+                if pending is not None:
+                    yield make_level(*pending)
+                    pending = None
+                count += 1
+            rows.extend(board_rows)
+            continue
+
+        if rows:
+            pending = (rows, name, count)
+            rows = []
+            name = None
+
+        text = line.strip().lstrip(';').strip()
+        if not text:
+            continue
+
+        if text.lower().startswith('title:'):
+            if pending is not None:
+                pending = (pending[0], text[len('title:'):].strip(), pending[2])
+        else:
+            name = text
+
+    if pending is not None:
+        yield make_level(*pending)
+    if rows:
+        yield make_level(rows, name, count)
+
+
+def read_xsb(path: str) -> Iterator[Map]:
+    ''' Yields the maps of the levels of a pack file (.xsb, .sok, .txt)'''
+    pack_name = os.path.splitext(os.path.basename(path))[0]
+    with open(path, 'r') as file:
+        yield from iter_xsb_levels(file, pack_name)
+
+
+def to_xsb(state: Map) -> str:
+    '''
+    Returns the XSB rows of a map, surrounded by walls. Obstacles that don't
+    touch the floor are written as spaces, as they lie outside the level.
+    '''
+    level = state.level
+    grid = state.grid
+    player_cell = state.player_cell
+
+    def is_wall(x, y):
+        # Outside of the bordered map too
+        if x < -1 or y < -1 or x > state.length or y > state.width:
+            return True
+        return grid[level.index(x, y)] == OBSTACLE_SYMBOL
+
+    # The first row of the map is at the bottom, the border is included
+    rows = []
+    for x in reversed(range(-1, state.length + 1)):
+        row = []
+        for y in range(-1, state.width + 1):
+            cell = level.index(x, y)
+            value = grid[cell]
+
+            if value == OBSTACLE_SYMBOL:
+                touches_floor = any(
+                    not is_wall(x + dx, y + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                )
+                row.append(XSB_WALL if touches_floor else ' ')
+            elif cell == player_cell:
+                row.append(XSB_PLAYER_ON_TARGET if cell in level.target_set else XSB_PLAYER)
+            elif value == BOX_SYMBOL:
+                row.append(XSB_BOX_ON_TARGET if cell in level.target_set else XSB_BOX)
+            elif value == TARGET_SYMBOL:
+                row.append(XSB_TARGET)
+            else:
+                row.append(' ')
+
+        rows.append(''.join(row).rstrip())
+
+    return '\n'.join(rows)
+
+
+def write_xsb(maps: Iterable[Map], path: str) -> None:
+    ''' Writes the maps as a level pack, each one preceded by its name'''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, 'w') as file:
+        for state in maps:
+            file.write(f'; {state.test_name}\n\n{to_xsb(state)}\n\n')
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_path(path: str, cache_dir: Optional[str]) -> str:
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+
+    name = os.path.basename(path)
+    return os.path.join(cache_dir, f'{name}.v{CACHE_VERSION}.{_file_hash(path)[:20]}.npz')
+
+
+def _level_record(state: Map) -> tuple:
+    ''' Returns the arrays of a map saved in the cache'''
+    walls = np.zeros(state.length * state.width, dtype=bool)
+    for x, y in state.obstacles:
+        walls[x * state.width + y] = True
+
+    return (
+        state.test_name,
+        (state.length, state.width),
+        walls,
+        (state.player.x, state.player.y),
+        [(box.x, box.y) for box in state.boxes.values()],
+        list(state.targets),
+    )
+
+
+def _save_cache(records: List[tuple], cache_path: str) -> None:
+    ''' Saves the grids and entity arrays of the levels in a npz file'''
+    names, shapes, walls, players, boxes, targets = zip(*records) if records else ([],) * 6
+
+    def offsets(groups):
+        return np.concatenate(([0], np.cumsum([len(g) for g in groups], dtype=np.int64)))
+
+    def positions(groups):
+        return np.array([p for group in groups for p in group], dtype=np.int32).reshape(-1, 2)
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temporary_path = cache_path + '.tmp.npz'
+    np.savez_compressed(
+        temporary_path,
+        names=np.array(names, dtype=str),
+        shapes=np.array(shapes, dtype=np.int32).reshape(-1, 2),
+        walls=np.concatenate(walls) if walls else np.zeros(0, dtype=bool),
+        wall_offsets=offsets(walls),
+        players=np.array(players, dtype=np.int32).reshape(-1, 2),
+        boxes=positions(boxes),
+        box_offsets=offsets(boxes),
+        targets=positions(targets),
+        target_offsets=offsets(targets),
+    )
+    # Readers never see a partially written cache
+    os.replace(temporary_path, cache_path)
+
+
+def _load_cache(cache_path: str) -> Iterator[Map]:
+    ''' Yields the maps saved in a npz file'''
+    with np.load(cache_path, allow_pickle=False) as data:
+        names = data['names'].tolist()
+        shapes = data['shapes'].tolist()
+        walls = data['walls']
+        wall_offsets = data['wall_offsets'].tolist()
+        players = data['players'].tolist()
+        boxes = data['boxes'].tolist()
+        box_offsets = data['box_offsets'].tolist()
+        targets = data['targets'].tolist()
+        target_offsets = data['target_offsets'].tolist()
+
+    for i, (length, width) in enumerate(shapes):
+        cells = np.flatnonzero(walls[wall_offsets[i]:wall_offsets[i + 1]]).tolist()
+        obstacles = [divmod(cell, width) for cell in cells]
+        level_boxes = [(f"box{x}_{y}", x, y) for x, y in boxes[box_offsets[i]:box_offsets[i + 1]]]
+        level_targets = [(x, y) for x, y in targets[target_offsets[i]:target_offsets[i + 1]]]
+
+        player_x, player_y = players[i]
+        yield Map(length, width, player_x, player_y, level_boxes, level_targets, obstacles, test_name=names[i])
+
+
+def load_levels(path: str, cache_dir: Optional[str] = None, use_cache: bool = True) -> Iterator[Map]:
+    '''
+    Yields the maps of a level file: a yaml level or a XSB/SOK pack. The
+    levels of a pack are compiled to a npz file keyed on the hash of the pack,
+    in cache_dir (by default a __levelcache__ directory next to the pack), and
+    loaded from there on the next calls. The cache is written once the whole
+    pack was read.
+    '''
+    if path.endswith(YAML_EXTENSIONS):
+        yield Map.from_yaml(path)
+        return
+
+    if not use_cache:
+        yield from read_xsb(path)
+        return
+
+    cache_path = _cache_path(path, cache_dir)
+    if os.path.exists(cache_path):
+        yield from _load_cache(cache_path)
+        return
+
+    records = []
+    for state in read_xsb(path):
+        records.append(_level_record(state))
+        yield state
+
+    _save_cache(records, cache_path)
@@ -0,0 +1,43 @@
+import os
+
+import search_methods.heuristics as heuristics
+from search_methods.astar import AStar
+from search_methods.deadlocks import DeadlockPruning
+from search_methods.pushes import get_push_neighbours
+from search_methods.solver import Solver
+from search_methods.utils import get_neighbours_no_pulls
+from sokoban import State
+from sokoban.map import Map
+
+TESTS = os.path.dirname(__file__)
+
+
+def load(name: str) -> Map:
+    return Map.from_yaml(os.path.join(TESTS, f"{name}.yaml"))
+
+
+def test_states_give_back_their_map():
+    state = load("medium_map1")
+    for child in [state] + state.get_neighbours():
+        rebuilt = State.from_map(child).to_map(child.test_name)
+
+        assert rebuilt.key == child.key
+        assert rebuilt.grid == child.grid
+        assert rebuilt.positions_of_boxes.keys() == child.positions_of_boxes.keys()
+        assert rebuilt.test_name == "medium_map1"
+
+
+def test_astar_and_idastar_agree():
+    heuristic = heuristics.boxes_minimum_moves_combination
+    for name, state_generator in [
+        ("easy_map2", get_neighbours_no_pulls),
+        ("medium_map1", DeadlockPruning(get_push_neighbours)),
+    ]:
+        state = load(name)
+        base = Solver(heuristic, state_generator)
+        astar = AStar(base).solve(state)
+        idastar = AStar(base, iterative_deepening=True).solve(state)
+
+        assert astar.is_solved() and idastar.is_solved()
+        assert astar.optimal and idastar.optimal
+        assert astar.cost == idastar.cost
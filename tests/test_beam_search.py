@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+import random
+
+import numpy as np
+
+import search_methods.heuristics as heuristics
+from search_methods.batch import SolverConfig
+from search_methods.beam_search import BeamSearch, _decode, _encode
+from search_methods.portfolio import _run_member
+from search_methods.solver import Solver
+from search_methods.utils import get_neighbours_no_pulls
+from sokoban.map import Map
+
+LEVEL = os.path.join(os.path.dirname(__file__), "medium_map2.yaml")
+
+
+def test_encoding_keeps_the_map():
+    state = get_neighbours_no_pulls(Map.from_yaml(LEVEL))[0]
+    heuristics.boxes_minimum_moves_combination(state)
+
+    decoded = _decode(_encode(state))
+    assert decoded.hash == state.hash
+    assert list(decoded.boxes) == list(state.boxes)
+    assert decoded.test_name == state.test_name
+    assert decoded.last_moves == state.last_moves
+    assert decoded.heuristic_cache.keys() == state.heuristic_cache.keys()
+
+
+def solve(workers: int, selection: str):
+    random.seed(1)
+    np.random.seed(1)
+    base = Solver(heuristics.boxes_minimum_moves_combination, get_neighbours_no_pulls)
+    with BeamSearch(
+        base, max_iters=100, k=40, workers=workers, selection=selection
+    ) as solver:
+        return solver.solve(Map.from_yaml(LEVEL))
+
+
+def test_workers_match_the_serial_search():
+    for selection in ("softmax", "top_k"):
+        serial = solve(0, selection)
+        parallel = solve(2, selection)
+
+        assert serial.is_solved()
+        assert list(parallel.moves) == list(serial.moves)
+        assert parallel.expanded_states == serial.expanded_states
+        assert list(parallel.step(-1).boxes) == list(serial.step(-1).boxes)
+
+
+def test_jobs_stop_their_workers():
+    config = SolverConfig(
+        "beam",
+        BeamSearch,
+        heuristics.boxes_minimum_moves_combination,
+        get_neighbours_no_pulls,
+        max_iters=100,
+        k=40,
+        workers=2,
+    )
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    _run_member(config, Map.from_yaml(LEVEL), 1, sender)
+
+    status, solution, _, _ = receiver.recv()
+    assert status == "solved"
+    assert multiprocessing.active_children() == []
@@ -0,0 +1,41 @@
+from search_methods.cost_table import BoundedCostTable
+
+
+def test_lowest_update_compaction_after_eviction():
+    table = BoundedCostTable(max_entries=2, eviction="lowest_update")
+    table[1] = 5.0
+    table[1] = 10.0
+    table[1] = 5.0
+    table[2] = 7.0
+    # Evicts a key whose stale heap items are still in the heap
+    table[3] = 1.0
+    assert table.evictions == 1
+
+    # Enough stores to compact the heap
+    for i in range(200):
+        table[3] = float(i)
+
+    assert len(table) == 2
+    assert table.get(3) == 199.0
+
+
+def test_lowest_update_keeps_learned_costs():
+    table = BoundedCostTable(max_entries=2, eviction="lowest_update")
+    table[1] = 5.0
+    table[1] = 9.0
+    table[2] = 5.0
+    table[3] = 5.0
+
+    # The cost of 1 was updated, 2 was only stored
+    assert 1 in table and 2 not in table and 3 in table
+
+
+def test_lru_eviction():
+    table = BoundedCostTable(max_entries=2)
+    table[1] = 1.0
+    table[2] = 2.0
+    table.get(1)
+    table[3] = 3.0
+
+    assert 1 in table and 2 not in table
+    assert table.hits == 1 and table.evictions == 1
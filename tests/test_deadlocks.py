@@ -0,0 +1,68 @@
+from search_methods.deadlocks import DeadlockPatternCache, DeadlockPruning
+from sokoban.map import Map
+
+# Rooms of 5 rows (x, from the bottom) and 7 columns (y), inside the border
+
+
+def room(player: tuple, boxes: list[tuple], targets: list[tuple], obstacles=()) -> Map:
+    return Map(
+        5,
+        7,
+        *player,
+        [(f"box{x}_{y}", x, y) for x, y in boxes],
+        targets,
+        list(obstacles),
+    )
+
+
+def prune(parent: Map, child: Map) -> DeadlockPruning:
+    """Prune the child of a state, with a pattern cache of its own."""
+    pruning = DeadlockPruning(
+        lambda state: [child], freeze=True, pattern_cache=DeadlockPatternCache()
+    )
+    pruning.kept = pruning(parent)
+    return pruning
+
+
+def test_frozen_pair_on_a_wall_is_pruned():
+    # A box pushed down next to another one, both against the bottom wall
+    targets = [(0, 6), (4, 6)]
+    parent = room((2, 3), [(0, 2), (1, 3)], targets)
+    child = room((1, 3), [(0, 2), (0, 3)], targets)
+
+    pruning = prune(parent, child)
+    # The bottom row leads to a target, only the freeze rule applies
+    assert pruning.pruned_dead_squares == 0
+    assert pruning.pruned_freeze == 1
+    assert pruning.kept == []
+
+
+def test_frozen_pair_half_on_targets_is_pruned():
+    targets = [(0, 2), (4, 6)]
+    parent = room((2, 3), [(0, 2), (1, 3)], targets)
+    child = room((1, 3), [(0, 2), (0, 3)], targets)
+
+    assert prune(parent, child).pruned_freeze == 1
+
+
+def test_frozen_group_on_targets_is_kept():
+    targets = [(0, 2), (0, 3)]
+    parent = room((2, 3), [(0, 2), (1, 3)], targets)
+    child = room((1, 3), [(0, 2), (0, 3)], targets)
+
+    pruning = prune(parent, child)
+    assert pruning.pruned == 0
+    assert pruning.kept == [child]
+
+
+def test_box_blocked_by_a_movable_box_is_kept():
+    # The pushed box can't move up or down (an obstacle is below it), and
+    # is next to a box that still can
+    targets = [(4, 3), (4, 4)]
+    obstacles = [(1, 3)]
+    parent = room((2, 1), [(2, 2), (2, 4)], targets, obstacles)
+    child = room((2, 2), [(2, 3), (2, 4)], targets, obstacles)
+
+    pruning = prune(parent, child)
+    assert pruning.pruned == 0
+    assert pruning.kept == [child]
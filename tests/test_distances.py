@@ -0,0 +1,84 @@
+import numpy as np
+
+from search_methods.precompute import level_tables
+from search_methods.utils import (
+    WALL_COST,
+    compute_distance_fields,
+    compute_distance_matrix,
+    compute_distance_reachable_pushes,
+    compute_level_distance_fields,
+    compute_level_distances,
+    compute_level_reachable,
+    compute_reachable_positions,
+    compute_reachable_push_fields,
+)
+from sokoban.map import OBSTACLE_SYMBOL, Map
+
+# Longer than WALL_COST, so the far cells are as far as the unreachable ones
+CORRIDOR_LENGTH = 130
+
+
+def corridor() -> Map:
+    # The target at one end, the box and the player at the other
+    cells = ["X"] + ["_"] * (CORRIDOR_LENGTH - 3) + ["B", "P"]
+    return Map.from_str(" ".join(cells))
+
+
+def test_level_distance_fields_match_the_scalar_search():
+    state = corridor()
+    level = state.level
+    starts = [level.index(*target) for target in level.targets]
+
+    for restrict_pushes in (True, False):
+        scalar = compute_level_distances(level, starts, restrict_pushes)
+        fields = compute_level_distance_fields(level, starts, restrict_pushes)
+        assert fields.min(axis=0).tolist() == scalar
+        assert fields.max() == WALL_COST
+
+
+def test_distance_fields_match_the_scalar_search():
+    state = corridor()
+    starts = [state.level.index(0, 5), state.level.index(0, 120)]
+
+    for restrict_pushes in (True, False):
+        fields = compute_distance_fields(
+            state, starts, [OBSTACLE_SYMBOL], restrict_pushes
+        )
+        for start, field in zip(starts, fields):
+            scalar = compute_distance_matrix(
+                state, [start], [OBSTACLE_SYMBOL], restrict_pushes
+            )
+            assert field.tolist() == scalar
+
+
+def test_reachable_push_fields_match_the_scalar_search():
+    state = corridor()
+    box = state.level.index(0, CORRIDOR_LENGTH - 2)
+    reach = compute_reachable_positions(state)
+    # As the vectorized search does for the pushes of each box
+    reach[box] = 1
+
+    fields = compute_reachable_push_fields(state, [box], reach)
+    assert fields[0].tolist() == compute_distance_reachable_pushes(state, box, reach)
+
+
+def test_level_reachable_beyond_wall_cost():
+    state = corridor()
+    level = state.level
+    target = level.index(*level.targets[0])
+
+    reachable = compute_level_reachable(level, [target])
+    # The box can be pushed all the way to the target
+    assert reachable[level.index(0, CORRIDOR_LENGTH - 2)]
+    # Not the last cell, as the player can't get behind a box there
+    assert not reachable[level.index(0, CORRIDOR_LENGTH - 1)]
+    assert not np.any(reachable & np.frombuffer(level.walls, dtype=bool))
+
+
+def test_far_squares_are_not_dead():
+    state = corridor()
+    dead_squares = level_tables(state.level).dead_squares
+
+    # The box is more than WALL_COST pushes away from the target
+    assert not dead_squares[state.level.index(0, CORRIDOR_LENGTH - 2)]
+    assert dead_squares[state.level.index(0, CORRIDOR_LENGTH - 1)]
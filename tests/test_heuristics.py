@@ -0,0 +1,46 @@
+import os
+
+import search_methods.heuristics as heuristics
+from search_methods.pushes import get_push_neighbours
+from search_methods.utils import get_neighbours_no_pulls
+from sokoban.map import Map
+
+LEVEL = os.path.join(os.path.dirname(__file__), "hard_map1.yaml")
+
+
+def fresh_value(heuristic, state: Map) -> int:
+    state = state.copy()
+    state.heuristic_cache = {}
+    return heuristic(state)
+
+
+def check_walk(heuristic, state_generator, steps: int = 100) -> None:
+    """
+    Walk from the initial state, always taking the first child, checking that
+    the values reusing the parents' caches are the ones computed from scratch.
+    """
+    state = Map.from_yaml(LEVEL)
+    heuristic(state)
+    for _ in range(steps):
+        children = state_generator(state)
+        if not children:
+            break
+        for child in children:
+            assert heuristic(child) == fresh_value(heuristic, child)
+        state = children[0]
+
+
+def test_reachable_assignment_reused_after_player_moves():
+    stats = heuristics.reachable_assignments
+    hits = stats.hits
+
+    check_walk(heuristics.distance_to_target_reachable, get_neighbours_no_pulls)
+    assert stats.hits > hits
+
+
+def test_reachable_assignment_after_pushes():
+    check_walk(heuristics.distance_to_target_reachable, get_push_neighbours, 30)
+
+
+def test_assignment_updated_after_pushes():
+    check_walk(heuristics.boxes_minimum_moves_combination, get_push_neighbours, 30)
@@ -0,0 +1,65 @@
+import os
+import random
+
+import search_methods.heuristics as heuristics
+from search_methods.deadlocks import DeadlockPruning
+from search_methods.learned_values import LearnedValues
+from search_methods.lrtastar import LRTAstar
+from search_methods.memoization import memoized
+from search_methods.solver import Solver
+from search_methods.utils import get_neighbours, get_neighbours_no_pulls
+from sokoban.map import Map
+
+LEVEL = os.path.join(os.path.dirname(__file__), "easy_map1.yaml")
+
+
+def test_tables_are_kept_apart_by_search(tmp_path):
+    level = Map.from_yaml(LEVEL).level
+    heuristic = heuristics.boxes_minimum_moves_combination
+
+    def path(heuristic, state_generator):
+        return LearnedValues.for_level(tmp_path, level, heuristic, state_generator).path
+
+    base = path(heuristic, get_neighbours_no_pulls)
+    assert path(memoized(heuristic), get_neighbours_no_pulls) == base
+    assert path(heuristics.manhattan_min_distances, get_neighbours_no_pulls) != base
+    assert path(heuristic, get_neighbours) != base
+
+
+def test_instance_generators_keep_their_table(tmp_path):
+    level = Map.from_yaml(LEVEL).level
+    heuristic = heuristics.boxes_minimum_moves_combination
+
+    def path(state_generator):
+        return LearnedValues.for_level(tmp_path, level, heuristic, state_generator).path
+
+    # Built again in each run, at another address
+    base = path(DeadlockPruning(get_neighbours_no_pulls, freeze=True))
+    assert path(DeadlockPruning(get_neighbours_no_pulls, freeze=True)) == base
+    assert path(DeadlockPruning(get_neighbours_no_pulls)) != base
+    assert path(DeadlockPruning(get_neighbours, freeze=True)) != base
+    assert path(get_neighbours_no_pulls) != base
+
+
+def test_saved_values_and_best_trial(tmp_path):
+    state = Map.from_yaml(LEVEL)
+    base = Solver(heuristics.boxes_minimum_moves_combination, get_neighbours_no_pulls)
+
+    random.seed(0)
+    solver = LRTAstar(
+        base,
+        max_iters=2000,
+        backoff_probability_factor=0.98,
+        learned_values=str(tmp_path),
+        max_trials=5,
+    )
+    solution = solver.solve(state)
+
+    assert solution.is_solved()
+    assert 1 <= solution.trial <= solution.trials <= 5
+    assert len(os.listdir(tmp_path)) == 1
+
+    values = LearnedValues.for_level(
+        tmp_path, state.level, base.heuristic, base.state_generator
+    )
+    assert len(values) == len(solver.cost_estimations)
@@ -0,0 +1,61 @@
+import os
+import random
+
+import search_methods.heuristics as heuristics
+from search_methods.lrtastar import LRTAstar
+from search_methods.solver import Solver
+from search_methods.utils import get_neighbours_no_pulls
+from sokoban.map import Map
+
+TESTS = os.path.dirname(__file__)
+
+
+def load(name: str) -> Map:
+    return Map.from_yaml(os.path.join(TESTS, f"{name}.yaml"))
+
+
+def test_unsolved_path_ends_on_the_lowest_heuristic():
+    heuristic = heuristics.boxes_minimum_moves_combination
+    expanded = []
+
+    def state_generator(state: Map) -> list[Map]:
+        expanded.append(heuristic(state))
+        return get_neighbours_no_pulls(state)
+
+    class RecordedLRTAstar(LRTAstar):
+        def _trial(self, initial_state: Map):
+            # The partial solution is the one of the last trial
+            expanded.clear()
+            return super()._trial(initial_state)
+
+    base = Solver(heuristic, state_generator)
+    for seed in range(6):
+        random.seed(seed)
+        solution = RecordedLRTAstar(
+            base, max_iters=100, backoff_probability_factor=0.9, max_trials=3
+        ).solve(load("medium_map2"))
+
+        assert not solution.is_solved()
+        # Not above any state the last trial went through (even the ones its
+        # learned costs made look farther)
+        assert heuristic(solution.step(-1)) <= min(expanded)
+
+
+def test_profile_covers_every_trial():
+    calls = 0
+
+    def counted(state: Map) -> int:
+        nonlocal calls
+        calls += 1
+        return heuristics.boxes_minimum_moves_combination(state)
+
+    base = Solver(counted, get_neighbours_no_pulls, profile=True)
+
+    random.seed(0)
+    solution = LRTAstar(
+        base, max_iters=2000, backoff_probability_factor=0.98, max_trials=5
+    ).solve(load("easy_map1"))
+
+    assert solution.is_solved()
+    assert solution.trials > 1
+    assert solution.profile.sections["heuristic"].count == calls
@@ -0,0 +1,81 @@
+import asyncio
+import os
+
+from search_methods.service import SolverService, solve_remote
+
+TESTS = os.path.dirname(__file__)
+
+
+def read_level(name: str) -> str:
+    with open(os.path.join(TESTS, f"{name}.yaml")) as file:
+        return file.read()
+
+
+async def run_requests(requests: list[dict], workers: int = 1) -> dict:
+    """Send requests to a service on localhost, returning the events by id."""
+    events = {}
+    service = SolverService(port=0, workers=workers, progress_interval=0.05)
+    async with service:
+        async for event in solve_remote(requests, port=service.port):
+            events.setdefault(event["id"], []).append(event)
+    return events
+
+
+def kinds(events: list[dict]) -> list[str]:
+    """The kinds of the events, without the progress reports."""
+    return [event["event"] for event in events if event["event"] != "progress"]
+
+
+def test_service_events():
+    events = asyncio.run(
+        run_requests(
+            [
+                {"id": "solved", "level": read_level("easy_map1")},
+                {"id": "unknown", "level": read_level("easy_map1"), "solver": "nope"},
+                {
+                    "id": "budget",
+                    "level": read_level("super_hard_map1"),
+                    "solver": "lrtastar",
+                    "budget": {"max_states": 100},
+                },
+                {"id": "invalid", "level": "not a level", "format": "yaml"},
+            ]
+        )
+    )
+
+    solved = events["solved"]
+    assert kinds(solved) == ["queued", "started", "result"]
+    result = solved[-1]
+    assert result["status"] == "solved"
+    assert result["move_count"] == len(result["moves"]) > 0
+
+    assert kinds(events["unknown"]) == ["error"]
+    assert "nope" in events["unknown"][0]["error"]
+    assert kinds(events["invalid"]) == ["error"]
+
+    budget = events["budget"]
+    assert kinds(budget) == ["queued", "started", "result"]
+    assert budget[-1]["status"] == "unsolved"
+    assert budget[-1]["budget_exhausted"] == "states"
+
+
+def test_levels_stay_warm():
+    request = {"level": read_level("medium_map1"), "name": "medium_map1"}
+    events = asyncio.run(run_requests([{"id": 1, **request}, {"id": 2, **request}]))
+
+    assert events[1][-1]["warm"] is False
+    assert events[2][-1]["warm"] is True
+
+
+def test_levels_stay_warm_on_their_worker():
+    names = ["easy_map1", "easy_map2", "medium_map1", "medium_map2"]
+    requests = [
+        {"id": f"{name}-{i}", "level": read_level(name), "name": name}
+        for i in range(2)
+        for name in names
+    ]
+    events = asyncio.run(run_requests(requests, workers=2))
+
+    for name in names:
+        assert events[f"{name}-0"][-1]["warm"] is False
+        assert events[f"{name}-1"][-1]["warm"] is True